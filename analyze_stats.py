@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Compare the results of evaluations: the stats files written by test_submission.py.
+
+The files are read one game at a time into NumPy arrays of the scores, steps and wins of the episodes,
+so files of tens of thousands of games load in seconds without holding their commands in memory.
+Comparing a new file to a base file gives the change of the score and of the steps of each game that both played,
+Welch's t-test over the episodes of each game, the distributions of the steps per won episode
+and the games that got the most worse.
+
+Example:
+    python analyze_stats.py stats-before.json stats-after.json --top 20
+"""
+import argparse
+import json
+import math
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+_chunk_size = 1 << 20
+
+_percentiles = (10, 25, 50, 75, 90)
+
+_max_fraction_iterations = 300
+
+
+class _StreamReader(object):
+    """
+    Decodes the values of a JSON file one at a time, reading more of the file only when it needs to.
+    """
+
+    def __init__(self, f, chunk_size: int = _chunk_size):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        :return: The next character that isn't whitespace, without consuming it. Empty at the end of the file.
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._read_more():
+                return self._buffer[self._pos:self._pos + 1]
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError("Expected {!r} but got {!r}.".format(char, self.peek()))
+        self._pos += 1
+
+    def skip(self, char: str) -> bool:
+        """
+        :return: `True` if the next character was the character and it was consumed.
+        """
+        if self.peek() == char:
+            self._pos += 1
+            return True
+        return False
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._read_more():
+                    raise
+                continue
+            # A number at the end of the buffer might go on in the rest of the file.
+            if end == len(self._buffer) and self._read_more():
+                continue
+            self._pos = end
+            return value
+
+
+def iter_games(path: str, chunk_size: int = _chunk_size) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    :return: The name and the results of each game in a stats file, read one at a time.
+    """
+    with open(path) as f:
+        reader = _StreamReader(f, chunk_size)
+        reader.expect('{')
+        if reader.skip('}'):
+            return
+        while True:
+            key = reader.decode()
+            reader.expect(':')
+            if key == 'games':
+                reader.expect('{')
+                if not reader.skip('}'):
+                    while True:
+                        name = reader.decode()
+                        reader.expect(':')
+                        yield name, reader.decode()
+                        if reader.skip('}'):
+                            break
+                        reader.expect(',')
+            else:
+                reader.decode()
+            if reader.skip('}'):
+                return
+            reader.expect(',')
+
+
+class RunTable(object):
+    """
+    The results of the episodes of the games of an evaluation.
+    Rows are games and columns are episodes, `nan` where a game has fewer episodes.
+    """
+
+    def __init__(self, names: List[str], scores: np.ndarray, steps: np.ndarray, wins: np.ndarray,
+                 max_scores: np.ndarray):
+        self.names = names
+        self.scores = scores
+        self.steps = steps
+        self.wins = wins
+        self.max_scores = max_scores
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.names)
+
+
+def load_runs(path: str, chunk_size: int = _chunk_size) -> RunTable:
+    num_episodes = 1
+    capacity = 1024
+    scores = np.full((capacity, num_episodes), np.nan)
+    steps = np.full((capacity, num_episodes), np.nan)
+    wins = np.full((capacity, num_episodes), np.nan)
+    max_scores = np.full(capacity, np.nan)
+    names = []
+    for name, game_stats in iter_games(path, chunk_size):
+        runs = game_stats["runs"]
+        i = len(names)
+        if i == capacity or len(runs) > num_episodes:
+            capacity = capacity * 2 if i == capacity else capacity
+            num_episodes = max(num_episodes, len(runs))
+            grown = []
+            for array in (scores, steps, wins):
+                bigger = np.full((capacity, num_episodes), np.nan)
+                bigger[:array.shape[0], :array.shape[1]] = array
+                grown.append(bigger)
+            scores, steps, wins = grown
+            bigger = np.full(capacity, np.nan)
+            bigger[:len(max_scores)] = max_scores
+            max_scores = bigger
+        names.append(name)
+        scores[i, :len(runs)] = [run["score"] for run in runs]
+        steps[i, :len(runs)] = [run["steps"] for run in runs]
+        wins[i, :len(runs)] = [run["has_won"] for run in runs]
+        max_scores[i] = game_stats.get("max_scores", np.nan)
+    n = len(names)
+    return RunTable(names, scores[:n], steps[:n], wins[:n], max_scores[:n])
+
+
+def _lgamma(x: np.ndarray) -> np.ndarray:
+    return np.vectorize(math.lgamma, otypes=[float])(x)
+
+
+def _beta_fraction(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    The continued fraction of the incomplete beta function, evaluated with Lentz's method.
+    """
+    tiny = 1e-300
+    qab = a + b
+    qap = a + 1
+    qam = a - 1
+    c = np.ones_like(x)
+    d = 1 - qab * x / qap
+    d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d
+    for m in range(1, _max_fraction_iterations + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1 + aa * d
+        d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+        c = 1 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        h = h * d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1 + aa * d
+        d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+        c = 1 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        delta = d * c
+        h = h * delta
+        if np.all(np.abs(delta - 1) < 1e-12):
+            break
+    return h
+
+
+def _incomplete_beta(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    :return: The regularized incomplete beta function for arrays of the same shape, with 0 <= x <= 1.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        front = np.exp(_lgamma(a + b) - _lgamma(a) - _lgamma(b) + a * np.log(x) + b * np.log1p(-x))
+        front = np.nan_to_num(front)
+        direct = x < (a + 1) / (a + b + 2)
+        # Each form converges quickly on its side of the mean.
+        result = np.where(direct,
+                          front * _beta_fraction(a, b, x) / a,
+                          1 - front * _beta_fraction(b, a, 1 - x) / b)
+    return np.clip(result, 0, 1)
+
+
+def welch_t_test(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Welch's t-test of each row of `b` against the same row of `a`, ignoring `nan`s.
+
+    :return: The t statistics, positive when `b` is higher, and the two-sided p-values.
+        Rows without variance have a p-value of 1 if their means are equal and 0 otherwise.
+        Rows with fewer than 2 values in either array have `nan`s.
+    """
+    n_a = np.sum(~np.isnan(a), axis=1).astype(float)
+    n_b = np.sum(~np.isnan(b), axis=1).astype(float)
+    valid = (n_a >= 2) & (n_b >= 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_a = np.nansum(a, axis=1) / n_a
+        mean_b = np.nansum(b, axis=1) / n_b
+        var_a = np.nansum((a - mean_a[:, None]) ** 2, axis=1) / (n_a - 1) / n_a
+        var_b = np.nansum((b - mean_b[:, None]) ** 2, axis=1) / (n_b - 1) / n_b
+        se2 = var_a + var_b
+        t = (mean_b - mean_a) / np.sqrt(se2)
+        df = se2 ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    p = np.full(len(t), np.nan)
+    constant = valid & (se2 == 0)
+    same = mean_a[constant] == mean_b[constant]
+    p[constant] = np.where(same, 1.0, 0.0)
+    t[constant] = np.where(same, 0.0, np.copysign(np.inf, mean_b[constant] - mean_a[constant]))
+    tested = valid & (se2 > 0)
+    if np.any(tested):
+        p[tested] = _incomplete_beta(df[tested] / 2, np.full(np.sum(tested), 0.5),
+                                     df[tested] / (df[tested] + t[tested] ** 2))
+    t[~valid] = np.nan
+    return t, p
+
+
+def _distribution(values: np.ndarray) -> Optional[Dict[str, float]]:
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    result = {'p{}'.format(q): float(v) for q, v in zip(_percentiles, np.percentile(values, _percentiles))}
+    result['mean'] = float(np.mean(values))
+    return result
+
+
+def _won_steps(table: RunTable) -> np.ndarray:
+    """
+    :return: The steps of the won episodes.
+    """
+    return table.steps[table.wins == 1]
+
+
+def summarize(table: RunTable) -> Dict[str, Any]:
+    """
+    :return: The totals of an evaluation and the distribution of the steps per won episode.
+    """
+    return dict(
+        games=len(table),
+        episodes=int(np.sum(~np.isnan(table.scores))),
+        score=float(np.nansum(table.scores)),
+        max_score=float(np.nansum(table.max_scores * np.sum(~np.isnan(table.scores), axis=1))),
+        steps=float(np.nansum(table.steps)),
+        wins=int(np.nansum(table.wins)),
+        won_steps=_distribution(_won_steps(table)),
+    )
+
+
+def compare(base: RunTable, new: RunTable, alpha: float = 0.05, top: int = 10) -> Dict[str, Any]:
+    """
+    Compare the games that both evaluations played.
+
+    :param alpha: The significance level of the t-tests.
+    :param top: The number of regressions to list.
+    :return: The summaries of both evaluations on the common games, the number of games that are significantly better
+        or worse, the distribution of the change of the mean score and steps of the games and the worst regressions:
+        the games whose mean score dropped the most, then whose mean steps rose the most.
+    """
+    common = [name for name in base.names if name in new.index]
+    base_rows = np.array([base.index[name] for name in common], dtype=int)
+    new_rows = np.array([new.index[name] for name in common], dtype=int)
+
+    def rows(table, indices):
+        return RunTable(common, table.scores[indices], table.steps[indices], table.wins[indices],
+                        table.max_scores[indices])
+
+    base_common = rows(base, base_rows)
+    new_common = rows(new, new_rows)
+    t, p = welch_t_test(base_common.scores, new_common.scores)
+    with np.errstate(invalid='ignore'):
+        score_delta = np.nanmean(new_common.scores, axis=1) - np.nanmean(base_common.scores, axis=1)
+        steps_delta = np.nanmean(new_common.steps, axis=1) - np.nanmean(base_common.steps, axis=1)
+    significant = p < alpha
+
+    # Sort by the drop of the score first, then by the rise of the steps.
+    order = np.lexsort((-steps_delta, score_delta))
+    regressions = []
+    for i in order:
+        if len(regressions) >= top or not (score_delta[i] < 0 or (score_delta[i] == 0 and steps_delta[i] > 0)):
+            break
+        regressions.append(dict(
+            game=common[i],
+            base_score=float(np.nanmean(base_common.scores[i])),
+            new_score=float(np.nanmean(new_common.scores[i])),
+            score_delta=float(score_delta[i]),
+            steps_delta=float(steps_delta[i]),
+            p_value=None if np.isnan(p[i]) else float(p[i]),
+        ))
+
+    return dict(
+        games=len(common),
+        only_in_base=len(base) - len(common),
+        only_in_new=len(new) - len(common),
+        base=summarize(base_common),
+        new=summarize(new_common),
+        significantly_better=int(np.sum(significant & (t > 0))),
+        significantly_worse=int(np.sum(significant & (t < 0))),
+        score_delta=_distribution(score_delta),
+        steps_delta=_distribution(steps_delta),
+        regressions=regressions,
+    )
+
+
+def _format_distribution(distribution: Optional[Dict[str, float]]) -> str:
+    if distribution is None:
+        return "-"
+    return "mean {:.2f}, ".format(distribution['mean']) + ", ".join(
+        "p{} {:.1f}".format(q, distribution['p{}'.format(q)]) for q in _percentiles)
+
+
+def _format_summary(label: str, summary: Dict[str, Any]) -> List[str]:
+    return [
+        "{}: {} games, {} episodes, score {:.0f} / {:.0f}, {:.0f} steps, {} wins".format(
+            label, summary['games'], summary['episodes'], summary['score'], summary['max_score'],
+            summary['steps'], summary['wins']),
+        "  steps per won episode: {}".format(_format_distribution(summary['won_steps'])),
+    ]
+
+
+def format_report(comparison: Dict[str, Any], alpha: float = 0.05) -> str:
+    lines = ["{} common games ({} only in the base, {} only in the new results).".format(
+        comparison['games'], comparison['only_in_base'], comparison['only_in_new'])]
+    lines += _format_summary("Base", comparison['base'])
+    lines += _format_summary("New ", comparison['new'])
+    lines.append("Significantly better games: {}, worse: {} (Welch's t-test on the scores, p < {}).".format(
+        comparison['significantly_better'], comparison['significantly_worse'], alpha))
+    lines.append("Change of the mean score of the games: {}".format(
+        _format_distribution(comparison['score_delta'])))
+    lines.append("Change of the mean steps of the games: {}".format(
+        _format_distribution(comparison['steps_delta'])))
+    if comparison['regressions']:
+        lines.append("Worst regressions:")
+        for row in comparison['regressions']:
+            lines.append("  {:+.2f} score ({:.2f} -> {:.2f}), {:+.1f} steps, p={}\t{}".format(
+                row['score_delta'], row['base_score'], row['new_score'], row['steps_delta'],
+                "-" if row['p_value'] is None else "{:.3g}".format(row['p_value']), row['game']))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the results of evaluations.")
+    parser.add_argument("base", help="The stats file to compare to.")
+    parser.add_argument("new", nargs='*', help="The stats files to compare to the base.")
+    parser.add_argument("--alpha", type=float, default=0.05, help="The significance level of the t-tests.")
+    parser.add_argument("--top", type=int, default=10, help="The number of worst regressions to show.")
+    parser.add_argument("--output", help="Write the comparisons as JSON to this file.")
+    args = parser.parse_args()
+
+    base = load_runs(args.base)
+    if not args.new:
+        summary = summarize(base)
+        print("\n".join(_format_summary(args.base, summary)))
+        results = dict(summary=summary)
+    else:
+        results = {}
+        for path in args.new:
+            comparison = compare(base, load_runs(path), args.alpha, args.top)
+            print("== {} vs {}".format(path, args.base))
+            print(format_report(comparison, args.alpha))
+            results[path] = comparison
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Shortest paths on the discovered maps of all of the games of a batch, computed together.
+
+Each map is kept as a list of weighted edges: one per known connection, costing one more command
+when there is a closed door to open first.
+The first time a path is asked for after maps changed, the distances between all of the pairs of rooms
+of all of the changed maps are found with one frontier expansion over the edges of all of those maps at once with NumPy,
+so the cost per game stays flat as the number of games grows instead of running a search per game and target.
+Distances and paths are then answered from the cached distances until the map of a game changes again.
+"""
+import itertools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from room import Room
+
+_unreachable = np.iinfo(np.int32).max // 2
+"""
+The distance to rooms that can't be reached. Small enough that adding a step to it doesn't overflow.
+"""
+
+
+class _GameMap(object):
+    def __init__(self, rooms: Dict[str, Room]):
+        self.names = list(rooms)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.sources: List[int] = []
+        self.destinations: List[int] = []
+        self.costs: List[int] = []
+        self.directions: List[str] = []
+        """
+        The source room, the destination room, the cost and the direction of each known connection.
+        """
+        for source, room in enumerate(rooms.values()):
+            for direction, neighbour in room.directions.items():
+                if neighbour is not None:
+                    destination = self.index.get(neighbour.name)
+                    if destination is not None:
+                        self.sources.append(source)
+                        self.destinations.append(destination)
+                        self.costs.append(room.step_cost(direction))
+                        self.directions.append(direction)
+        self.distances: Optional[np.ndarray] = None
+        """
+        The distance to each room (rows) from each room (columns).
+        """
+        self._out_edges: Optional[List[List[Tuple[int, int, str]]]] = None
+
+    @property
+    def out_edges(self) -> List[List[Tuple[int, int, str]]]:
+        """
+        :return: The destination, the cost and the direction of the connections from each room.
+        """
+        if self._out_edges is None:
+            self._out_edges = [[] for _ in self.names]
+            for source, destination, cost, direction in zip(self.sources, self.destinations, self.costs,
+                                                            self.directions):
+                self._out_edges[source].append((destination, cost, direction))
+        return self._out_edges
+
+    def distance(self, from_name: str, to_name: str) -> Optional[int]:
+        if from_name not in self.index or to_name not in self.index:
+            return None
+        result = int(self.distances[self.index[to_name], self.index[from_name]])
+        return None if result >= _unreachable else result
+
+
+def all_distances(game_maps: Sequence[_GameMap]) -> None:
+    """
+    Set the distances between all of the rooms of each map, for all of the maps at once.
+    """
+    if len(game_maps) == 0:
+        return
+    num_rooms = max(max(len(game_map.names) for game_map in game_maps), 1)
+    # distances[g, t, s] is the distance to t from s in the map g.
+    distances = np.full((len(game_maps), num_rooms, num_rooms), _unreachable, dtype=np.int32)
+    sizes = np.array([len(game_map.names) for game_map in game_maps])
+    real_rooms = np.arange(num_rooms)[None, :] < sizes[:, None]
+    game_indices, room_indices = np.nonzero(real_rooms)
+    distances[game_indices, room_indices, room_indices] = 0
+
+    edge_games = np.repeat(np.arange(len(game_maps)), [len(game_map.sources) for game_map in game_maps])
+    edge_sources = np.fromiter(itertools.chain.from_iterable(m.sources for m in game_maps), np.intp, len(edge_games))
+    edge_destinations = np.fromiter(itertools.chain.from_iterable(m.destinations for m in game_maps), np.intp,
+                                    len(edge_games))
+    edge_costs = np.fromiter(itertools.chain.from_iterable(m.costs for m in game_maps), np.int32, len(edge_games))
+    # Group the edges by destination to take the minimum over the edges that reach the same room.
+    order = np.lexsort((edge_destinations, edge_games))
+    edge_games, edge_sources = edge_games[order], edge_sources[order]
+    edge_destinations, edge_costs = edge_destinations[order], edge_costs[order]
+
+    # The rooms whose distances from some room got shorter, only their edges can make other distances shorter.
+    frontier = real_rooms
+    while len(edge_games) > 0:
+        active = frontier[edge_games, edge_sources]
+        if not np.any(active):
+            break
+        games = edge_games[active]
+        destinations = edge_destinations[active]
+        candidates = distances[games, edge_sources[active]] + edge_costs[active][:, None]
+        starts = np.flatnonzero(np.r_[True, (games[1:] != games[:-1]) | (destinations[1:] != destinations[:-1])])
+        best = np.minimum.reduceat(candidates, starts, axis=0)
+        games, destinations = games[starts], destinations[starts]
+        current = distances[games, destinations]
+        improved = best < current
+        distances[games, destinations] = np.minimum(current, best)
+        frontier = np.zeros_like(frontier)
+        frontier[games, destinations] = np.any(improved, axis=1)
+
+    for g, game_map in enumerate(game_maps):
+        n = len(game_map.names)
+        game_map.distances = distances[g, :n, :n].copy()
+
+
+class BatchedPaths(object):
+    """
+    The shortest paths on the maps of the games of a batch.
+    The maps that changed are computed together the next time a distance or a path is asked for.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[int, Dict[str, Room]] = {}
+        self._maps: Dict[int, _GameMap] = {}
+        self._stale = set()
+
+    def invalidate(self, game_index: int, rooms: Optional[Dict[str, Room]] = None) -> None:
+        """
+        Note that the map of a game changed.
+
+        :param rooms: The rooms of the game if they are not the same object as before, e.g. for a new episode.
+            `None` to keep the rooms that were given before.
+        """
+        if rooms is not None:
+            self._rooms[game_index] = rooms
+        self._maps.pop(game_index, None)
+        self._stale.add(game_index)
+
+    def forget(self, game_index: int) -> None:
+        self._rooms.pop(game_index, None)
+        self._maps.pop(game_index, None)
+        self._stale.discard(game_index)
+
+    def refresh(self) -> None:
+        """
+        Compute the paths of all of the maps that changed.
+        """
+        game_indices = [game_index for game_index in self._stale if game_index in self._rooms]
+        game_maps = [_GameMap(self._rooms[game_index]) for game_index in game_indices]
+        all_distances(game_maps)
+        self._maps.update(zip(game_indices, game_maps))
+        self._stale.clear()
+
+    def _get_map(self, game_index: int) -> Optional[_GameMap]:
+        if game_index in self._stale:
+            self.refresh()
+        return self._maps.get(game_index)
+
+    def distance(self, game_index: int, from_name: str, to_name: str) -> Optional[int]:
+        """
+        :return: The fewest commands to go from a room to another one, `None` if no path is known.
+        """
+        game_map = self._get_map(game_index)
+        return game_map.distance(from_name, to_name) if game_map is not None else None
+
+    def frozen_distance(self, game_index: int) -> Callable[[str, str], Optional[int]]:
+        """
+        :return: The `distance` function of a game on its map as it is now.
+            It keeps answering for that map when the map changes, without copying its distances.
+        """
+        game_map = self._get_map(game_index)
+        return game_map.distance if game_map is not None else lambda from_name, to_name: None
+
+    def path(self, game_index: int, from_name: str, to_name: str) -> Optional[List[str]]:
+        """
+        :return: The directions of a path with the fewest commands from a room to another one,
+            `None` if no path is known.
+        """
+        game_map = self._get_map(game_index)
+        if game_map is None or from_name not in game_map.index or to_name not in game_map.index:
+            return None
+        distances = game_map.distances
+        target = game_map.index[to_name]
+        current = game_map.index[from_name]
+        if distances[target, current] >= _unreachable:
+            return None
+        result = []
+        while current != target:
+            for neighbour, cost, direction in game_map.out_edges[current]:
+                if cost + distances[target, neighbour] == distances[target, current]:
+                    result.append(direction)
+                    current = neighbour
+                    break
+        return result
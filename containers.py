@@ -0,0 +1,191 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+_container_names = [
+    "cupboard",
+    "chest",
+    "fridge",
+    "refrigerator",
+    "toolbox",
+    "trunk",
+]
+"""
+Containers that have to be opened to see inside, even when the description doesn't say that they are closed.
+"""
+
+_never_holds_ingredients = {
+    "oven",
+}
+"""
+Containers that are not worth opening to find ingredients.
+"""
+
+# Names and lists of items have bounded lengths like the patterns of custom_agent.py, see the comment there.
+_closed_container_pattern = re.compile(r'\bclosed (?P<container>[a-z][a-z-]{0,40})(?![a-z-])')
+_opened_container_pattern = re.compile(r'\bopened (?P<container>[a-z][a-z-]{0,40})(?![a-z-])')
+_door_pattern = re.compile(r'\b(?:closed|opened) (?:(?!and )[a-z][a-z-]{0,40} ){1,3}door\b')
+"""
+Closed and opened doors, with names of several words, e.g. "closed sliding patio door", that are not containers.
+"""
+_you_open_container_pattern = re.compile(
+    r'You open the (?P<container>[a-z][a-z -]{0,40}?)(?:, revealing (?P<contents>[^.\n]{1,500}))?\.')
+_contains_pattern = re.compile(r'The (?P<container>[a-z][a-z -]{0,40}?) contains (?P<contents>[^.\n]{1,500})\.')
+_empty_pattern = re.compile(r'The (?P<container>[a-z][a-z -]{0,40}?) is empty')
+_supporter_pattern = re.compile(
+    r'On the (?P<container>[a-z][a-z -]{0,40}?) (?:you see|you can see|you make out|you can make out|is|are) '
+    r'(?P<contents>[^.\n]{1,500})\.')
+_take_from_pattern = re.compile(
+    r'You take the (?P<item>[^,.\n]{1,60}?) from the (?P<container>[a-z][a-z -]{0,40}?)\.')
+_container_name_patterns = [(name, re.compile(r'\b{}\b'.format(re.escape(name)))) for name in _container_names]
+
+
+def _parse_items(text: str) -> Set[str]:
+    """
+    :param text: A list of items, e.g. "a red onion, some salt and a carrot".
+    :return: The names of the items.
+    """
+    result = set()
+    for item in re.split(r', and |, | and ', text):
+        item = item.strip()
+        for prefix in ("a ", "an ", "some ", "the "):
+            if item.startswith(prefix):
+                item = item[len(prefix):]
+                break
+        if item:
+            result.add(item)
+    return result
+
+
+class Container(object):
+    def __init__(self, name: str, is_supporter: bool = False):
+        self.name = name
+        self.is_supporter = is_supporter
+        """
+        Items on supporters, e.g. counters and shelves, can be seen without opening anything.
+        """
+        self.is_open: Optional[bool] = True if is_supporter else None
+        """
+        `None` if it's not known.
+        """
+        self.contents: Optional[Set[str]] = None
+        """
+        What is inside now, `None` if it's not known.
+        """
+        self.seen_contents: Set[str] = set()
+        """
+        Everything that was ever seen inside, in any episode.
+        """
+        self.ever_seen_inside = False
+
+    def set_contents(self, contents: Iterable[str]) -> None:
+        self.contents = set(contents)
+        self.seen_contents.update(self.contents)
+        self.ever_seen_inside = True
+
+    def __repr__(self):
+        return f'name={self.name}, is_open={self.is_open}, contents={self.contents}'
+
+    __str__ = __repr__
+
+
+class ContainerTracker(object):
+    """
+    Tracks the containers in each room, whether they are open and what they hold.
+    The contents seen in earlier episodes only order the containers to open:
+    what the agent saw may have been read wrong or only in part, so it never rules a container or a room out.
+    """
+
+    def __init__(self):
+        self._rooms: Dict[str, Dict[str, Container]] = {}
+
+    def start_episode(self) -> None:
+        """
+        Containers are back to their initial state in a new episode.
+        """
+        for containers in self._rooms.values():
+            for container in containers.values():
+                if not container.is_supporter:
+                    container.is_open = None
+                container.contents = None
+
+    def get(self, room_name: str, container_name: str) -> Optional[Container]:
+        return self._rooms.get(room_name, {}).get(container_name)
+
+    def containers(self, room_name: str) -> List[Container]:
+        return list(self._rooms.get(room_name, {}).values())
+
+    def _get_or_add(self, room_name: str, container_name: str, is_supporter: bool = False) -> Container:
+        containers = self._rooms.setdefault(room_name, {})
+        result = containers.get(container_name)
+        if result is None:
+            result = Container(container_name, is_supporter)
+            containers[container_name] = result
+        return result
+
+    def update(self, room_name: str, ob: str) -> None:
+        """
+        Update the containers in the room from an observation made in it.
+        """
+        # The patterns that start with a word boundary scan the whole observation, so they only run on the
+        # observations that have their words.
+        for container_name, pattern in _container_name_patterns:
+            if container_name in ob and pattern.search(ob):
+                self._get_or_add(room_name, container_name)
+        if "closed " in ob or "opened " in ob:
+            without_doors = _door_pattern.sub('', ob)
+            for m in _closed_container_pattern.finditer(without_doors):
+                self._get_or_add(room_name, m.group('container')).is_open = False
+            for m in _opened_container_pattern.finditer(without_doors):
+                self._get_or_add(room_name, m.group('container')).is_open = True
+        for m in _you_open_container_pattern.finditer(ob):
+            container = self._get_or_add(room_name, m.group('container'))
+            container.is_open = True
+            contents = m.group('contents')
+            container.set_contents(_parse_items(contents) if contents else ())
+        for m in _contains_pattern.finditer(ob):
+            container = self._get_or_add(room_name, m.group('container'))
+            container.is_open = True
+            container.set_contents(_parse_items(m.group('contents')))
+        for m in _empty_pattern.finditer(ob):
+            container = self._get_or_add(room_name, m.group('container'))
+            container.is_open = True
+            container.set_contents(())
+        for m in _supporter_pattern.finditer(ob):
+            container = self._get_or_add(room_name, m.group('container'), is_supporter=True)
+            container.set_contents(_parse_items(m.group('contents')))
+        for m in _take_from_pattern.finditer(ob):
+            container = self.get(room_name, m.group('container'))
+            if container is not None and container.contents is not None:
+                container.contents.discard(m.group('item'))
+
+    def mark_opened(self, room_name: str, container_name: str) -> None:
+        self._get_or_add(room_name, container_name).is_open = True
+
+    def containers_to_open(self, room_name: str, ingredients: Iterable[str]) -> List[str]:
+        """
+        :param room_name: The room to look in.
+        :param ingredients: The ingredients needed.
+        :return: The names of the containers in the room that are not open, first the ones that held one of
+            the ingredients in an earlier episode, then the ones that nobody looked inside yet, then the others.
+        """
+        ingredients = set(ingredients)
+        result = []
+        for container in self.containers(room_name):
+            if container.is_open or container.is_supporter or container.name in _never_holds_ingredients:
+                continue
+            result.append(container)
+        result.sort(key=lambda container: (not container.seen_contents & ingredients, container.ever_seen_inside))
+        return [container.name for container in result]
+
+    def find(self, ingredient: str) -> List[str]:
+        """
+        :return: The rooms with a container where the ingredient was seen in this episode,
+            unless it is known to not be there anymore.
+        """
+        result = []
+        for room_name, containers in self._rooms.items():
+            for container in containers.values():
+                if container.contents is not None and ingredient in container.contents:
+                    result.append(room_name)
+                    break
+        return result
@@ -1,16 +1,29 @@
+import copy
 import logging
 import random
 import re
 import sys
 from collections import defaultdict
 from enum import Enum
+from functools import lru_cache, partial
 from operator import itemgetter
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, List, Match, Optional, Pattern, Sequence, Union
 
 from textworld import EnvInfos
 
+import fault_recovery
+import layout_library
+import recipe_cache
+from batched_paths import BatchedPaths
+from containers import ContainerTracker
+from fault_recovery import FailureCounter, InventoryFailure, MapFailure, RecipeFailure
+from recipe_scheduler import RecipeTask, schedule
+from rule_engine import Rule, RuleEngine
 from room import Room
 from room_search import opposite_dir, RoomSearch
+from route_planner import RoutePlanner
+from stuck_detector import StuckDetector
+from world_model import best_command, lookahead, WorldGraph, WorldState
 
 _directions = ["north", "east", "south", "west"]
 
@@ -48,6 +61,52 @@ _ingredient_to_rooms = defaultdict(lambda: _rooms_with_ingredients, {
 The rooms that each ingredient can be found in.
 """
 
+default_config = dict(
+    max_capacity=_max_capacity,
+    rooms_with_ingredients=_rooms_with_ingredients,
+    ingredient_rooms=dict(_ingredient_to_rooms),
+    explore_order='random',
+    max_features=256,
+    lookahead_depth=0,
+    lookahead_budget=200,
+    recipe_order='schedule',
+    predict_layout=True,
+)
+"""
+The choices of the policy that can be changed with the configuration of the agent, e.g. to tune them.
+`rooms_with_ingredients` are the rooms to look for ingredients in
+and `ingredient_rooms` has the rooms for ingredients that can only be in some of them.
+The rooms of an ingredient are tried in a random order, so only which rooms are listed matters.
+`explore_order` is how rooms are explored, see `RoomSearch`.
+`max_features` is the number of features of a game above which the features that are `False` are dropped.
+With a `lookahead_depth` above 0, moves and takes chosen by the policy are checked against a `world_model.lookahead`
+of that depth that simulates at most `lookahead_budget` states per step.
+`recipe_order` is the order to do the recipe steps in once all of the ingredients are held:
+`'cookbook'` or `'schedule'` to group them by room and by use of the knife, see `recipe_scheduler`.
+With `predict_layout`, searches for rooms that were not found yet go the way that the maps of the games played before
+predict, see `layout_library`.
+"""
+
+_lookahead_branches = {
+    'take_ingredient',
+    'take_knife_on_the_way',
+    'route',
+    'find_kitchen_for_ingredients',
+    'bring_to_kitchen',
+    'go_to_bbq',
+    'go_to_kitchen',
+}
+"""
+The rules whose commands are moves or takes that the world model can compare to other ones.
+The steps of searches that are under way are not checked so that a search is not turned around at every step.
+"""
+
+_failures_before_recovery = 2
+"""
+The number of steps in a row that fail for a game before forgetting the whole plan as when the game is stuck,
+instead of only repairing the state that the failure came from.
+"""
+
 
 class Feature(Enum):
     OBSERVING_KITCHEN = 0
@@ -90,9 +149,40 @@ class Feature(Enum):
 #######################################
 # Functions For Features
 #######################################
-_closed_door_pattern = re.compile(r'\bclosed (?P<item>[^\s]+ door) leading (?P<direction>[^\s.,!?]+)\b', re.IGNORECASE)
-_need_to_open_door_pattern = re.compile(r'You have to (?P<task>open .* door) first.')
-_you_open_door_pattern = re.compile(r'You open (.* door).')
+# The names in the patterns have bounded lengths and can't span lines or sentences so that an unexpected observation,
+# e.g. a long line that repeats the start of a pattern, is parsed in linear time instead of backtracking at every start.
+_closed_door_pattern = re.compile(r'\bclosed (?P<item>[^\s]{1,40} door) leading (?P<direction>[^\s.,!?]{1,10})\b',
+                                  re.IGNORECASE)
+_open_door_pattern = re.compile(r'\bopen (?P<item>[^\s]{1,40} door) leading (?P<direction>[^\s.,!?]{1,10})\b',
+                                re.IGNORECASE)
+_need_to_open_door_pattern = re.compile(r'You have to (?P<task>open [^.\n]{1,60}? door) first\.')
+_you_open_door_pattern = re.compile(r'You open ([^.\n]{1,60}? door)\.')
+_room_name_pattern = re.compile(r'-=\s{0,3}([^=\n]{1,60}) =-')
+
+
+@lru_cache(maxsize=1024)
+def _word_pattern(word: str) -> Pattern:
+    """
+    :return: A pattern to find a word or phrase, e.g. the name of an ingredient, in any case.
+        The word is escaped so that names with special characters are matched literally.
+    """
+    return re.compile(r'(?<!\w){}(?!\w)'.format(re.escape(word)), re.IGNORECASE)
+
+
+def _search_word(word: str, text: str, lowered_text: Optional[str] = None) -> Optional[Match]:
+    """
+    Like `_word_pattern(word).search(text)`, but faster when the word isn't in the text.
+
+    :param lowered_text: `text.lower()`, to not lower the text again for each word.
+    """
+    # The pattern can't skip ahead to the first letter of the word so it tries every position of the text.
+    # Looking for the lowered word first is much faster, and only exact for ASCII.
+    if word.isascii() and text.isascii():
+        if lowered_text is None:
+            lowered_text = text.lower()
+        if word.lower() not in lowered_text:
+            return None
+    return _word_pattern(word).search(text)
 
 
 def _feat(qualifier, term):
@@ -119,6 +209,20 @@ def _ingredient_present_feat(ingredient):
     return _feat('present', ingredient)
 
 
+def _location_feat(item):
+    """
+    The name of the room that the item was last seen in.
+    """
+    return _feat('location', item)
+
+
+def _searched_room_feat(room_name):
+    """
+    The room was seen after reading the cookbook so the ingredients in it are known.
+    """
+    return _feat('searched', room_name)
+
+
 def _recipe_step_feat(recipe_step_index, recipe_step):
     return ('recipe_step', recipe_step_index, recipe_step)
 
@@ -165,22 +269,82 @@ def _remove_recipe_step(feats: Dict, recipe_step: str):
             feats[_recipe_step_feat(recipe_feat[0], recipe_step)] = False
 
 
+def _take_ingredient(feats: Dict, ingredient: str) -> None:
+    feats[_ingredient_present_feat(ingredient)] = False
+    feats[_location_feat(ingredient)] = False
+    feats[_carrying_feat(ingredient)] = True
+    feats[Feature.NUM_ITEMS_HELD] += 1
+
+    # Remove required ingredients.
+    feats[_ingredient_feat(ingredient)] = False
+    base_ingredient = _base_ingredient(ingredient)
+    if base_ingredient != ingredient:
+        feats[_ingredient_feat(base_ingredient)] = False
+        _remove_recipe_step(feats, _get_recipe_step(ingredient))
+
+
+def _take_knife(feats: Dict) -> None:
+    feats[Feature.NUM_ITEMS_HELD] += 1
+    feats[_location_feat('knife')] = False
+
+
+def _compact_features(feats: Dict) -> None:
+    """
+    Drop the features that are `False`, such as ingredients that were taken or recipe steps that were done.
+    Missing features are `False` so nothing changes for the policy.
+    """
+    for feat in [feat for feat, val in feats.items() if val is False]:
+        del feats[feat]
+
+
+def _snapshot_features(feats: Dict) -> str:
+    """
+    :return: A compact and stable description of the features that are set.
+    """
+    result = []
+    for feat, val in feats.items():
+        if val is not False:
+            name = feat.name if isinstance(feat, Feature) else ':'.join(map(str, feat))
+            result.append(name if val is True else f"{name}={val}")
+    result.sort()
+    return ';'.join(result)
+
+
 #######################################
 # END Functions For Features
 #######################################
 
+def _get_doors(ob: str) -> Dict[str, tuple]:
+    """
+    :return: The doors described in a room description: for each direction, the door's name and if it is open.
+    """
+    result = {}
+    for pattern, is_open in ((_closed_door_pattern, False), (_open_door_pattern, True)):
+        for m in pattern.finditer(ob):
+            direction = m.group('direction').lower()
+            if direction in _directions:
+                result[direction] = (m.group('item'), is_open)
+    return result
+
+
 def _gather_inventory(ob):
     result = []
     for line in ob.split('\n'):
         line = line.strip()
-        if line.startswith("You are carrying:") or line.startswith("You are carrying nothing."):
+        if line.startswith("You are carrying nothing.") or line.startswith(">"):
             continue
-        if line:
+        if line.startswith("You are carrying:"):
+            # The items can also be listed on the same line, e.g. "You are carrying: a knife and a carrot."
+            line = line[len("You are carrying:"):].strip().rstrip('.')
+            items = re.split(r', and |, | and ', line) if line else []
+        else:
+            items = [line] if line else []
+        for item in items:
             prefixes = ("a ", "an ", "some ", "raw ")
             for prefix in prefixes:
-                if line.startswith(prefix):
-                    line = line[len(prefix):]
-            result.append(line)
+                if item.startswith(prefix):
+                    item = item[len(prefix):]
+            result.append(item)
 
     return result
 
@@ -224,8 +388,9 @@ def _commandify_recipe_step(recipe_step):
 def _get_ingredients_present(observation, ingredient_candidates):
     result = []
     covered = set()
+    lowered = observation.lower()
     for ingredient in sorted(ingredient_candidates, key=len, reverse=True):
-        m = re.search(r'\b{}\b'.format(ingredient), observation, re.IGNORECASE)
+        m = _search_word(ingredient, observation, lowered)
         if m and m.start() not in covered:
             covered.update(range(m.start(), m.end()))
             result.append(ingredient)
@@ -281,6 +446,102 @@ def _requires_knife(recipe_step):
     return _require_knife_pattern.match(recipe_step) is not None
 
 
+_step_patterns = (_fry_pattern, _grill_pattern, _roast_pattern, _chop_pattern, _dice_pattern, _slice_pattern)
+
+_heat_source_rooms = {
+    "stove": "Kitchen",
+    "BBQ": "Backyard",
+    "oven": "Kitchen",
+}
+"""
+The room of each heat source.
+"""
+
+
+def _recipe_step_task(recipe_step: str) -> RecipeTask:
+    """
+    :return: What the scheduler needs to know about a recipe step.
+    """
+    if recipe_step == "prepare meal":
+        return RecipeTask(recipe_step, room="Kitchen", last=True)
+    ingredient = None
+    for pattern in _step_patterns:
+        m = pattern.match(recipe_step)
+        if m:
+            ingredient = m['ingredient']
+            break
+    heat_source = _heat_source(recipe_step)
+    return RecipeTask(recipe_step, ingredient, _heat_source_rooms.get(heat_source), _requires_knife(recipe_step))
+
+
+def _heat_source(recipe_step: str) -> Optional[str]:
+    if _fry_pattern.match(recipe_step):
+        return "stove"
+    if _grill_pattern.match(recipe_step):
+        return "BBQ"
+    if _roast_pattern.match(recipe_step):
+        return "oven"
+    return None
+
+
+_recipe_parser_version = 1
+"""
+Increase when `_parse_recipe` changes so that recipes parsed before are not used from the cache.
+"""
+
+
+def _recipe_text(ob: str) -> str:
+    """
+    :return: The part of the cookbook that the recipe is parsed from.
+    """
+    start = ob.find("Ingredients:")
+    return ob[start:] if start >= 0 else ob
+
+
+def _parse_recipe(text: str) -> Dict[str, List[str]]:
+    """
+    :return: The ingredients, the ordered recipe steps,
+        the ingredients made by the steps (e.g. "sliced carrot" for "slice the carrot"),
+        the tools and the heat sources needed by the steps.
+    """
+    ingredients = []
+    recipe_steps = []
+    in_ingredients = False
+    in_recipe_steps = False
+    for line in text.split('\n'):
+        if len(line.strip()) == 0:
+            in_ingredients = False
+            in_recipe_steps = False
+            continue
+        if line == "Ingredients:":
+            in_ingredients = True
+            continue
+        elif line == "Directions:":
+            in_recipe_steps = True
+            continue
+
+        if in_ingredients:
+            ingredients.append(line.strip())
+        elif in_recipe_steps:
+            recipe_steps.append(line.strip())
+
+    derived_ingredients = []
+    tools = []
+    heat_sources = []
+    for recipe_step in recipe_steps:
+        modified_ingredient = _recipe_step_to_ingredient(recipe_step)
+        if modified_ingredient is not None:
+            derived_ingredients.append(modified_ingredient)
+        if _requires_knife(recipe_step) and "knife" not in tools:
+            tools.append("knife")
+        heat_source = _heat_source(recipe_step)
+        if heat_source is not None and heat_source not in heat_sources:
+            heat_sources.append(heat_source)
+
+    return dict(ingredients=ingredients, steps=recipe_steps, derived_ingredients=derived_ingredients,
+                tools=tools, heat_sources=heat_sources)
+
+
 def _base_ingredient(ingredient: str) -> str:
     result = ingredient
     prefixes = ("chopped ", "diced ", "sliced ",
@@ -296,12 +557,89 @@ def _base_ingredient(ingredient: str) -> str:
     return result
 
 
+class _Decision(object):
+    """
+    What the rules of the policy decide from for one game at one step.
+    Values derived from the features are computed once per decision.
+    """
+
+    def __init__(self, game_index: int, ob: str, feats: Dict, rooms: Dict[str, Room], current_room: Room,
+                 order_recipe_steps: Optional[Callable[[List[str]], List[str]]] = None):
+        """
+        :param order_recipe_steps: Orders the recipe steps left, they are done in the order of the cookbook without it.
+        """
+        self.game_index = game_index
+        self.ob = ob
+        self.feats = feats
+        self.rooms = rooms
+        self.current_room = current_room
+        self.current_room_name = current_room.name
+        self._order_recipe_steps = order_recipe_steps
+        self._recipe_steps = None
+        self._next_recipe_step = None
+
+    @property
+    def recipe_steps(self) -> List[str]:
+        if self._recipe_steps is None:
+            self._recipe_steps = _get_recipe_steps(self.feats)
+        return self._recipe_steps
+
+    @property
+    def next_recipe_step(self) -> Optional[str]:
+        if self._next_recipe_step is None and len(self.recipe_steps) > 0:
+            recipe_steps = self.recipe_steps
+            if self._order_recipe_steps is not None and len(recipe_steps) > 1:
+                recipe_steps = self._order_recipe_steps(recipe_steps)
+            self._next_recipe_step = recipe_steps[0]
+        return self._next_recipe_step
+
+
 class CustomAgent:
     """ Template agent for the TextWorld competition. """
 
-    def __init__(self) -> None:
+    def __init__(self, config: Optional[Dict[str, Any]] = None) -> None:
+        """
+        :param config: Values to use instead of the ones in `default_config`.
+        """
+        config = dict(default_config, **(config or {}))
+        unknown = set(config) - set(default_config)
+        if len(unknown) > 0:
+            raise ValueError("Unknown agent configuration: {}".format(", ".join(sorted(unknown))))
+        self.config = config
+        self._max_capacity: int = config['max_capacity']
+        self._ingredient_to_rooms = defaultdict(lambda: list(config['rooms_with_ingredients']),
+                                                config['ingredient_rooms'])
+        self._explore_order: str = config['explore_order']
+        self._max_features: int = config['max_features']
+        self._lookahead_depth: int = config['lookahead_depth']
+        self._lookahead_budget: int = config['lookahead_budget']
+        self._recipe_order: str = config['recipe_order']
+        self._layouts: Optional[layout_library.LayoutLibrary] = \
+            layout_library.LayoutLibrary(layout_library.default_path()) if config['predict_layout'] else None
+        """
+        The layouts of the maps of the games played before by any process.
+        """
         self._initialized = False
         self._epsiode_has_started = False
+        self._game_memories: List[Dict[str, Any]] = []
+        """
+        What is known about each game that stays true across episodes,
+        and the recipe that the episodes played at the same time share (see `share_game_memory`).
+        """
+        self._recipe_cache = recipe_cache.RecipeCache(recipe_cache.default_path(), version=_recipe_parser_version)
+        """
+        Recipes parsed by any process, keyed by the text of the cookbook.
+        """
+        self._shared_memories: Optional[List[int]] = None
+        """
+        Games that should share their memory once the episode starts.
+        """
+        self._policy = RuleEngine(self._make_rules())
+        self._paths = BatchedPaths()
+        """
+        The shortest paths on the maps of the games, computed for all of the games whose map changed at each step.
+        """
+        self._failures = FailureCounter()
 
     def train(self) -> None:
         """ Tell the agent it is in training mode. """
@@ -385,23 +723,136 @@ class CustomAgent:
             self._init()
 
         self._epsiode_has_started = True
-        self._game_features: List[Dict] = [defaultdict(lambda: False) for _ in obs]
-        self._rooms: List[Dict] = [dict() for _ in obs]
+        if self._layouts is not None:
+            self._layouts.refresh()
+        same_games = len(self._game_memories) == len(obs)
+        if not same_games:
+            self._game_memories = [None for _ in obs]
+        self._game_features: List[Dict] = [None for _ in obs]
+        self._rooms: List[Dict] = [None for _ in obs]
         self._searches: List[Optional[RoomSearch]] = [None for _ in obs]
+        self._route_planners: List[RoutePlanner] = [None for _ in obs]
+        self._stuck_detectors: List[StuckDetector] = [None for _ in obs]
+        self._dones: List[bool] = [False for _ in obs]
+        self._branches: List[Optional[str]] = [None for _ in obs]
+        """
+        The name of the branch in `act` that chose the last command for each game.
+        """
+        for game_index in range(len(obs)):
+            self._reset_game(game_index, same_games)
+        if self._shared_memories is not None:
+            self.share_game_memory(self._shared_memories)
+            self._shared_memories = None
 
-    def _add_features(self, obs: List[str], infos: Dict[str, List[Any]]) -> None:
+    def _reset_game(self, game_index: int, same_game: bool) -> None:
+        """
+        Reset the state of one game for a new episode.
+
+        Arguments:
+            game_index: The index of the game in the batch.
+            same_game: `True` if the episode is for the same game as the previous episode in this index,
+                then what was learned about the game is kept.
+        """
+        if not same_game or self._game_memories[game_index] is None:
+            self._game_memories[game_index] = dict(doors=dict(), recipe=dict(), containers=ContainerTracker())
+        # The cookbook is read again in each episode: knowing the recipe from the start makes the agent walk past the
+        # ingredients while it explores.
+        self._game_memories[game_index]['recipe'] = dict()
+        self._game_memories[game_index]['containers'].start_episode()
+        self._game_features[game_index] = defaultdict(lambda: False)
+        self._learn_layout(game_index)
+        self._rooms[game_index] = dict()
+        self._paths.invalidate(game_index, self._rooms[game_index])
+        self._searches[game_index] = None
+        self._route_planners[game_index] = RoutePlanner()
+        self._policy.reset(game_index)
+        self._stuck_detectors[game_index] = StuckDetector()
+        self._failures.reset(game_index)
+        self._dones[game_index] = False
+        self._branches[game_index] = None
+
+    def _release_game(self, game_index: int) -> None:
+        """
+        Drop the state of a game whose episode is done that is only needed to play it.
+        What is kept is what traces and the next episode can use.
+        """
+        self._learn_layout(game_index)
+        self._rooms[game_index] = dict()
+        self._paths.forget(game_index)
+        self._searches[game_index] = None
+        self._route_planners[game_index] = None
+        self._policy.reset(game_index)
+        _compact_features(self._game_features[game_index])
+
+    def _learn_layout(self, game_index: int) -> None:
+        """
+        Add the map of a game to the layouts to predict the maps of the next games from.
+        """
+        if self._layouts is not None and self._rooms[game_index]:
+            self._layouts.add(self._rooms[game_index])
+
+    def start_slot_episode(self, game_index: int, same_game: bool) -> None:
+        """
+        Start a new episode for one game of the batch while the other games keep playing.
+        This lets a runner give a slot whose episode ended the next (game, episode) right away
+        instead of waiting for the whole batch to be done.
+
+        Arguments:
+            game_index: The index of the game in the batch.
+            same_game: `True` if the new episode is for the same game as the previous episode in this slot.
+        """
+        if not self._epsiode_has_started:
+            # The next call to `act` starts the episode for every slot.
+            if not same_game and game_index < len(self._game_memories):
+                self._game_memories[game_index] = None
+            return
+        self._reset_game(game_index, same_game)
+
+    def share_game_memory(self, game_indices: Iterable[int]) -> None:
+        """
+        Let games that are episodes of the same game share what they learn about it
+        (the recipe and the doors between rooms) while they are played at the same time.
+        The state of the containers is not shared because it changes during an episode.
+
+        Arguments:
+            game_indices: The indices of the games in the batch.
+        """
+        game_indices = list(game_indices)
+        if not self._epsiode_has_started:
+            # The memories don't exist yet, they are made when the episode starts.
+            self._shared_memories = game_indices
+            return
+        first = self._game_memories[game_indices[0]]
+        for game_index in game_indices[1:]:
+            self._game_memories[game_index]['doors'] = first['doors']
+            self._game_memories[game_index]['recipe'] = first['recipe']
+
+    def _add_features(self, obs: List[str], infos: Dict[str, List[Any]],
+                      game_indices: Optional[Sequence[int]] = None) -> None:
         """
         Add features for each game.
 
         Arguments:
             obs: Initial feedback for each game.
             infos: Additional information for each game.
+            game_indices: The indices in the batch of the games of the observations, all of the games if `None`.
         """
-        for ob, feats in zip(obs, self._game_features):
+        if game_indices is None:
+            game_indices = range(len(obs))
+        for game_index, ob in zip(game_indices, obs):
+            feats = self._game_features[game_index]
+            # The responses to commands can start with blank lines.
+            text = ob.lstrip()
             # Defaults
             if feats[Feature.NUM_ITEMS_HELD] == False:
                 feats[Feature.NUM_ITEMS_HELD] = 0
 
+            recipe = self._game_memories[game_index]['recipe']
+            if not feats[Feature.SEEN_COOKBOOK] and recipe:
+                # The cookbook was read in another episode of this game that is played at the same time.
+                feats[Feature.SEEN_COOKBOOK] = True
+                self._set_recipe(feats, recipe['ingredients'], recipe['steps'])
+
             # TODO Optimization: Check if fridge is already open in more ways.
             if "The fridge is empty" in ob:
                 feats[Feature.OPENED_FRIDGE] = True
@@ -409,15 +860,19 @@ class CustomAgent:
             new_room = self._get_room_name(ob)
             changed_room = new_room is not None and new_room != feats[Feature.CURRENT_ROOM]
             feats[Feature.CURRENT_ROOM] = new_room or feats[Feature.CURRENT_ROOM]
+            if changed_room:
+                # The ingredients that were present are in the room that was left.
+                for ingredient in _get_all_present_ingredients(feats):
+                    feats[_ingredient_present_feat(ingredient)] = False
 
-            feats[Feature.INVENTORY_SHOWING] = ob.startswith("You are carrying:") \
-                                               or ob.startswith("You are carrying nothing.")
+            feats[Feature.INVENTORY_SHOWING] = text.startswith("You are carrying:") \
+                                               or text.startswith("You are carrying nothing.")
 
-            feats[Feature.CARRYING_TOO_MUCH] = ob.startswith("You're carrying too many things already.")
+            feats[Feature.CARRYING_TOO_MUCH] = text.startswith("You're carrying too many things already.")
 
-            feats[Feature.CANT_SEE_SUCH_THING] = ob.startswith("You can't see any such thing.")
+            feats[Feature.CANT_SEE_SUCH_THING] = text.startswith("You can't see any such thing.")
 
-            feats[Feature.YOU_TAKE] = ob.startswith("You take ")
+            feats[Feature.YOU_TAKE] = text.startswith("You take ")
 
             feats[Feature.NEED_TO_OPEN_FIRST] = _need_to_open_door_pattern.search(ob) is not None
 
@@ -427,9 +882,9 @@ class CustomAgent:
                 # Pick up failed.
                 feats[Feature.NUM_ITEMS_HELD] -= 1
 
-            if ob.startswith("You take the knife "):
+            if text.startswith(("You take the knife ", "You pick up the knife ")):
                 feats[Feature.HOLDING_KNIFE] = True
-            elif ob.startswith("You drop the knife "):
+            elif text.startswith("You drop the knife "):
                 feats[Feature.HOLDING_KNIFE] = False
 
             feats[Feature.BBQ_PRESENT] = "BBQ" in ob
@@ -440,17 +895,13 @@ class CustomAgent:
             if feats[Feature.COOKBOOK_SHOWING] and not feats[Feature.SEEN_COOKBOOK]:
                 feats[Feature.SEEN_COOKBOOK] = True
                 ingredients, recipe_steps = self._gather_recipe(ob)
-                carrying = set(_get_carrying(feats))
-                # TODO Remove recipe steps for what we're carrying.
-                for ingredient in ingredients:
-                    if ingredient not in carrying:
-                        feats[_ingredient_feat(ingredient)] = True
-                for recipe_step_index, recipe_step in enumerate(recipe_steps):
-                    feats[_recipe_step_feat(recipe_step_index, recipe_step)] = True
+                recipe.update(ingredients=ingredients, steps=recipe_steps)
+                self._set_recipe(feats, ingredients, recipe_steps)
 
             if feats[Feature.INVENTORY_SHOWING]:
                 items = _gather_inventory(ob)
                 feats[Feature.NUM_ITEMS_HELD] = len(items)
+                feats[Feature.HOLDING_KNIFE] = "knife" in items
                 for item in items:
                     feats[_carrying_feat(item)] = True
                     feats[_ingredient_feat(item)] = False
@@ -463,6 +914,13 @@ class CustomAgent:
                 ingredients_present = _get_ingredients_present(ob, ingredients_needed)
                 for ingredient in ingredients_present:
                     feats[_ingredient_present_feat(ingredient)] = True
+                    feats[_location_feat(ingredient)] = feats[Feature.CURRENT_ROOM]
+                if changed_room:
+                    feats[_searched_room_feat(new_room)] = True
+                    # Forget where ingredients were if they are not here anymore.
+                    for ingredient in set(ingredients_needed) - set(ingredients_present):
+                        if feats[_location_feat(ingredient)] == new_room:
+                            feats[_location_feat(ingredient)] = False
 
             if feats[Feature.SEEN_COOKBOOK]:
                 # Had before:
@@ -482,56 +940,42 @@ class CustomAgent:
 
             if changed_room:
                 # Check directions you can go.
+                lowered = ob.lower()
                 for direction in _directions:
-                    present = re.search(r'\b{}\b'.format(direction), ob, re.IGNORECASE) is not None
+                    present = _search_word(direction, ob, lowered) is not None
                     feats[_direction_feat(direction)] = present
+                if _search_word('knife', ob, lowered):
+                    feats[_location_feat('knife')] = new_room
 
             # Check closed directions.
             # Clear closed feats.
             for direction in _directions:
                 if feats[_direction_closed_feat(direction)]:
                     del feats[_direction_closed_feat(direction)]
-            m = _closed_door_pattern.search(ob)
-            while m:
+            for m in _closed_door_pattern.finditer(ob):
                 item = m.group('item')
                 direction = m.group('direction')
                 feats[_direction_closed_feat(direction)] = item
-                m = _closed_door_pattern.search(ob, pos=m.endpos)
-
-    def _gather_recipe(self, ob):
-        ingredients = []
-        recipe_steps = []
-        in_ingredients = False
-        in_recipe_steps = False
-        for line in ob.split('\n'):
-            if len(line.strip()) == 0:
-                in_ingredients = False
-                in_recipe_steps = False
-                continue
-            if line == "Ingredients:":
-                in_ingredients = True
-                continue
-            elif line == "Directions:":
-                in_recipe_steps = True
-                continue
 
-            if in_ingredients:
-                ingredients.append(line.strip())
-            elif in_recipe_steps:
-                recipe_steps.append(line.strip())
-
-        # Extend.
-        for recipe_step in recipe_steps:
-            modified_ingredient = _recipe_step_to_ingredient(recipe_step)
-            if modified_ingredient is not None:
-                ingredients.append(modified_ingredient)
+    @staticmethod
+    def _set_recipe(feats: Dict, ingredients: List[str], recipe_steps: List[str]) -> None:
+        carrying = set(_get_carrying(feats))
+        # TODO Remove recipe steps for what we're carrying.
+        for ingredient in ingredients:
+            if ingredient not in carrying:
+                feats[_ingredient_feat(ingredient)] = True
+        for recipe_step_index, recipe_step in enumerate(recipe_steps):
+            feats[_recipe_step_feat(recipe_step_index, recipe_step)] = True
 
-        return ingredients, recipe_steps
+    def _gather_recipe(self, ob):
+        recipe = self._recipe_cache.get_or_parse(_recipe_text(ob), _parse_recipe)
+        # Extend with the ingredients that the steps make.
+        return recipe['ingredients'] + recipe['derived_ingredients'], list(recipe['steps'])
 
     @staticmethod
     def _get_room_name(ob: str) -> Optional[str]:
         result = None
-        m = re.search(r'-=\s*([^=]+) =-', ob)
+        m = _room_name_pattern.search(ob)
         if m:
             result = m.group(1)
         return result
@@ -540,6 +984,7 @@ class CustomAgent:
                     prev_room: Room, current_room_name: str, ob: str):
         rooms = self._rooms[game_index]
         room = rooms.get(current_room_name)
+        map_changed = room is None
         if room is None:
             directions = []
             for direction in _directions:
@@ -547,10 +992,580 @@ class CustomAgent:
                     directions.append(direction)
             room = Room(current_room_name, directions)
             rooms[current_room_name] = room
-        if self._searches[game_index] is not None and prev_room is not None:
+            self._route_planners[game_index].add_room(current_room_name)
+            # Doors start closed in every episode.
+            for (room_name, direction), door in self._game_memories[game_index]['doors'].items():
+                if room_name == current_room_name:
+                    room.set_door(direction, door, is_open=False)
+        if self._searches[game_index] is not None and prev_room is not None and prev_room.name != room.name:
             prev_dir = self._searches[game_index].prev_direction_traveled
+            map_changed = map_changed or rooms[prev_room.name].directions.get(prev_dir) is not room \
+                or room.directions.get(opposite_dir(prev_dir)) is not prev_room
             rooms[prev_room.name].directions[prev_dir] = room
             room.directions[opposite_dir(prev_dir)] = prev_room
+            self._route_planners[game_index].add_connection(prev_room.name, room.name)
+        if self._update_doors(game_index, room, ob) or map_changed:
+            self._paths.invalidate(game_index)
+        self._game_memories[game_index]['containers'].update(room.name, ob)
+
+    def _update_doors(self, game_index: int, room: Room, ob: str) -> bool:
+        """
+        :return: `True` if a door changed the cost of going somewhere.
+        """
+        known_doors = self._game_memories[game_index]['doors']
+        changed = False
+        if self._get_room_name(ob) == room.name:
+            for direction, (door, is_open) in _get_doors(ob).items():
+                changed |= room.set_door(direction, door, is_open)
+                known_doors[(room.name, direction)] = door
+        m = _you_open_door_pattern.search(ob)
+        if m:
+            for direction, door in room.doors.items():
+                if door == m.group(1):
+                    changed |= room.set_door(direction, door, is_open=True)
+        m = _need_to_open_door_pattern.search(ob)
+        if m and self._searches[game_index] is not None:
+            # Found out about the door by trying to go through it.
+            direction = self._searches[game_index].prev_direction_traveled
+            door = m.group('task')[len("open "):]
+            if door.startswith("the "):
+                door = door[len("the "):]
+            changed |= room.set_door(direction, door, is_open=False)
+            known_doors[(room.name, direction)] = door
+        return changed
+
+    def _open_door_first(self, game_index: int, command: Optional[str]) -> Optional[str]:
+        """
+        :return: The command to open the door in the way if `command` goes through a closed door.
+            Going in the direction is done at the next step once the door opened.
+        """
+        if command not in _directions:
+            return None
+        room = self._rooms[game_index].get(self._game_features[game_index][Feature.CURRENT_ROOM])
+        if room is None:
+            return None
+        door = room.get_closed_door(command)
+        if door is None:
+            return None
+        return "open {}".format(door)
+
+    def _plan_ingredient_route(self, game_index: int, current_room_name: str) -> List[str]:
+        """
+        Plan the order of the rooms to visit to collect the missing ingredients and then go back to the Kitchen.
+        Only rooms on the discovered map are considered:
+        rooms where a missing ingredient was seen and rooms that could have an ingredient but were not searched yet.
+
+        :return: The rooms to visit in order, ending with the Kitchen. Empty if there is no room worth visiting.
+        """
+        feats = self._game_features[game_index]
+        planner = self._route_planners[game_index]
+        containers = self._game_memories[game_index]['containers']
+        ingredients_needed = set(_get_all_required_ingredients(feats)) - set(_get_all_present_ingredients(feats))
+        stops = set()
+        for ingredient in ingredients_needed:
+            location = feats[_location_feat(ingredient)]
+            if location:
+                stops.add(location)
+                continue
+            # Seen in a container in this episode.
+            in_containers = [room_name for room_name in containers.find(_base_ingredient(ingredient))
+                             if room_name in planner]
+            if len(in_containers) > 0:
+                stops.update(in_containers)
+                continue
+            for room_name in self._ingredient_to_rooms[_base_ingredient(ingredient)]:
+                if room_name in planner and (not feats[_searched_room_feat(room_name)]
+                                             or containers.containers_to_open(room_name, (ingredient,))):
+                    stops.add(room_name)
+        knife_location = feats[_location_feat('knife')]
+        if knife_location and not feats[Feature.HOLDING_KNIFE] \
+                and any(map(_requires_knife, _get_recipe_steps(feats))):
+            stops.add(knife_location)
+        stops.discard("Kitchen")
+        stops.discard(current_room_name)
+        if len(stops) == 0:
+            return []
+        return planner.plan_route(current_room_name, stops, end="Kitchen" if "Kitchen" in planner else None)
+
+    def _progress_key(self, game_index: int) -> tuple:
+        """
+        :return: A summary of how far along the game is. It changes when something useful happened.
+        """
+        feats = self._game_features[game_index]
+        return (feats[Feature.CURRENT_ROOM],
+                len(self._rooms[game_index]),
+                feats[Feature.SEEN_COOKBOOK],
+                frozenset(_get_carrying(feats)),
+                frozenset(_get_all_required_ingredients(feats)),
+                len(_get_recipe_steps(feats)),
+                )
+
+    def _recover(self, game_index: int) -> str:
+        """
+        Try to get out of being stuck by forgetting the current plan and the state that is probably wrong.
+
+        :return: The command to get a fresh view of the room.
+        """
+        feats = self._game_features[game_index]
+        self._stuck_detectors[game_index].start_recovery()
+        self._searches[game_index] = None
+        for ingredient in _get_all_present_ingredients(feats):
+            feats[_ingredient_present_feat(ingredient)] = False
+        # Check the inventory again next.
+        feats[Feature.DONE_INIT_INVENTORY_CHECK] = False
+        return "look"
+
+    def _repair(self, game_index: int, error: Exception) -> str:
+        """
+        Repair the state that a failure of the policy probably came from and count the failure.
+
+        :return: The command to get what the state is rebuilt from: the inventory or a view of the room.
+        """
+        kind = fault_recovery.classify(error)
+        failures_in_a_row = self._failures.record(game_index, kind)
+        feats = self._game_features[game_index]
+        self._searches[game_index] = None
+        if failures_in_a_row >= _failures_before_recovery:
+            # Repairing what failed was not enough.
+            return self._recover(game_index)
+        if kind in ('inventory', 'recipe'):
+            # Rebuild what is carried from the inventory.
+            for item in _get_carrying(feats):
+                feats[_carrying_feat(item)] = False
+            feats[Feature.NUM_ITEMS_HELD] = 0
+            feats[Feature.DONE_INIT_INVENTORY_CHECK] = True
+            if kind == 'recipe':
+                feats[Feature.FOUND_ALL_INGREDIENTS] = len(_get_all_required_ingredients(feats)) == 0
+            return "inventory"
+        # Rebuild the current room and the paths from a new view of the room.
+        feats[Feature.NEED_TO_OPEN_FIRST] = False
+        self._paths.invalidate(game_index)
+        return "look"
+
+    def _make_rules(self) -> List[Rule]:
+        """
+        :return: The policy: the rules in order of priority.
+            The names of the rules are the names of the branches in the traces.
+        """
+        def can_collect(d: _Decision) -> bool:
+            return not d.feats[Feature.FOUND_ALL_INGREDIENTS] and d.feats[Feature.NUM_ITEMS_HELD] < self._max_capacity
+
+        def holds_too_much_to_collect(d: _Decision) -> bool:
+            return not d.feats[Feature.FOUND_ALL_INGREDIENTS] and d.feats[Feature.NUM_ITEMS_HELD] == self._max_capacity
+
+        def needs_knife(d: _Decision) -> bool:
+            return d.next_recipe_step is not None and _requires_knife(d.next_recipe_step) \
+                   and not d.feats[Feature.HOLDING_KNIFE]
+
+        return [
+            Rule('recover', self._rule_recover,
+                 lambda d: self._stuck_detectors[d.game_index].needs_recovery),
+            Rule('open_door', self._rule_open_door,
+                 lambda d: d.feats[Feature.NEED_TO_OPEN_FIRST], inputs=(Feature.NEED_TO_OPEN_FIRST,)),
+            Rule('door_opened', self._rule_door_opened,
+                 lambda d: self._searches[d.game_index] is not None and d.feats[Feature.YOU_OPENED_DOOR]),
+            Rule('search', self._rule_search,
+                 lambda d: self._searches[d.game_index] is not None),
+            Rule('drop_too_much', self._rule_drop_too_much,
+                 lambda d: d.feats[Feature.CARRYING_TOO_MUCH], inputs=(Feature.CARRYING_TOO_MUCH,)),
+            Rule('read_cookbook', lambda d: "look cookbook",
+                 lambda d: not d.feats[Feature.SEEN_COOKBOOK] and d.feats[Feature.COOKBOOK_PRESENT],
+                 inputs=(Feature.SEEN_COOKBOOK, Feature.COOKBOOK_PRESENT)),
+            Rule('check_inventory', self._rule_check_inventory,
+                 lambda d: not d.feats[Feature.DONE_INIT_INVENTORY_CHECK], inputs=(Feature.DONE_INIT_INVENTORY_CHECK,)),
+            Rule('find_kitchen', self._rule_find_kitchen,
+                 lambda d: not d.feats[Feature.SEEN_COOKBOOK], inputs=(Feature.SEEN_COOKBOOK,)),
+            Rule('open_container', self._rule_open_container,
+                 lambda d: not d.feats[Feature.FOUND_ALL_INGREDIENTS], inputs=(Feature.FOUND_ALL_INGREDIENTS,)),
+            Rule('take_ingredient', self._rule_take_ingredient,
+                 can_collect, inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD)),
+            Rule('take_knife_on_the_way', self._rule_take_knife_on_the_way,
+                 can_collect, inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD)),
+            Rule('route', self._rule_route,
+                 can_collect, inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD)),
+            Rule('find_kitchen_for_ingredients', self._rule_find_kitchen_for_ingredients,
+                 can_collect, inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD)),
+            Rule('explore_for_ingredients', self._rule_explore_for_ingredients,
+                 lambda d: not d.feats[Feature.FOUND_ALL_INGREDIENTS] and d.feats[Feature.CURRENT_ROOM] == "Kitchen",
+                 inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.CURRENT_ROOM)),
+            Rule('bring_to_kitchen', self._rule_bring_to_kitchen,
+                 lambda d: holds_too_much_to_collect(d) and d.feats[Feature.CURRENT_ROOM] != "Kitchen",
+                 inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD, Feature.CURRENT_ROOM)),
+            Rule('drop_in_kitchen', self._rule_drop_in_kitchen,
+                 lambda d: holds_too_much_to_collect(d) and d.feats[Feature.CURRENT_ROOM] == "Kitchen"
+                           and not d.feats[Feature.STARTED_COOKING],
+                 inputs=(Feature.FOUND_ALL_INGREDIENTS, Feature.NUM_ITEMS_HELD, Feature.CURRENT_ROOM,
+                         Feature.STARTED_COOKING)),
+            Rule('take_knife', self._rule_take_knife,
+                 lambda d: needs_knife(d) and d.feats[Feature.NUM_ITEMS_HELD] < self._max_capacity),
+            Rule('drop_for_knife', self._rule_drop_for_knife,
+                 needs_knife),
+            Rule('go_to_bbq', self._rule_go_to_bbq,
+                 lambda d: d.next_recipe_step is not None and _grill_pattern.match(d.next_recipe_step)
+                           and not d.feats[Feature.BBQ_PRESENT]),
+            Rule('go_to_kitchen', self._rule_go_to_kitchen,
+                 lambda d: d.next_recipe_step is not None
+                           and (_fry_pattern.match(d.next_recipe_step)
+                                or _roast_pattern.match(d.next_recipe_step)
+                                or d.next_recipe_step == "prepare meal")
+                           and d.current_room_name != "Kitchen"),
+            Rule('recipe_step', self._rule_recipe_step,
+                 lambda d: d.next_recipe_step is not None),
+            Rule('eat_meal', lambda d: "eat meal"),
+        ]
+
+    def _search_towards(self, d: _Decision, target_name: str) -> Optional[str]:
+        """
+        Start a search for a room.
+
+        :return: The direction to go or `None` if no path is known.
+        """
+        predict_direction = partial(self._layouts.direction_towards, d.rooms) if self._layouts is not None else None
+        self._searches[d.game_index] = RoomSearch(d.rooms, d.current_room, target_name, self._explore_order,
+                                                  partial(self._paths.path, d.game_index), predict_direction)
+        return self._searches[d.game_index].get_next_direction()
+
+    def _rule_recover(self, d: _Decision) -> str:
+        return self._recover(d.game_index)
+
+    def _rule_open_door(self, d: _Decision) -> str:
+        m = _need_to_open_door_pattern.search(d.ob)
+        if m is None:
+            raise MapFailure("No door to open in the observation.")
+        return m.group('task')
+
+    def _rule_door_opened(self, d: _Decision) -> str:
+        # Optimization: Open the door before getting the error.
+        return self._searches[d.game_index].prev_direction_traveled
+
+    def _rule_search(self, d: _Decision) -> Optional[str]:
+        # There is a search in progress.
+        search = self._searches[d.game_index]
+        search.current_room = d.current_room
+        if search.target_name == d.current_room_name:
+            # Found target, stop the search.
+            self._searches[d.game_index] = None
+            return None
+        if not d.feats[Feature.FOUND_ALL_INGREDIENTS] and d.feats[Feature.NUM_ITEMS_HELD] < self._max_capacity \
+                and not set(_get_all_required_ingredients(d.feats)).isdisjoint(_get_all_present_ingredients(d.feats)):
+            # Take the ingredients that are here on the way, the rule that started the search starts it again after.
+            self._searches[d.game_index] = None
+            return None
+        # Keep searching.
+        direction = search.get_next_direction()
+        if direction is None:
+            # No path exists.
+            # TODO Need to backtrack to whatever we were doing before.
+            self._searches[d.game_index] = None
+        return direction
+
+    @staticmethod
+    def _drop_unneeded(d: _Decision) -> str:
+        """
+        :return: The command to drop something that is not needed for the recipe.
+        """
+        feats = d.feats
+        candidates = tuple(item for item in set(_get_carrying(feats)) - set(_get_all_required_ingredients(feats))
+                           if d.next_recipe_step is None or item not in d.next_recipe_step)
+        if len(candidates) == 0:
+            raise InventoryFailure("Nothing that is carried can be dropped.")
+        item = random.choice(candidates)
+        feats[_carrying_feat(item)] = False
+        feats[Feature.NUM_ITEMS_HELD] -= 1
+        return "drop {}".format(item)
+
+    def _rule_drop_too_much(self, d: _Decision) -> str:
+        # Need to drop something.
+        return self._drop_unneeded(d)
+
+    def _rule_check_inventory(self, d: _Decision) -> str:
+        d.feats[Feature.DONE_INIT_INVENTORY_CHECK] = True
+        return "inventory"
+
+    def _rule_find_kitchen(self, d: _Decision) -> str:
+        direction = self._search_towards(d, "Kitchen")
+        # Wait if no way to go is known.
+        return direction if direction is not None else "wait"
+
+    def _rule_open_container(self, d: _Decision) -> Optional[str]:
+        # Look in the containers here that could have a missing ingredient.
+        containers = self._game_memories[d.game_index]['containers']
+        if len(containers.containers(d.current_room_name)) == 0:
+            return None
+        ingredients_needed = set(_get_all_required_ingredients(d.feats))
+        ingredients_needed.update(map(_base_ingredient, tuple(ingredients_needed)))
+        containers_to_open = containers.containers_to_open(d.current_room_name, ingredients_needed)
+        if len(containers_to_open) == 0:
+            return None
+        container = containers_to_open[0]
+        containers.mark_opened(d.current_room_name, container)
+        if container == "fridge":
+            d.feats[Feature.OPENED_FRIDGE] = True
+        return "open {}".format(container)
+
+    def _rule_take_ingredient(self, d: _Decision) -> Optional[str]:
+        # See if ingredient is here.
+        feats = d.feats
+        ingredients_here = tuple(set(_get_all_required_ingredients(feats)) & set(_get_all_present_ingredients(feats)))
+        if len(ingredients_here) == 0:
+            return None
+        ingredient = random.choice(ingredients_here)
+        _take_ingredient(feats, ingredient)
+        return "take {}".format(ingredient)
+
+    def _rule_take_knife_on_the_way(self, d: _Decision) -> Optional[str]:
+        feats = d.feats
+        if feats[_location_feat('knife')] != d.current_room_name \
+                or d.current_room_name == "Kitchen" \
+                or feats[Feature.HOLDING_KNIFE] \
+                or not any(map(_requires_knife, d.recipe_steps)):
+            return None
+        _take_knife(feats)
+        return "take knife"
+
+    def _rule_route(self, d: _Decision) -> Optional[str]:
+        # Visit the rooms that can still have ingredients in a short order.
+        route = self._plan_ingredient_route(d.game_index, d.current_room_name)
+        if len(route) == 0 or route[0] == d.current_room_name:
+            return None
+        direction = self._search_towards(d, route[0])
+        if direction is None:
+            self._searches[d.game_index] = None
+        return direction
+
+    def _rule_find_kitchen_for_ingredients(self, d: _Decision) -> Optional[str]:
+        if "Kitchen" in d.rooms:
+            return None
+        # The recipe is known from another episode but the map is not, keep exploring.
+        direction = self._search_towards(d, "Kitchen")
+        if direction is None:
+            self._searches[d.game_index] = None
+        return direction
+
+    def _rule_explore_for_ingredients(self, d: _Decision) -> str:
+        # Go find ingredients.
+        ingredients_needed = tuple(
+            set(_get_all_required_ingredients(d.feats)) - set(_get_all_present_ingredients(d.feats)))
+        if len(ingredients_needed) == 0:
+            raise RecipeFailure("No ingredient is needed but not all of them were found.")
+        if len(d.current_room.directions) > 0:
+            for ingredient in random.sample(ingredients_needed, len(ingredients_needed)):
+                room_options = self._ingredient_to_rooms[ingredient]
+                for target_room_name in random.sample(room_options, len(room_options)):
+                    direction = self._search_towards(d, target_room_name)
+                    if direction is not None:
+                        return direction
+                    # No path exists.
+                    self._searches[d.game_index] = None
+        return "wait"
+
+    def _rule_bring_to_kitchen(self, d: _Decision) -> str:
+        direction = self._search_towards(d, "Kitchen")
+        return direction if direction is not None else "wait"
+
+    def _rule_drop_in_kitchen(self, d: _Decision) -> str:
+        # Not started cooking.
+        carrying = _get_carrying(d.feats)
+        if len(carrying) == 0:
+            raise InventoryFailure("Nothing is carried to drop.")
+        item = random.choice(carrying)
+        d.feats[_carrying_feat(item)] = False
+        d.feats[Feature.NUM_ITEMS_HELD] -= 1
+        return "drop {}".format(item)
+
+    def _rule_take_knife(self, d: _Decision) -> str:
+        knife_location = d.feats[_location_feat('knife')]
+        if knife_location and knife_location != d.current_room_name:
+            # Taking it here would fail at every step, go get it.
+            direction = self._search_towards(d, knife_location)
+            if direction is not None:
+                return direction
+            self._searches[d.game_index] = None
+        d.feats[Feature.NUM_ITEMS_HELD] += 1
+        return "take knife"
+
+    def _rule_drop_for_knife(self, d: _Decision) -> str:
+        # Need to drop something.
+        return self._drop_unneeded(d)
+
+    def _rule_go_to_bbq(self, d: _Decision) -> str:
+        # Go to the BBQ in the Backyard.
+        direction = self._search_towards(d, "Backyard")
+        return direction if direction is not None else "wait"
+
+    def _rule_go_to_kitchen(self, d: _Decision) -> str:
+        direction = self._search_towards(d, "Kitchen")
+        return direction if direction is not None else "wait"
+
+    def _rule_recipe_step(self, d: _Decision) -> str:
+        next_recipe_step = d.next_recipe_step
+        _remove_recipe_step(d.feats, next_recipe_step)
+        d.feats[Feature.STARTED_COOKING] = True
+        # TODO Maybe remove from required ingredients (remove ingredient feature).
+        return _commandify_recipe_step(next_recipe_step)
+
+    def snapshot_game(self, game_index: int) -> Dict[str, Any]:
+        """
+        :return: A copy of what the agent knows about a game in the current episode,
+            to go back to with `restore_game`.
+        """
+        # Searches use the paths and the layouts of all of the games, don't copy them.
+        return copy.deepcopy(dict(
+            features=self._game_features[game_index],
+            rooms=self._rooms[game_index],
+            search=self._searches[game_index],
+            route_planner=self._route_planners[game_index],
+            stuck_detector=self._stuck_detectors[game_index],
+            containers=self._game_memories[game_index]['containers'],
+        ), {id(self._paths): self._paths, id(self._layouts): self._layouts})
+
+    def restore_game(self, game_index: int, snapshot: Dict[str, Any]) -> None:
+        """
+        Go back to the state of a game from `snapshot_game`.
+        The snapshot is used as is so it can only be restored once.
+        """
+        self._game_features[game_index] = snapshot['features']
+        self._rooms[game_index] = snapshot['rooms']
+        self._paths.invalidate(game_index, snapshot['rooms'])
+        self._searches[game_index] = snapshot['search']
+        self._route_planners[game_index] = snapshot['route_planner']
+        self._stuck_detectors[game_index] = snapshot['stuck_detector']
+        self._game_memories[game_index]['containers'] = snapshot['containers']
+        # The results of the rules were for the other state.
+        self._policy.reset(game_index)
+
+    def _world_state(self, game_index: int, current_room_name: str) -> WorldState:
+        """
+        :return: The model of the game from what the agent knows.
+        """
+        feats = self._game_features[game_index]
+        rooms = self._rooms[game_index]
+        recipe_steps = _get_recipe_steps(feats)
+        needed = set()
+        if not feats[Feature.FOUND_ALL_INGREDIENTS]:
+            # The ingredients that the recipe steps make are not found anywhere.
+            needed = set(_get_all_required_ingredients(feats)) - set(_get_carrying(feats)) \
+                - set(filter(None, map(_recipe_step_to_ingredient, recipe_steps)))
+        locations = {}
+        for item in list(needed) + ['knife']:
+            location = feats[_location_feat(item)] or feats[_location_feat(_base_ingredient(item))]
+            if location:
+                locations[item] = location
+        for item in _get_all_present_ingredients(feats):
+            locations[item] = current_room_name
+        needs_knife = not feats[Feature.HOLDING_KNIFE] and any(map(_requires_knife, recipe_steps))
+
+        frontier = set()
+        unknown = needed - set(locations)
+        if len(unknown) > 0 or (needs_knife and 'knife' not in locations):
+            frontier.update(name for name, room in rooms.items() if None in room.directions.values())
+        for item in unknown:
+            frontier.update(room_name for room_name in self._ingredient_to_rooms[_base_ingredient(item)]
+                            if room_name in rooms and not feats[_searched_room_feat(room_name)])
+
+        cook_rooms = []
+        for task in map(_recipe_step_task, self._order_recipe_steps(game_index, current_room_name, recipe_steps)):
+            if task.room is not None and task.room not in cook_rooms[-1:]:
+                cook_rooms.append(task.room)
+        graph = WorldGraph(rooms, self._paths.frozen_distance(game_index))
+        return WorldState(graph, current_room_name, needed, locations,
+                          feats[Feature.NUM_ITEMS_HELD], self._max_capacity, len(recipe_steps), cook_rooms,
+                          needs_knife, frontier)
+
+    def _order_recipe_steps(self, game_index: int, current_room_name: str, recipe_steps: List[str]) -> List[str]:
+        """
+        :return: The recipe steps in the order to do them.
+            Until all of the ingredients are held, the steps might not be doable yet so they keep the cookbook order.
+        """
+        feats = self._game_features[game_index]
+        if self._recipe_order == 'cookbook' or not feats[Feature.FOUND_ALL_INGREDIENTS] or len(recipe_steps) < 2:
+            return recipe_steps
+        holding_knife = bool(feats[Feature.HOLDING_KNIFE])
+        knife_location = None if holding_knife else feats[_location_feat('knife')] or None
+        tasks = schedule([_recipe_step_task(step) for step in recipe_steps], current_room_name,
+                         partial(self._paths.distance, game_index), holding_knife, knife_location)
+        return [task.step for task in tasks]
+
+    def _keep_lookahead_start(self, game_index: int, current_room_name: str, start: Dict[str, Any],
+                              rule_name: str) -> None:
+        """
+        Before the action of the first rule whose command the lookahead checks, keep the state of the game in `start`:
+        the rules change the state, so the lookahead can go back to it to do another command instead.
+        """
+        if rule_name in _lookahead_branches and len(start) == 0:
+            start['snapshot'] = self.snapshot_game(game_index)
+            start['world_state'] = self._world_state(game_index, current_room_name)
+
+    def _lookahead(self, world_state: WorldState, command: str) -> Optional[str]:
+        """
+        :return: A command predicted to reach the goal in fewer steps than the command of the policy,
+            if the model can predict the effect of the command of the policy.
+        """
+        values = lookahead(world_state, self._lookahead_depth, self._lookahead_budget)
+        if command not in values:
+            return None
+        best = best_command(values)
+        if values[best] < values[command]:
+            return best
+        return None
+
+    def _apply_lookahead(self, game_index: int, current_room_name: str, command: str) -> str:
+        """
+        Update the state like the rules do for a command chosen by the lookahead.
+        """
+        feats = self._game_features[game_index]
+        current_room = self._rooms[game_index][current_room_name]
+        if command == "take knife":
+            _take_knife(feats)
+        elif command.startswith("take "):
+            _take_ingredient(feats, command[len("take "):])
+        else:
+            # Search for the next room so that the map is updated when getting there.
+            search = RoomSearch(self._rooms[game_index], current_room, current_room.directions[command].name,
+                                self._explore_order, partial(self._paths.path, game_index))
+            search.prev_direction_traveled = command
+            self._searches[game_index] = search
+        return command
+
+    def get_rule_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        :return: For each rule of the policy, how many times it was evaluated and chose the command
+            and the time spent in it.
+        """
+        return self._policy.stats_dict()
+
+    def get_failure_counts(self, game_index: Optional[int] = None) -> Dict[str, int]:
+        """
+        :return: The number of failures of each kind (see `fault_recovery.kinds`) of a game in its current or last
+            episode, or of all of the games since the agent was made if `None`.
+        """
+        return self._failures.counts(game_index)
+
+    def get_trace_info(self, game_index: int) -> Dict[str, Optional[str]]:
+        """
+        :return: Details about how the last command was chosen for the game, to log with the step.
+        """
+        if not self._epsiode_has_started:
+            return dict(features=None, branch=None)
+        return dict(features=_snapshot_features(self._game_features[game_index]),
+                    branch=self._branches[game_index])
+
+    def should_abort_episode(self) -> bool:
+        """
+        :return: `True` if every game that is not done is stuck, even after trying to recover,
+            so the episode can be ended early instead of spending the rest of the steps.
+        """
+        if not self._epsiode_has_started:
+            return False
+        return all(self._dones[game_index] or self.should_abort_game(game_index)
+                   for game_index in range(len(self._dones)))
+
+    def should_abort_game(self, game_index: int) -> bool:
+        """
+        :return: `True` if the game is stuck, even after trying to recover,
+            so its episode can be ended early when the games in the batch can be ended independently.
+        """
+        return self._epsiode_has_started and self._stuck_detectors[game_index].gave_up
 
     def _end_episode(self, obs: List[str], scores: List[int], infos: Dict[str, List[Any]]) -> None:
         """
@@ -561,8 +1576,14 @@ class CustomAgent:
             score: The score obtained so far for each game.
             infos: Additional information for each game.
         """
+        if self._epsiode_has_started:
+            for game_index in range(len(self._rooms)):
+                self._learn_layout(game_index)
         self._epsiode_has_started = False
 
+        if '--debug' in sys.argv:
+            print(self._policy.report())
+
         # [You can insert code here.]
 
     def act(self, obs: List[str], scores: List[int], dones: List[bool], infos: Dict[str, List[Any]]) -> Optional[
@@ -588,8 +1609,6 @@ class CustomAgent:
             The states for finished games are simply copy over until all
             games are done.
         """
-        debug = '--debug' in sys.argv
-
         if all(dones):
             self._end_episode(obs, scores, infos)
             return  # Nothing to return.
@@ -597,18 +1616,63 @@ class CustomAgent:
         if not self._epsiode_has_started:
             self._start_episode(obs, infos)
 
-        self._add_features(obs, infos)
+        return self._act(range(len(obs)), obs, scores, dones, infos)
+
+    def act_on_slots(self, slot_indices: Sequence[int], obs: List[str], scores: List[int], dones: List[bool],
+                     infos: Dict[str, List[Any]]) -> List[str]:
+        """
+        Acts upon the observations of some of the games of the batch, e.g. the ones whose environments answered
+        while the environments of the other games are still stepping. The other games keep their state.
+        The episode must have been started by `act` with the observations of all of the games of the batch.
+
+        Arguments:
+            slot_indices: The indices in the batch of the games of the observations.
+            obs: Previous command's feedback for each of these games.
+            scores: The score obtained so far for each of these games.
+            dones: Whether each of these games is finished.
+            infos: Additional information for each of these games.
+
+        Returns:
+            Text commands to be performed, one per observation.
+        """
+        if not self._epsiode_has_started:
+            raise ValueError("The episode must be started by act() before acting on some of the slots.")
+        return self._act(slot_indices, obs, scores, dones, infos)
+
+    def _act(self, game_indices: Sequence[int], obs: List[str], scores: List[int], dones: List[bool],
+             infos: Dict[str, List[Any]]) -> List[str]:
+        """
+        Acts upon the observations of the games with the given indices in the batch.
+        The other arguments and the commands are in the same order as the indices.
+        """
+        debug = '--debug' in sys.argv
+
+        self._add_features(obs, infos, game_indices)
 
-        result = []
-        for game_index, ob, done, feats in zip(range(len(obs)), obs, dones, self._game_features):
+        result = [None for _ in obs]
+        playing = []
+        for position, game_index, ob, done in zip(range(len(obs)), game_indices, obs, dones):
+            feats = self._game_features[game_index]
             if done:
-                result.append("wait")
+                if not self._dones[game_index]:
+                    self._release_game(game_index)
+                self._branches[game_index] = 'done'
+                result[position] = "wait"
+                continue
+
+            if len(feats) > self._max_features:
+                _compact_features(feats)
+
+            if self._stuck_detectors[game_index].gave_up:
+                # Waiting for the episode to be ended.
+                self._branches[game_index] = 'gave_up'
+                result[position] = "wait"
                 continue
 
             try:
                 current_room_name: str = feats[Feature.CURRENT_ROOM]
-                rooms = self._rooms[game_index]
-
+                if not current_room_name:
+                    raise MapFailure("The current room is not known.")
                 if self._searches[game_index] is not None:
                     self._searches[game_index].visited.add(current_room_name)
                     prev_room: Room = self._searches[game_index].current_room
@@ -616,184 +1680,58 @@ class CustomAgent:
                     prev_room = None
                 self._update_map(game_index,
                                  prev_room, current_room_name, ob)
-                current_room: Room = rooms[current_room_name]
-
-                if feats[Feature.NEED_TO_OPEN_FIRST]:
-                    m = _need_to_open_door_pattern.search(ob)
-                    assert m
-                    result.append(m.group('task'))
-                    continue
-
-                if self._searches[game_index] is not None:
-                    if feats[Feature.YOU_OPENED_DOOR]:
-                        # Optimization: Open the door before getting the error.
-                        direction = self._searches[game_index].prev_direction_traveled
-                        result.append(direction)
-                        continue
-                    # There is a search in progress.
-                    self._searches[game_index].current_room = current_room
-                    if self._searches[game_index].target_name == current_room_name:
-                        # Found target, stop the search.
-                        self._searches[game_index] = None
-                    else:
-                        # Keep searching.
-                        direction = self._searches[game_index].get_next_direction()
-                        if direction is not None:
-                            result.append(direction)
-                            continue
-                        else:
-                            # No path exists.
-                            # TODO Need to backtrack to whatever we were doing before.
-                            self._searches[game_index] = None
-
-                if feats[Feature.CARRYING_TOO_MUCH]:
-                    # Need to drop something.
-                    candidates = tuple(set(_get_carrying(feats)) - set(_get_all_required_ingredients(feats)))
-                    assert len(candidates) > 0
-                    recipe_steps = _get_recipe_steps(feats)
-                    assert len(recipe_steps) > 0
-                    next_recipe_step = recipe_steps[0]
-                    item = random.choice(candidates)
-                    while item in next_recipe_step:
-                        item = random.choice(candidates)
-                    result.append("drop {}".format(item))
-                    feats[_carrying_feat(item)] = False
-                    feats[Feature.NUM_ITEMS_HELD] -= 1
-                    continue
-
-                if not feats[Feature.SEEN_COOKBOOK] and feats[Feature.COOKBOOK_PRESENT]:
-                    result.append("look cookbook")
-                    continue
-
-                if not feats[Feature.DONE_INIT_INVENTORY_CHECK]:
-                    result.append("inventory")
-                    feats[Feature.DONE_INIT_INVENTORY_CHECK] = True
-                    continue
-
-                if not feats[Feature.SEEN_COOKBOOK]:
-                    # Find the Kitchen.
-                    self._searches[game_index] = RoomSearch(rooms, current_room, "Kitchen")
-                    result.append(self._searches[game_index].get_next_direction())
-                    continue
-
-                if current_room_name == "Kitchen" \
-                        and not feats[Feature.FOUND_ALL_INGREDIENTS] \
-                        and not feats[Feature.OPENED_FRIDGE]:
-                    feats[Feature.OPENED_FRIDGE] = True
-                    result.append("open fridge")
-                    continue
-
-                # Check if current room has the ingredient.
-                if not feats[Feature.FOUND_ALL_INGREDIENTS]:
-                    if feats[Feature.NUM_ITEMS_HELD] < _max_capacity:
-                        # See if ingredient is here.
-                        ingredients_here = tuple(
-                            set(_get_all_required_ingredients(feats)) & set(_get_all_present_ingredients(feats)))
-                        if len(ingredients_here) > 0:
-                            ingredient = random.choice(ingredients_here)
-                            result.append("take {}".format(ingredient))
-                            feats[_ingredient_present_feat(ingredient)] = False
-                            feats[_carrying_feat(ingredient)] = True
-                            feats[Feature.NUM_ITEMS_HELD] += 1
-
-                            # Remove required ingredients.
-                            feats[_ingredient_feat(ingredient)] = False
-                            base_ingredient = _base_ingredient(ingredient)
-                            if base_ingredient != ingredient:
-                                feats[_ingredient_feat(base_ingredient)] = False
-                                _remove_recipe_step(feats, _get_recipe_step(ingredient))
-
-                            continue
-
-                    if current_room_name == "Kitchen":
-                        # Go find ingredients.
-                        ingredients_needed = tuple(
-                            set(_get_all_required_ingredients(feats)) - set(_get_all_present_ingredients(feats)))
-                        assert len(ingredients_needed) > 0
-                        direction = None
-                        while len(current_room.directions) > 0 and direction is None:
-                            ingredient = random.choice(ingredients_needed)
-                            room_options = _ingredient_to_rooms[ingredient]
-                            for target_room_name in random.sample(room_options, len(room_options)):
-                                self._searches[game_index] = RoomSearch(rooms, current_room, target_room_name)
-                                direction = self._searches[game_index].get_next_direction()
-                                if direction is not None:
-                                    break
-                                else:
-                                    # No path exists.
-                                    self._searches[game_index] = None
-
-                        # Found a direction to go.
-                        result.append(direction)
-                        continue
-
-                if not feats[Feature.FOUND_ALL_INGREDIENTS] and feats[Feature.NUM_ITEMS_HELD] == _max_capacity:
-                    if current_room_name != "Kitchen":
-                        # Bring items to Kitchen.
-                        self._searches[game_index] = RoomSearch(rooms, current_room, "Kitchen")
-                        direction = self._searches[game_index].get_next_direction()
-                        result.append(direction)
-                        continue
-                    elif not feats[Feature.STARTED_COOKING]:
-                        # In Kitchen.
-                        # Not started cooking.
-                        item = random.choice(_get_carrying(feats))
-                        result.append("drop {}".format(item))
-                        feats[_carrying_feat(item)] = False
-                        feats[Feature.NUM_ITEMS_HELD] -= 1
-                        continue
-
-                # Go through recipe steps.
-                recipe_steps = _get_recipe_steps(feats)
-                if len(recipe_steps) > 0:
-                    next_recipe_step = recipe_steps[0]
-                    if _requires_knife(next_recipe_step) and not feats[Feature.HOLDING_KNIFE]:
-                        if feats[Feature.NUM_ITEMS_HELD] < _max_capacity:
-                            result.append("take knife")
-                            feats[Feature.NUM_ITEMS_HELD] += 1
-                            continue
-                        else:
-                            # Need to drop something.
-                            candidates = tuple(set(_get_carrying(feats)) - set(_get_all_required_ingredients(feats)))
-                            assert len(candidates) > 0
-                            item = random.choice(candidates)
-                            while item in next_recipe_step:
-                                item = random.choice(candidates)
-                            result.append("drop {}".format(item))
-                            feats[_carrying_feat(item)] = False
-                            feats[Feature.NUM_ITEMS_HELD] -= 1
-                            continue
-
-                    if _grill_pattern.match(next_recipe_step) and not feats[Feature.BBQ_PRESENT]:
-                        # Go to the BBQ in the Backyard.
-                        self._searches[game_index] = RoomSearch(rooms, current_room, "Backyard")
-                        direction = self._searches[game_index].get_next_direction()
-                        result.append(direction)
-                        continue
-                    elif (_fry_pattern.match(next_recipe_step)
-                          or _roast_pattern.match(next_recipe_step)
-                          or next_recipe_step == "prepare meal") \
-                            and current_room_name != "Kitchen":
-                        self._searches[game_index] = RoomSearch(rooms, current_room, "Kitchen")
-                        direction = self._searches[game_index].get_next_direction()
-                        result.append(direction)
-                        continue
-
-                    result.append(_commandify_recipe_step(next_recipe_step))
-                    _remove_recipe_step(feats, next_recipe_step)
-                    feats[Feature.STARTED_COOKING] = True
-                    # TODO Maybe remove from required ingredients (remove ingredient feature).
-                    continue
-                else:
-                    # Done
-                    result.append("eat meal")
-                    continue
-            except:
+                playing.append((position, game_index))
+            except Exception as e:
+                if debug:
+                    logging.exception("Will repair.")
+                self._branches[game_index] = 'error'
+                result[position] = self._repair(game_index, e)
+
+        # All of the maps are up to date so the first search for a path computes the paths of all of the maps that
+        # changed at once.
+        for position, game_index in playing:
+            ob = obs[position]
+            feats = self._game_features[game_index]
+            try:
+                current_room_name: str = feats[Feature.CURRENT_ROOM]
+                rooms = self._rooms[game_index]
+                current_room: Room = rooms.get(current_room_name)
+                if current_room is None:
+                    raise MapFailure("The current room {} is not on the map.".format(current_room_name))
+
+                decision = _Decision(game_index, ob, feats, rooms, current_room,
+                                     partial(self._order_recipe_steps, game_index, current_room_name))
+                lookahead_start = {}
+                before_action = None
+                if self._lookahead_depth > 0:
+                    before_action = partial(self._keep_lookahead_start, game_index, current_room_name,
+                                            lookahead_start)
+                branch, command = self._policy.decide(game_index, feats, decision, before_action)
+                if branch in _lookahead_branches and len(lookahead_start) > 0:
+                    better_command = self._lookahead(lookahead_start['world_state'], command)
+                    if better_command is not None:
+                        self.restore_game(game_index, lookahead_start['snapshot'])
+                        branch = 'lookahead'
+                        command = self._apply_lookahead(game_index, current_room_name, better_command)
+                self._branches[game_index] = branch
+                result[position] = command
+                self._failures.succeeded(game_index)
+            except Exception as e:
                 if debug:
-                    logging.exception("Will wait.")
-            result.append(None)
+                    logging.exception("Will repair.")
+                self._branches[game_index] = 'error'
+                result[position] = self._repair(game_index, e)
 
         result = ["wait" if r is None else r for r in result]
+        for position, game_index, done in zip(range(len(obs)), game_indices, dones):
+            open_door_command = None if done else self._open_door_first(game_index, result[position])
+            if open_door_command is not None:
+                result[position] = open_door_command
+                self._branches[game_index] = 'open_door_first'
+        for game_index, ob, score, done, r in zip(game_indices, obs, scores, dones, result):
+            self._dones[game_index] = done
+            if not done:
+                self._stuck_detectors[game_index].record(ob, r, score, self._progress_key(game_index))
         if debug:
             for ob, r in zip(obs, result):
                 print(ob)
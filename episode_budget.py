@@ -0,0 +1,90 @@
+"""
+Decide when the episodes of a game played so far estimate its score and steps well enough to stop playing it.
+
+The agent and many games are deterministic enough that most games give the same result every episode,
+so playing all of the episodes of every game mostly repeats results that are already known.
+A game converged when its first episodes were all won with the same score and steps, or when the 95% confidence
+intervals of its mean score and mean steps, from Student's t-distribution, are narrower than the tolerances.
+
+The intervals treat the episodes as independent, but the agent carries its memory of a game, e.g. its map and recipe,
+to the next episodes, which then tend to take fewer steps.
+Stopping early therefore over-estimates the mean steps of a game a bit,
+and a game whose episodes were all lost the same way is played on since the memory can still make it win.
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+MIN_EPISODES = 3
+"""
+The fewest episodes of a game to play before it can converge.
+"""
+
+SCORE_TOLERANCE = 0.5
+"""
+The largest half-width of the confidence interval of the mean score, in points.
+"""
+
+STEPS_TOLERANCE = 0.1
+"""
+The largest half-width of the confidence interval of the mean steps, relative to the mean steps.
+"""
+
+_t_975 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228)
+"""
+The 97.5% quantiles of Student's t-distribution with 1 to 10 degrees of freedom.
+"""
+
+_z_975 = 1.959964
+
+
+def t_quantile_975(df: int) -> float:
+    """
+    :return: The 97.5% quantile of Student's t-distribution with `df` degrees of freedom,
+        from a table for few degrees of freedom and the Cornish-Fisher expansion around the normal quantile above,
+        which is within 0.002 of it.
+    """
+    if df < 1:
+        raise ValueError("At least 1 degree of freedom is needed, got {}.".format(df))
+    if df <= len(_t_975):
+        return _t_975[df - 1]
+    z = _z_975
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+def _half_width(values: Sequence[float]) -> float:
+    """
+    :return: The half-width of the 95% confidence interval of the mean of the values.
+    """
+    n = len(values)
+    mean = sum(values) / n
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1)
+    return t_quantile_975(n - 1) * math.sqrt(variance / n)
+
+
+def finished_runs(runs: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    :param runs: The runs of a game by episode, `None` for the episodes still being played.
+    :return: The runs before the first episode still being played.
+        Later runs are left out so that the episodes that end first, e.g. the short ones, don't bias the estimates.
+    """
+    for no_episode, run in enumerate(runs):
+        if run is None:
+            return runs[:no_episode]
+    return runs
+
+
+def episodes_converged(runs: List[Optional[Dict[str, Any]]], min_episodes: int = MIN_EPISODES,
+                       score_tolerance: float = SCORE_TOLERANCE, steps_tolerance: float = STEPS_TOLERANCE) -> bool:
+    """
+    :param runs: The runs of a game by episode in the format of the results of test_submission.py,
+        `None` for the episodes still being played.
+    :return: `True` if more episodes of the game are not needed to estimate its mean score and steps.
+    """
+    runs = finished_runs(runs)
+    if len(runs) < max(min_episodes, 2):
+        return False
+    if len({(run["score"], run["steps"], bool(run["has_won"])) for run in runs}) == 1:
+        return bool(runs[0]["has_won"])
+    steps = [run["steps"] for run in runs]
+    return (_half_width([run["score"] for run in runs]) <= score_tolerance
+            and _half_width(steps) <= steps_tolerance * sum(steps) / len(steps))
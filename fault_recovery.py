@@ -0,0 +1,109 @@
+"""
+Classify the failures of the policy and count them so that the agent can repair the state that a failure came from.
+
+Without a repair, the state that made a step fail, e.g. an item believed to be carried or a room missing from the map,
+is still there at the next step, so the next steps fail the same way until the end of the episode.
+"""
+import os
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+
+class AgentFailure(Exception):
+    """
+    The state of a game is not consistent with what the policy expects.
+    """
+    kind = 'unknown'
+
+
+class InventoryFailure(AgentFailure):
+    """
+    What the agent believes that it carries is wrong, e.g. nothing can be dropped while carrying too much.
+    """
+    kind = 'inventory'
+
+
+class RecipeFailure(AgentFailure):
+    """
+    The recipe steps or the ingredients left are not consistent, e.g. exploring for ingredients when none is needed.
+    """
+    kind = 'recipe'
+
+
+class MapFailure(AgentFailure):
+    """
+    The current room or a door is not known as expected.
+    """
+    kind = 'map'
+
+
+kinds = ('inventory', 'recipe', 'map', 'search', 'containers', 'lookahead', 'unknown')
+"""
+The kinds of failures.
+"""
+
+_module_kinds = {
+    'room.py': 'map',
+    'room_search.py': 'search',
+    'batched_paths.py': 'search',
+    'route_planner.py': 'search',
+    'containers.py': 'containers',
+    'world_model.py': 'lookahead',
+    'recipe_scheduler.py': 'recipe',
+    'recipe_cache.py': 'recipe',
+}
+"""
+The kind of the unexpected errors that are raised in each module.
+"""
+
+
+def classify(error: BaseException) -> str:
+    """
+    :return: The kind of the failure: the kind of an `AgentFailure`
+        or else the kind of the innermost module of the agent that the error was raised in.
+    """
+    if isinstance(error, AgentFailure):
+        return error.kind
+    for frame in reversed(traceback.extract_tb(error.__traceback__)):
+        kind = _module_kinds.get(os.path.basename(frame.filename))
+        if kind is not None:
+            return kind
+    return 'unknown'
+
+
+class FailureCounter(object):
+    """
+    Counts the failures of each kind for each game of the batch in its current episode and for all of the games.
+    """
+
+    def __init__(self):
+        self.totals = Counter()
+        self._games: Dict[int, Counter] = {}
+        self._consecutive: Dict[int, int] = {}
+
+    def record(self, game_index: int, kind: str) -> int:
+        """
+        :return: The number of steps in a row that failed for the game, including this one.
+        """
+        self.totals[kind] += 1
+        self._games.setdefault(game_index, Counter())[kind] += 1
+        self._consecutive[game_index] = self._consecutive.get(game_index, 0) + 1
+        return self._consecutive[game_index]
+
+    def succeeded(self, game_index: int) -> None:
+        self._consecutive.pop(game_index, None)
+
+    def reset(self, game_index: int) -> None:
+        """
+        Start counting the failures of a new episode of a game.
+        """
+        self._games.pop(game_index, None)
+        self._consecutive.pop(game_index, None)
+
+    def counts(self, game_index: Optional[int] = None) -> Dict[str, int]:
+        """
+        :return: The failures of each kind for a game in its current episode, or for all of the games if `None`.
+        """
+        counts = self.totals if game_index is None else self._games.get(game_index, Counter())
+        return dict(counts)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+An index of the games of a directory with what previous evaluations learned about them.
+
+Building the manifest walks the directory once. Updating it only hashes the files whose size or modification time
+changed, and evaluations can use the games that it lists without walking the directory.
+Each game has a stable ID from its content so that its history follows it when it is moved or renamed.
+The history of a game is what its last evaluation measured: the duration, the steps and the score.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_manifest_version = 1
+
+_game_extension = '.ulx'
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _find_games(games_dir: str) -> List[str]:
+    """
+    :return: The paths of the games relative to the directory.
+    """
+    result = []
+    for dir_path, dir_names, file_names in os.walk(games_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(_game_extension):
+                result.append(os.path.relpath(os.path.join(dir_path, file_name), games_dir))
+    return result
+
+
+class GameManifest(object):
+    def __init__(self, games_dir: str, path: Optional[str] = None, games: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        :param path: The file of the manifest.
+        :param games: For each game, by its path relative to the games directory:
+            its `id`, `sha256`, `size`, `mtime_ns` and the `history` of its last evaluation.
+        """
+        self.games_dir = os.path.abspath(games_dir)
+        self.path = path
+        self.games: Dict[str, Dict[str, Any]] = games if games is not None else {}
+
+    @classmethod
+    def load(cls, path: str, games_dir: str) -> 'GameManifest':
+        """
+        :return: The manifest in the file, empty if there is no file yet.
+        """
+        if not os.path.exists(path):
+            return cls(games_dir, path)
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != _manifest_version:
+            return cls(games_dir, path)
+        return cls(games_dir, path, data['games'])
+
+    def save(self) -> None:
+        # Write to another file first so that a manifest is never partially written.
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(version=_manifest_version, games=self.games), f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def update(self) -> Tuple[int, int, int]:
+        """
+        Walk the games directory to add the new games, re-hash the changed ones and remove the ones that are gone.
+
+        :return: The number of games that were added, changed and removed.
+        """
+        histories = {entry['id']: entry.get('history') for entry in self.games.values()}
+        games = {}
+        added = changed = 0
+        for relative_path in _find_games(self.games_dir):
+            stat = os.stat(os.path.join(self.games_dir, relative_path))
+            entry = self.games.get(relative_path)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                games[relative_path] = entry
+                continue
+            sha256 = _hash_file(os.path.join(self.games_dir, relative_path))
+            if entry is None:
+                added += 1
+            elif entry['sha256'] != sha256:
+                changed += 1
+            game_id = sha256[:16]
+            new_entry = dict(id=game_id, sha256=sha256, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            # Keep the history of a game that was moved or only touched.
+            history = histories.get(game_id)
+            if history is not None:
+                new_entry['history'] = history
+            games[relative_path] = new_entry
+        removed = len(set(self.games) - set(games))
+        self.games = games
+        return added, changed, removed
+
+    def game_files(self) -> List[str]:
+        return [os.path.join(self.games_dir, relative_path) for relative_path in sorted(self.games)]
+
+    def median_rate(self) -> float:
+        """
+        :return: The median duration per byte of the games that were played,
+            1 if none was played so that the games are estimated by their size.
+        """
+        rates = [e['history']['duration'] / e['size'] for e in self.games.values()
+                 if (e.get('history') or {}).get('duration') is not None and e['size'] > 0]
+        if len(rates) == 0:
+            return 1.0
+        return statistics.median(rates)
+
+    def expected_cost(self, relative_path: str, rate: Optional[float] = None) -> float:
+        """
+        :param rate: The `median_rate`, to only compute it once when estimating many games.
+            It is computed if it's not given.
+        :return: The expected duration of the evaluation of a game: its last duration if it was played
+            or an estimate from its size and the speed of the games that were played.
+        """
+        entry = self.games[relative_path]
+        history = entry.get('history')
+        if history is not None and history.get('duration') is not None:
+            return history['duration']
+        if rate is None:
+            rate = self.median_rate()
+        return rate * entry['size']
+
+    def select(self, num_games: Optional[int] = None, seed: int = 0, longest_first: bool = True) -> List[str]:
+        """
+        :param num_games: Pick this many games at random, the same ones for the same seed and games.
+        :param longest_first: Order the games by their expected cost so that the long games don't end up last
+            in a pool of processes.
+        :return: The paths of the games.
+        """
+        relative_paths = sorted(self.games)
+        if num_games is not None and num_games < len(relative_paths):
+            # Pick by ID so that the subset doesn't depend on where the games are.
+            by_id = sorted(relative_paths, key=lambda p: (self.games[p]['id'], p))
+            relative_paths = sorted(random.Random(seed).sample(by_id, num_games))
+        if longest_first:
+            rate = self.median_rate()
+            relative_paths.sort(key=lambda p: (-self.expected_cost(p, rate), p))
+        return [os.path.join(self.games_dir, relative_path) for relative_path in relative_paths]
+
+    def record_results(self, stats: Dict[str, Any]) -> None:
+        """
+        Keep the results of an evaluation in the history of the games.
+
+        :param stats: The results from `evaluate`. Games are identified by their file name there.
+        """
+        by_name = {}
+        for relative_path in self.games:
+            by_name.setdefault(os.path.basename(relative_path), []).append(relative_path)
+        now = time.time()
+        for game_name, game_stats in stats["games"].items():
+            runs = game_stats["runs"]
+            for relative_path in by_name.get(game_name, ()):
+                entry = self.games[relative_path]
+                previous = entry.get('history') or {}
+                entry['history'] = dict(
+                    evaluations=previous.get('evaluations', 0) + 1,
+                    last_evaluation=now,
+                    duration=game_stats.get("duration"),
+                    episodes=len(runs),
+                    steps=sum(run["steps"] for run in runs),
+                    score=sum(run["score"] for run in runs),
+                    max_score=game_stats.get("max_scores"),
+                )
+
+
+def load_manifest(path: str, games_dir: str, rescan: bool = False) -> GameManifest:
+    """
+    :param rescan: Update the manifest with the games directory even if it lists games already.
+    :return: The manifest, built or updated and saved if needed.
+    """
+    manifest = GameManifest.load(path, games_dir)
+    if rescan or len(manifest.games) == 0:
+        added, changed, removed = manifest.update()
+        print("Games manifest {}: {} games, {} new, {} changed, {} removed.".format(
+            path, len(manifest.games), added, changed, removed))
+        manifest.save()
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the manifest of a directory of games.")
+    parser.add_argument("games_dir")
+    parser.add_argument("manifest")
+    args = parser.parse_args()
+    load_manifest(args.manifest, args.games_dir, rescan=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+A library of the maps of the games played before, to predict where the rooms that were not found yet are.
+
+The cooking games reuse a few room names and layouts.
+A map is fingerprinted by its (room, direction, neighbour) triples.
+Once a new game has a few connections, the best match is the layout that has the most of its triples
+and none that contradict its map, i.e. another neighbour in a direction or an exit that the room doesn't have.
+To explore towards a room that was not found yet, the direction to take is then the one whose neighbour is the closest
+to that room in the best match.
+A wrong prediction is corrected by the move itself: the neighbour that is found contradicts the match,
+so the next lookup uses another layout or none.
+
+Layouts are kept in memory and, if a database path is given, in an SQLite database that the processes share,
+as for `recipe_cache`.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter, deque
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from room import Room
+
+Triple = Tuple[str, str, str]
+"""
+A room, a direction and the room in that direction.
+"""
+
+_max_layouts = 1000
+"""
+The maximum number of layouts kept in the database, the least recently seen ones are evicted first.
+"""
+
+_min_matches = 2
+"""
+The number of triples that a layout must share with the map of a game to be used,
+i.e. one connection seen from both of its rooms.
+"""
+
+
+def default_path() -> Optional[str]:
+    """
+    :return: The database path from the `TW_LAYOUT_LIBRARY` environment variable.
+        `None` if the variable is not set or empty, then layouts are only kept in memory,
+        so that an evaluation never depends on the games that were played before it on the machine.
+    """
+    return os.environ.get('TW_LAYOUT_LIBRARY') or None
+
+
+def fingerprint(rooms: Dict[str, Room]) -> FrozenSet[Triple]:
+    """
+    :return: The known connections of a map.
+    """
+    return frozenset((room.name, direction, neighbour.name)
+                     for room in rooms.values()
+                     for direction, neighbour in room.directions.items()
+                     if neighbour is not None)
+
+
+class _Layout(object):
+    def __init__(self, triples: FrozenSet[Triple], count: int = 1):
+        self.triples = triples
+        self.count = count
+        """
+        The number of maps that this layout was seen in.
+        """
+        self.neighbours: Dict[Tuple[str, str], str] = {}
+        self.exits: Dict[str, Set[str]] = {}
+        for room_name, direction, neighbour in triples:
+            self.neighbours[(room_name, direction)] = neighbour
+            self.exits.setdefault(room_name, set()).add(direction)
+            self.exits.setdefault(neighbour, set())
+        self._distances: Dict[str, Dict[str, int]] = {}
+
+    def contradicts(self, rooms: Dict[str, Room]) -> bool:
+        """
+        :return: `True` if the map has a connection or lacks an exit that rules this layout out.
+        """
+        for room in rooms.values():
+            exits = self.exits.get(room.name)
+            if exits is None:
+                continue
+            if not exits.issubset(room.directions):
+                return True
+            for direction, neighbour in room.directions.items():
+                if neighbour is not None and self.neighbours.get((room.name, direction), neighbour.name) \
+                        != neighbour.name:
+                    return True
+        return False
+
+    def distances_to(self, target_name: str) -> Dict[str, int]:
+        """
+        :return: The number of moves to the target from each room that can reach it.
+        """
+        result = self._distances.get(target_name)
+        if result is None:
+            predecessors: Dict[str, List[str]] = {}
+            for room_name, _, neighbour in self.triples:
+                predecessors.setdefault(neighbour, []).append(room_name)
+            result = {target_name: 0}
+            queue = deque([target_name])
+            while len(queue) > 0:
+                room_name = queue.popleft()
+                for predecessor in predecessors.get(room_name, ()):
+                    if predecessor not in result:
+                        result[predecessor] = result[room_name] + 1
+                        queue.append(predecessor)
+            self._distances[target_name] = result
+        return result
+
+
+class LayoutLibrary(object):
+    """
+    Errors from the database are logged and the library then keeps working in memory only,
+    so a broken or locked database file never stops a game.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_layouts: int = _max_layouts):
+        """
+        :param path: The database file. `None` to only keep the layouts in memory.
+        """
+        self.path = path
+        self._max_layouts = max_layouts
+        self._layouts: Dict[int, _Layout] = {}
+        self._index: Dict[Triple, Set[int]] = {}
+        """
+        The layouts that have each triple.
+        """
+        self._next_id = 0
+        self._connection = None
+        self._connection_pid = None
+        self._last_row = 0
+        """
+        The last row of the database that was read.
+        """
+        self.predictions = 0
+
+    def __len__(self):
+        return len(self._layouts)
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        # Connections can't be used across a fork.
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS layouts ('
+                               'key TEXT PRIMARY KEY, triples TEXT NOT NULL, '
+                               'count INTEGER NOT NULL, last_used REAL NOT NULL)')
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _disable_database(self, error: Exception) -> None:
+        logging.warning("Layout library database %s disabled: %s", self.path, error)
+        self.path = None
+        self._connection = None
+
+    def _remember(self, triples: FrozenSet[Triple], count: int = 1) -> None:
+        """
+        Keep a layout in memory. A layout that is part of a known one only adds to its count,
+        and the known layouts that are part of it are replaced by it.
+        """
+        matches = Counter()
+        for triple in triples:
+            matches.update(self._index.get(triple, ()))
+        for layout_id, num_matches in matches.items():
+            layout = self._layouts[layout_id]
+            if num_matches == len(triples):
+                layout.count += count
+                return
+            if num_matches == len(layout.triples):
+                count += layout.count
+                self._forget(layout_id)
+        layout_id = self._next_id
+        self._next_id += 1
+        self._layouts[layout_id] = _Layout(triples, count)
+        for triple in triples:
+            self._index.setdefault(triple, set()).add(layout_id)
+
+    def _forget(self, layout_id: int) -> None:
+        for triple in self._layouts.pop(layout_id).triples:
+            ids = self._index[triple]
+            ids.discard(layout_id)
+            if len(ids) == 0:
+                del self._index[triple]
+
+    def refresh(self) -> None:
+        """
+        Read the layouts that were added to the database since the last time, e.g. by other processes.
+        """
+        try:
+            connection = self._connect()
+            if connection is not None:
+                rows = connection.execute('SELECT rowid, triples, count FROM layouts WHERE rowid > ? ORDER BY rowid',
+                                          (self._last_row,)).fetchall()
+                for row_id, data, count in rows:
+                    self._remember(frozenset(map(tuple, json.loads(data))), count)
+                    self._last_row = max(self._last_row, row_id)
+        except sqlite3.Error as e:
+            self._disable_database(e)
+
+    def add(self, rooms: Dict[str, Room]) -> None:
+        """
+        Learn the layout of the map of a game.
+        """
+        triples = fingerprint(rooms)
+        if len(triples) < _min_matches:
+            return
+        self._remember(triples)
+        try:
+            connection = self._connect()
+            if connection is not None:
+                data = json.dumps(sorted(triples))
+                key = hashlib.sha256(data.encode('utf-8')).hexdigest()
+                connection.execute('INSERT INTO layouts (key, triples, count, last_used) VALUES (?, ?, 1, ?) '
+                                   'ON CONFLICT(key) DO UPDATE SET count = count + 1, last_used = excluded.last_used',
+                                   (key, data, time.time()))
+                connection.execute('DELETE FROM layouts WHERE key IN '
+                                   '(SELECT key FROM layouts ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                                   (self._max_layouts,))
+                connection.commit()
+        except sqlite3.Error as e:
+            self._disable_database(e)
+
+    def best_match(self, rooms: Dict[str, Room]) -> Optional[_Layout]:
+        """
+        :return: The layout that shares the most connections with the map without contradicting it,
+            the one seen the most often for a tie. `None` if no layout shares enough connections.
+        """
+        matches = Counter()
+        for triple in fingerprint(rooms):
+            matches.update(self._index.get(triple, ()))
+        candidates = sorted(((num_matches, self._layouts[layout_id].count, -layout_id)
+                             for layout_id, num_matches in matches.items() if num_matches >= _min_matches),
+                            reverse=True)
+        for _, _, negative_id in candidates:
+            layout = self._layouts[-negative_id]
+            if not layout.contradicts(rooms):
+                return layout
+        return None
+
+    def direction_towards(self, rooms: Dict[str, Room], current_room_name: str, target_name: str,
+                          options: Iterable[str]) -> Optional[str]:
+        """
+        :param options: The directions that can be explored from the current room.
+        :return: The option whose neighbour is the closest to the target in the best match,
+            `None` if the best match doesn't know how to get there from any option.
+        """
+        layout = self.best_match(rooms)
+        if layout is None:
+            return None
+        distances = layout.distances_to(target_name)
+        best = None
+        for direction in options:
+            distance = distances.get(layout.neighbours.get((current_room_name, direction)))
+            if distance is not None and (best is None or distance < best[0]):
+                best = (distance, direction)
+        if best is None:
+            return None
+        self.predictions += 1
+        return best[1]
+
+    def close(self) -> None:
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
@@ -0,0 +1,124 @@
+"""
+Accounting of the memory of the processes that play games, with `tracemalloc`.
+
+After each game, a process records how much memory is traced, its peak since the previous game
+and how much of it was allocated by each subsystem: each module of this repository and each installed package.
+Over a long run, the traced memory of a process should stay flat from one game to the next.
+Tracing slows Python down so it is only on when asked for, e.g. with `--memory-report`.
+"""
+import os
+import sysconfig
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional
+
+_code_dir = os.path.dirname(os.path.abspath(__file__))
+
+_stdlib_dir = sysconfig.get_paths()['stdlib']
+
+_package_dirs = ('site-packages', 'dist-packages')
+
+
+def subsystem(filename: str) -> str:
+    """
+    :return: The name of the module of this repository, the installed package or `'python'` for the standard library
+        that the file belongs to.
+    """
+    path = os.path.abspath(filename)
+    parts = path.split(os.sep)
+    for package_dir in _package_dirs:
+        if package_dir in parts:
+            index = len(parts) - 1 - parts[::-1].index(package_dir)
+            if index + 1 < len(parts):
+                return os.path.splitext(parts[index + 1])[0]
+    if path.startswith(_code_dir + os.sep):
+        return os.path.splitext(os.path.relpath(path, _code_dir))[0].replace(os.sep, '.')
+    if path.startswith(_stdlib_dir + os.sep):
+        return 'python'
+    return '<other>'
+
+
+class MemoryAccountant(object):
+    """
+    Records the memory of the process after each game.
+    Traces start when the accountant is made, if they weren't started already.
+    """
+
+    def __init__(self, nframes: int = 1):
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(nframes)
+        self._num_games = 0
+
+    def game_done(self) -> Dict[str, Any]:
+        """
+        :return: The memory of the process now that a game is done:
+            `traced_bytes`, `peak_bytes` since the previous game was done and `by_subsystem`, the traced bytes
+            of each subsystem. Games played at the same time in a process share their peaks.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            # Don't count the accounting itself.
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        by_subsystem = defaultdict(int)
+        for stat in snapshot.statistics('filename'):
+            by_subsystem[subsystem(stat.traceback[0].filename)] += stat.size
+        reset_peak = getattr(tracemalloc, 'reset_peak', None)
+        if reset_peak is not None:
+            # Python 3.9+, before that the peak is since the process started.
+            reset_peak()
+        self._num_games += 1
+        return dict(
+            pid=os.getpid(),
+            game_number=self._num_games,
+            traced_bytes=current,
+            peak_bytes=peak,
+            by_subsystem=dict(sorted(by_subsystem.items(), key=lambda item: item[1], reverse=True)),
+        )
+
+    def stop(self) -> None:
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+
+
+_accountant: Optional[MemoryAccountant] = None
+
+
+def get_accountant() -> MemoryAccountant:
+    """
+    :return: The accountant of this process, to use for all of the games that it plays.
+    """
+    global _accountant
+    if _accountant is None:
+        _accountant = MemoryAccountant()
+    return _accountant
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    :param records: The records of the games from `MemoryAccountant.game_done`, from one or more processes.
+    :return: The highest traced and peak bytes, the largest growth of a process from its first game to its last one
+        and the highest traced bytes of each subsystem.
+    """
+    records = list(records)
+    by_process = defaultdict(list)
+    for record in records:
+        by_process[record['pid']].append(record)
+    growth = 0
+    for process_records in by_process.values():
+        process_records.sort(key=lambda r: r['game_number'])
+        growth = max(growth, process_records[-1]['traced_bytes'] - process_records[0]['traced_bytes'])
+    by_subsystem = defaultdict(int)
+    for record in records:
+        for name, size in record['by_subsystem'].items():
+            by_subsystem[name] = max(by_subsystem[name], size)
+    return dict(
+        games=len(records),
+        processes=len(by_process),
+        max_traced_bytes=max((r['traced_bytes'] for r in records), default=0),
+        max_peak_bytes=max((r['peak_bytes'] for r in records), default=0),
+        growth_bytes=growth,
+        by_subsystem=dict(sorted(by_subsystem.items(), key=lambda item: item[1], reverse=True)),
+    )
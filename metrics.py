@@ -0,0 +1,257 @@
+"""
+Live metrics of an evaluation in the Prometheus text exposition format.
+
+The processes that play games send events through a queue with a `MetricsReporter`.
+A `MetricsExporter` in the main process collects them into `EvaluationMetrics`
+and periodically rewrites a metrics file and/or serves them over HTTP.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Iterable, List, Optional
+
+_latency_window = 10000
+"""
+The number of recent latencies that the quantiles are computed from.
+"""
+
+_score_window = 100
+"""
+The number of recent episodes that the rolling average score is computed from.
+"""
+
+_quantiles = (0.5, 0.95, 0.99)
+
+_prefix = 'tw_eval_'
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if len(sorted_values) == 0:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+class EvaluationMetrics(object):
+    """
+    Aggregates the events of an evaluation.
+    """
+
+    def __init__(self, total_games: int = 0, latency_window: int = _latency_window, score_window: int = _score_window):
+        self.start_time = time.time()
+        self.total_games = total_games
+        self.games_started = 0
+        self.games_done = 0
+        self.failures = 0
+        self.episodes = 0
+        self.steps = 0
+        self._latencies = dict(agent=deque(maxlen=latency_window), env=deque(maxlen=latency_window))
+        self._scores = deque(maxlen=score_window)
+        self._busy_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def handle(self, event: tuple) -> None:
+        """
+        Apply an event sent by a `MetricsReporter`.
+        """
+        kind, worker = event[0], str(event[1])
+        with self._lock:
+            if kind == 'game_started':
+                self.games_started += 1
+            elif kind == 'game_done':
+                self.games_done += 1
+            elif kind == 'failure':
+                self.failures += 1
+                self.games_done += 1
+            elif kind == 'steps':
+                _, _, agent_latencies, env_latencies, num_steps, busy_seconds, scores = event
+                self._latencies['agent'].extend(agent_latencies)
+                self._latencies['env'].extend(env_latencies)
+                self.steps += num_steps
+                self._busy_seconds[worker] = self._busy_seconds.get(worker, 0.0) + busy_seconds
+                self.episodes += len(scores)
+                self._scores.extend(scores)
+            else:
+                raise ValueError("Unknown metrics event: {}".format(kind))
+
+    def render(self) -> str:
+        """
+        :return: The metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            elapsed = max(time.time() - self.start_time, 1e-9)
+            lines = []
+
+            def add(name, kind, help_text, samples):
+                lines.append('# HELP {}{} {}'.format(_prefix, name, help_text))
+                lines.append('# TYPE {}{} {}'.format(_prefix, name, kind))
+                for labels, value in samples:
+                    label_text = ','.join('{}="{}"'.format(k, v) for k, v in labels)
+                    if label_text:
+                        label_text = '{' + label_text + '}'
+                    lines.append('{}{}{} {}'.format(_prefix, name, label_text, repr(float(value))))
+
+            add('elapsed_seconds', 'gauge', "Time since the evaluation started.", [((), elapsed)])
+            add('games_done_total', 'counter', "Games with all of their episodes done.", [((), self.games_done)])
+            add('games_per_second', 'gauge', "Games done per second.", [((), self.games_done / elapsed)])
+            add('episodes_total', 'counter', "Episodes done.", [((), self.episodes)])
+            add('steps_total', 'counter', "Steps played.", [((), self.steps)])
+            add('steps_per_second', 'gauge', "Steps played per second.", [((), self.steps / elapsed)])
+            add('queue_depth', 'gauge', "Games that were not started yet.",
+                [((), max(self.total_games - self.games_started, 0))])
+            add('failures_total', 'counter', "Games that failed with an error.", [((), self.failures)])
+            add('rolling_score', 'gauge', "The average score of the last {} episodes.".format(self._scores.maxlen),
+                [((), sum(self._scores) / len(self._scores) if len(self._scores) > 0 else float('nan'))])
+            add('worker_utilization', 'gauge', "The fraction of the time that each worker spent playing.",
+                [((('worker', worker),), busy / elapsed) for worker, busy in sorted(self._busy_seconds.items())])
+
+            samples = []
+            for part, latencies in sorted(self._latencies.items()):
+                values = sorted(latencies)
+                for q in _quantiles:
+                    samples.append(((('part', part), ('quantile', q)), _quantile(values, q)))
+            add('step_latency_seconds', 'summary',
+                "The time per step spent choosing the action (agent) and playing it (env).", samples)
+            return '\n'.join(lines) + '\n'
+
+
+class MetricsReporter(object):
+    """
+    Sends the events of one worker.
+    Failures are reported by the main process with a `('failure', worker)` event since a failed worker can't.
+    Step timings are buffered and sent at the end of each episode to keep the queue traffic low.
+    """
+
+    def __init__(self, events_queue):
+        self._queue = events_queue
+        self._worker = os.getpid()
+        self._agent_latencies: List[float] = []
+        self._env_latencies: List[float] = []
+        self._num_steps = 0
+        self._busy_seconds = 0.0
+
+    def game_started(self) -> None:
+        self._queue.put(('game_started', self._worker))
+
+    def game_done(self) -> None:
+        self.flush()
+        self._queue.put(('game_done', self._worker))
+
+    def add_step(self, agent_seconds: float, env_seconds: float, num_steps: int = 1) -> None:
+        """
+        :param agent_seconds: The time to choose the actions.
+        :param env_seconds: The time to play them.
+        :param num_steps: The number of games that played a step, more than 1 when the step was for a batch.
+        """
+        self._agent_latencies.append(agent_seconds)
+        self._env_latencies.append(env_seconds)
+        self._num_steps += num_steps
+        self._busy_seconds += agent_seconds + env_seconds
+
+    def episodes_done(self, scores: Iterable[int]) -> None:
+        self.flush(scores)
+
+    def flush(self, scores: Iterable[int] = ()) -> None:
+        scores = list(scores)
+        if self._num_steps == 0 and len(scores) == 0:
+            return
+        self._queue.put(('steps', self._worker, self._agent_latencies, self._env_latencies, self._num_steps,
+                         self._busy_seconds, scores))
+        self._agent_latencies = []
+        self._env_latencies = []
+        self._num_steps = 0
+        self._busy_seconds = 0.0
+
+
+class MetricsExporter(object):
+    """
+    Collects the events from the queue in a background thread
+    and exposes the metrics in a file that is rewritten every `interval` seconds and/or over HTTP.
+    """
+
+    def __init__(self, metrics: EvaluationMetrics, events_queue, path: Optional[str] = None,
+                 port: Optional[int] = None, interval: float = 5.0):
+        self.metrics = metrics
+        self._queue = events_queue
+        self._path = path
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self._server = None
+        if port is not None:
+            exporter_metrics = metrics
+
+            class _Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = exporter_metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = HTTPServer(('127.0.0.1', port), _Handler)
+            self._server_thread = threading.Thread(target=self._server.serve_forever, name='metrics-server',
+                                                   daemon=True)
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._server.server_address[1] if self._server is not None else None
+
+    def start(self) -> 'MetricsExporter':
+        self._thread.start()
+        if self._server is not None:
+            self._server_thread.start()
+        return self
+
+    def drain(self) -> None:
+        """
+        Apply the events that are waiting in the queue.
+        """
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self.metrics.handle(event)
+
+    def write(self) -> None:
+        if self._path is None:
+            return
+        # Write to another file first so that readers never see a partial file.
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self._path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self.drain()
+            self.write()
+
+    def stop(self) -> None:
+        """
+        Stop the background work and write the final metrics.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.drain()
+        self.write()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -2,4 +2,4 @@
 
 set -e
 
-zip no-rulez.zip __init__.py custom_agent.py room.py room_search.py metadata Dockerimage
+zip no-rulez.zip __init__.py custom_agent.py room.py room_search.py route_planner.py stuck_detector.py containers.py recipe_cache.py rule_engine.py world_model.py recipe_scheduler.py batched_paths.py fault_recovery.py layout_library.py metadata Dockerimage
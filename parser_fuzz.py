@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Fuzz and stress the parsers of the agent with long and pathological observations.
+
+Each parser is timed on observations of growing sizes from each generator, e.g. a long line that repeats the start of
+a pattern without its end, long runs of spaces or characters that have a special meaning in regular expressions.
+The growth of the time with the size is fit on a log-log scale: an exponent well above 1 means that the parser is
+super-linear, e.g. a regular expression that backtracks from every start, so one weird observation could stall a worker.
+Random observations made of the words that the parsers look for also check that the parsers don't raise.
+
+Example:
+    python parser_fuzz.py --sizes 2000 4000 8000 16000
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from containers import _parse_items, ContainerTracker
+from custom_agent import (
+    _gather_inventory,
+    _get_doors,
+    _get_ingredients_present,
+    _need_to_open_door_pattern,
+    _parse_recipe,
+    _recipe_text,
+    _you_open_door_pattern,
+    CustomAgent,
+)
+
+_default_sizes = (2000, 4000, 8000, 16000)
+
+_max_exponent = 1.5
+"""
+The largest growth exponent of the time with the size that is considered linear, allowing for noise.
+"""
+
+_min_timing = 2e-3
+"""
+Fast parsers are called again until the calls take at least this many seconds, to time them precisely.
+"""
+
+_repeat = 3
+
+_max_seconds = 1.0
+"""
+Larger sizes are not tried once a single call takes longer than this, it is already too slow.
+"""
+
+_ingredient_candidates = [
+    "red hot pepper", "yellow bell pepper", "carrot", "black pepper", "hot pepper", "bell pepper",
+    "sliced red hot pepper", "fried red hot pepper", "chopped carrot", "roasted carrot",
+    "tofu (firm)", "c++ carrot", ".*", "[a-z",
+]
+"""
+The names of the ingredients looked for, including names with characters that are special in regular expressions.
+"""
+
+_pattern_starts = [
+    "You have to open the ", "You open the ", "You open ", "closed ", "open ", "opened ", "-=", "-= ",
+    "The ", "On the ", "You take the ", "Ingredients:\n", "Directions:\n", "There is a closed ",
+]
+"""
+Repeated without their ends, the starts of what the parsers look for make backtracking patterns try every start.
+"""
+
+_vocabulary = [
+    "You", "have", "to", "open", "opened", "closed", "the", "a", "door", "wooden", "frosted-glass", "leading",
+    "first", "north", "east", "south", "west", "-=", "=-", "Kitchen", "contains", "is", "empty", "revealing", "On",
+    "you", "see", "take", "from", "fridge", "knife", "carrot", "red", "hot", "pepper", "and", ",", ".", "!", "\n",
+    "\n\n", "  ", "Ingredients:", "Directions:", "fry", "slice", "(", ")", "[", "*", "+", "?", "\\", "=",
+]
+
+_room_ob = """
+-= Kitchen =-
+You've entered a kitchen.
+
+You see a closed fridge. You make out an oven. You can make out a table. On the table you make out a cookbook.
+You see a counter. On the counter you can see a knife and a red apple. You can see a stove.
+
+There is a closed wooden door leading west. You need an exit without a door? You should try going east.
+There is an exit to the south.
+"""
+
+
+def _repeat_to(text: str, size: int) -> str:
+    return (text * (size // max(len(text), 1) + 1))[:size]
+
+
+def _repeated_start(start: str) -> Callable[[int, random.Random], str]:
+    return lambda size, rng: _repeat_to(start, size)
+
+
+def _word_soup(size: int, rng: random.Random) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_vocabulary)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def _special_characters(size: int, rng: random.Random) -> str:
+    return ''.join(rng.choice("()[]{}.*+?\\|^$-= \nabc") for _ in range(size))
+
+
+generators: Dict[str, Callable[[int, random.Random], str]] = {
+    **{"repeat {!r}".format(start): _repeated_start(start) for start in _pattern_starts},
+    "long word": lambda size, rng: "There is a closed " + "x" * size,
+    "spaces": lambda size, rng: "-=" + " " * size,
+    "newlines": lambda size, rng: "-=" + "\n" * size,
+    "one long line": lambda size, rng: _repeat_to(_room_ob.replace('\n', ' '), size),
+    "many rooms": lambda size, rng: _repeat_to(_room_ob, size),
+    "word soup": _word_soup,
+    "special characters": _special_characters,
+}
+"""
+Make an observation of about the given size.
+"""
+
+
+def _add_features(ob: str) -> None:
+    agent = CustomAgent()
+    agent._start_episode([ob], {})
+    agent._add_features([ob], {})
+
+
+parsers: Dict[str, Callable[[str], Any]] = {
+    '_get_doors': _get_doors,
+    '_need_to_open_door_pattern': _need_to_open_door_pattern.search,
+    '_you_open_door_pattern': _you_open_door_pattern.search,
+    'CustomAgent._get_room_name': CustomAgent._get_room_name,
+    '_get_ingredients_present': lambda ob: _get_ingredients_present(ob, _ingredient_candidates),
+    '_gather_inventory': _gather_inventory,
+    '_parse_recipe': lambda ob: _parse_recipe(_recipe_text(ob)),
+    '_parse_items': _parse_items,
+    'ContainerTracker.update': lambda ob: ContainerTracker().update("Kitchen", ob),
+    'CustomAgent._add_features': _add_features,
+}
+
+
+def _time(parser: Callable[[str], Any], ob: str, repeat: int = _repeat) -> float:
+    """
+    :return: The best time of a call, in seconds.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            parser(ob)
+        elapsed = time.perf_counter() - start
+        if elapsed >= _min_timing:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        if best > _max_seconds:
+            break
+        start = time.perf_counter()
+        for _ in range(number):
+            parser(ob)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def growth_exponent(sizes: Sequence[int], seconds: Sequence[float]) -> Optional[float]:
+    """
+    :return: The slope of the least squares fit of the logarithm of the time by the logarithm of the size,
+        e.g. 1 for linear and 2 for quadratic, `None` with fewer than 2 sizes.
+    """
+    if len(sizes) < 2:
+        return None
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(s, 1e-9)) for s in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+
+
+def stress(parser: Callable[[str], Any], generator: Callable[[int, random.Random], str],
+           sizes: Sequence[int] = _default_sizes, seed: int = 0) -> Dict[str, Any]:
+    """
+    :return: The sizes tried, the time of a call for each size, the growth exponent,
+        if the parser is super-linear and the error if the parser raised.
+    """
+    tried = []
+    seconds = []
+    error = None
+    for size in sorted(sizes):
+        ob = generator(size, random.Random(seed))
+        try:
+            elapsed = _time(parser, ob)
+        except Exception as e:
+            error = "{} on {} characters: {}".format(type(e).__name__, size, e)
+            break
+        tried.append(size)
+        seconds.append(elapsed)
+        if elapsed > _max_seconds:
+            break
+    exponent = growth_exponent(tried, seconds)
+    return dict(sizes=tried, seconds=seconds, exponent=exponent,
+                super_linear=exponent is not None and exponent > _max_exponent, error=error)
+
+
+def run(sizes: Sequence[int] = _default_sizes, seed: int = 0,
+        selected_parsers: Optional[Dict[str, Callable[[str], Any]]] = None,
+        selected_generators: Optional[Dict[str, Callable[[int, random.Random], str]]] = None) -> Dict[str, Any]:
+    """
+    Stress each parser with each generator.
+
+    :return: The results of each parser and generator, the worst time of each parser at the largest size
+        and with which generator, the results that are super-linear and the ones that raised.
+    """
+    selected_parsers = parsers if selected_parsers is None else selected_parsers
+    selected_generators = generators if selected_generators is None else selected_generators
+    results = []
+    worst = {}
+    for parser_name, parser in selected_parsers.items():
+        for generator_name, generator in selected_generators.items():
+            result = dict(parser=parser_name, generator=generator_name,
+                          **stress(parser, generator, sizes, seed))
+            results.append(result)
+            if result['seconds']:
+                largest = dict(seconds=result['seconds'][-1], size=result['sizes'][-1], generator=generator_name)
+                known = worst.get(parser_name)
+                if known is None or (largest['size'], largest['seconds']) > (known['size'], known['seconds']):
+                    worst[parser_name] = largest
+    return dict(results=results, worst=worst,
+                super_linear=[result for result in results if result['super_linear']],
+                errors=[result for result in results if result['error'] is not None])
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = ["Worst time per parser:"]
+    for parser_name, worst in sorted(report['worst'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append("  {:<28} {:>10.3f} ms on {} characters of {}".format(
+            parser_name, worst['seconds'] * 1000, worst['size'], worst['generator']))
+    for title, key in (("Super-linear:", 'super_linear'), ("Errors:", 'errors')):
+        if report[key]:
+            lines.append(title)
+            for result in report[key]:
+                exponent = result['exponent']
+                lines.append("  {} with {}: exponent {}, {}".format(
+                    result['parser'], result['generator'],
+                    "{:.2f}".format(exponent) if exponent is not None else "-",
+                    result['error'] or "{:.3f} ms on {} characters".format(result['seconds'][-1] * 1000,
+                                                                         result['sizes'][-1])))
+    if not report['super_linear'] and not report['errors']:
+        lines.append("All parsers are linear.")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Find observations that make the parsers of the agent slow or fail.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(_default_sizes),
+                        help="The sizes of the observations, in characters.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--parsers', nargs='+', choices=sorted(parsers), help="Only stress these parsers.")
+    args = parser.parse_args(argv)
+    selected_parsers = {name: parsers[name] for name in args.parsers} if args.parsers else None
+    report = run(args.sizes, args.seed, selected_parsers)
+    print(format_report(report))
+    return 1 if report['super_linear'] or report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+A content-addressed cache of parsed recipes.
+
+Entries are keyed by a hash of the recipe text so that a cookbook is parsed once for all of the episodes
+and all of the games that have the same recipe.
+Entries are kept in memory and, if a database path is given, in an SQLite database that the processes share.
+The database is bounded in size: the least recently used entries are evicted first.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+_default_max_bytes = 16 * 1024 * 1024
+"""
+The maximum total size of the values in the database.
+"""
+
+_memory_entries = 256
+"""
+The number of entries kept in memory in each process.
+"""
+
+
+def default_path() -> Optional[str]:
+    """
+    :return: The database path from the `TW_RECIPE_CACHE` environment variable.
+        `None` if the variable is not set or empty, then recipes are only cached in memory,
+        so that an evaluation never depends on the ones that ran before it on the machine.
+    """
+    return os.environ.get('TW_RECIPE_CACHE') or None
+
+
+class RecipeCache(object):
+    """
+    Errors from the database are logged and the cache then keeps working in memory only,
+    so a broken or locked database file never stops a game.
+    """
+
+    def __init__(self, path: Optional[str] = None, version: int = 0, max_bytes: int = _default_max_bytes,
+                 memory_entries: int = _memory_entries):
+        """
+        :param path: The database file. `None` to only cache in memory.
+        :param version: The version of the parser. Entries of other versions are never returned.
+        """
+        self.path = path
+        self._version = version
+        self._max_bytes = max_bytes
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_entries = memory_entries
+        self._connection = None
+        self._connection_pid = None
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256('{}\n{}'.format(self._version, text).encode('utf-8')).hexdigest()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        # Connections can't be used across a fork.
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS recipes ('
+                               'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                               'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+            connection.commit()
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _disable_database(self, error: Exception) -> None:
+        logging.warning("Recipe cache database %s disabled: %s", self.path, error)
+        self.path = None
+        self._connection = None
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        :return: The value cached for the text or `None`.
+        """
+        key = self._key(text)
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            return result
+        try:
+            connection = self._connect()
+            if connection is not None:
+                row = connection.execute('SELECT value FROM recipes WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    connection.execute('UPDATE recipes SET last_used = ? WHERE key = ?', (time.time(), key))
+                    connection.commit()
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+        except sqlite3.Error as e:
+            self._disable_database(e)
+        return result
+
+    def put(self, text: str, value: Dict[str, Any]) -> None:
+        key = self._key(text)
+        self._remember(key, value)
+        try:
+            connection = self._connect()
+            if connection is not None:
+                data = json.dumps(value)
+                connection.execute('INSERT OR REPLACE INTO recipes (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                                   (key, data, len(data), time.time()))
+                self._evict(connection)
+                connection.commit()
+        except sqlite3.Error as e:
+            self._disable_database(e)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        total = 0
+        evicted = []
+        for key, size in connection.execute('SELECT key, size FROM recipes ORDER BY last_used DESC'):
+            total += size
+            if total > self._max_bytes:
+                evicted.append((key,))
+        if len(evicted) > 0:
+            connection.executemany('DELETE FROM recipes WHERE key = ?', evicted)
+
+    def get_or_parse(self, text: str, parse: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        :return: The cached value for the text, parsing it with `parse` and caching the result if it is not cached.
+        """
+        result = self.get(text)
+        if result is None:
+            self.misses += 1
+            result = parse(text)
+            self.put(text, result)
+        else:
+            self.hits += 1
+        return result
+
+    def close(self) -> None:
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
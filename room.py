@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Optional, Union
 
 
 class Room(object):
@@ -8,6 +8,40 @@ class Room(object):
             self.directions = dict.fromkeys(directions)
         else:
             self.directions = directions
+        self.doors = dict()
+        """
+        The name of the door for each direction that has one.
+        """
+        self.closed_doors = set()
+        """
+        The directions with a door that is known to be closed.
+        """
+
+    def set_door(self, direction: str, door: str, is_open: bool) -> bool:
+        """
+        :return: `True` if the cost to go in the direction changed.
+        """
+        self.doors[direction] = door
+        was_closed = direction in self.closed_doors
+        if is_open:
+            self.closed_doors.discard(direction)
+        else:
+            self.closed_doors.add(direction)
+        return was_closed == is_open
+
+    def get_closed_door(self, direction: str) -> Optional[str]:
+        """
+        :return: The name of the door that needs to be opened before going in the direction, if any.
+        """
+        if direction in self.closed_doors:
+            return self.doors[direction]
+        return None
+
+    def step_cost(self, direction: str) -> int:
+        """
+        :return: The number of commands needed to go in the direction.
+        """
+        return 2 if direction in self.closed_doors else 1
 
     def __repr__(self):
         directions = {direction: room.name if room is not None else None for (direction, room) in
@@ -1,4 +1,6 @@
+import heapq
 import random
+from typing import Callable, List, Optional
 
 from room import Room
 
@@ -20,8 +22,23 @@ class RoomSearch(object):
     but it should be made smarter to know things like the Kitchen is near the Living Room.
     """
 
-    def __init__(self, rooms: dict, current_room: Room, target_name: str):
+    def __init__(self, rooms: dict, current_room: Room, target_name: str, explore_order: str = 'random',
+                 find_path: Optional[Callable[[str, str], Optional[List[str]]]] = None,
+                 predict_direction: Optional[Callable[[str, str, List[str]], Optional[str]]] = None):
+        """
+        :param explore_order: How to pick among the directions that were not explored yet:
+            'random' or 'fixed' to always take the first one in the order the room lists them.
+        :param find_path: Gives the directions of a shortest path between two rooms from paths that were computed
+            already, e.g. `BatchedPaths.path`, instead of searching the map.
+        :param predict_direction: Picks, from the current room, the target and the directions that were not explored
+            yet, the one that probably leads to the target, e.g. `LayoutLibrary.direction_towards`.
+            `None` when it can't tell, then `explore_order` is used.
+        """
+        assert explore_order in ('random', 'fixed'), "Unknown explore order: {}".format(explore_order)
         self._rooms = rooms
+        self._explore_order = explore_order
+        self._find_path = find_path
+        self._predict_direction = predict_direction
         self.current_room = current_room
         self.target_name = target_name
         self.optimal_path = None
@@ -58,25 +75,46 @@ class RoomSearch(object):
                     result = self.optimal_path.pop(0)
                     self.prev_direction_traveled = result
                     return result
-            result = random.choice(direction_options)
+            if self._predict_direction is not None:
+                result = self._predict_direction(self.current_room.name, self.target_name, direction_options)
+            if result is None:
+                if self._explore_order == 'random':
+                    result = random.choice(direction_options)
+                else:
+                    result = direction_options[0]
             # If we reach a dead-end then we should come back to here.
             self._backtrack_stack.append(self.current_room.name)
         self.prev_direction_traveled = result
         return result
 
     def get_path_to(self, target_room_name: str):
-        queue = [self.current_room]
+        """
+        :return: The directions of the path with the fewest commands to the target.
+            Going through a closed door costs one more command to open it.
+        """
+        if self._find_path is not None:
+            path = self._find_path(self.current_room.name, target_room_name)
+            if path is not None:
+                return path
+        queue = [(0, 0, self.current_room)]
         paths = {self.current_room.name: []}
-        found = False
-        while not found and len(queue) > 0:
-            current_room = queue.pop(0)
+        costs = {self.current_room.name: 0}
+        # Breaks ties between rooms with the same cost in the order they were found.
+        num_queued = 1
+        while len(queue) > 0:
+            cost, _, current_room = heapq.heappop(queue)
+            if current_room.name == target_room_name:
+                break
+            if cost > costs[current_room.name]:
+                # Already found a cheaper path to this room.
+                continue
             path_so_far = paths[current_room.name]
             for direction, room in current_room.directions.items():
                 if room is not None:
-                    if room.name not in paths:
+                    room_cost = cost + current_room.step_cost(direction)
+                    if room.name not in costs or room_cost < costs[room.name]:
+                        costs[room.name] = room_cost
                         paths[room.name] = path_so_far + [direction]
-                        queue.append(room)
-                    if room.name == target_room_name:
-                        found = True
-                        break
+                        heapq.heappush(queue, (room_cost, num_queued, room))
+                        num_queued += 1
         return paths[target_room_name]
@@ -0,0 +1,166 @@
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional
+
+from room import Room
+
+_exact_max_stops = 8
+"""
+The maximum number of stops for which the best visiting order is computed exactly.
+Larger sets of stops use a nearest neighbour tour improved with 2-opt.
+"""
+
+
+class RoutePlanner(object):
+    """
+    Plans a short order to visit several rooms of the discovered map.
+
+    The shortest distances between every pair of known rooms are cached
+    and updated incrementally as rooms and connections are discovered.
+    """
+
+    def __init__(self):
+        self._distances: Dict[str, Dict[str, int]] = {}
+        self._connections = dict()
+
+    def __contains__(self, room_name: str) -> bool:
+        return room_name in self._distances
+
+    def add_room(self, room_name: str) -> None:
+        if room_name in self._distances:
+            return
+        for distances in self._distances.values():
+            distances[room_name] = None
+        self._distances[room_name] = dict.fromkeys(self._distances)
+        self._distances[room_name][room_name] = 0
+
+    def add_connection(self, from_name: str, to_name: str, cost: int = 1) -> None:
+        """
+        Add a connection that can be travelled both ways.
+        Only pairs of rooms whose shortest distance can go through the new connection are updated.
+        """
+        key = frozenset((from_name, to_name))
+        known_cost = self._connections.get(key)
+        if known_cost is not None and known_cost <= cost:
+            return
+        self._connections[key] = cost
+        self.add_room(from_name)
+        self.add_room(to_name)
+        to_from = {name: distances[from_name] for name, distances in self._distances.items()}
+        to_to = {name: distances[to_name] for name, distances in self._distances.items()}
+        for x, distances in self._distances.items():
+            for y in distances:
+                best = distances[y]
+                for a, b in ((to_from, to_to), (to_to, to_from)):
+                    if a[x] is not None and b[y] is not None:
+                        candidate = a[x] + cost + b[y]
+                        if best is None or candidate < best:
+                            best = candidate
+                distances[y] = best
+
+    def update_from_rooms(self, rooms: Dict[str, Room]) -> None:
+        for room in rooms.values():
+            self.add_room(room.name)
+            for direction, to_room in room.directions.items():
+                if to_room is not None:
+                    self.add_connection(room.name, to_room.name)
+
+    def distance(self, from_name: str, to_name: str) -> Optional[int]:
+        distances = self._distances.get(from_name)
+        if distances is None:
+            return None
+        return distances.get(to_name)
+
+    def plan_route(self, start: str, stops: Iterable[str], end: Optional[str] = None) -> List[str]:
+        """
+        :param start: The room to start from.
+        :param stops: The rooms to visit in any order.
+        :param end: A room to finish in, after all of the stops.
+        :return: The stops in the order to visit them, followed by `end` if given.
+            Stops that cannot be reached from `start` are left out.
+        """
+        if start not in self._distances:
+            return []
+        stops = [stop for stop in dict.fromkeys(stops)
+                 if stop != start and stop != end and self.distance(start, stop) is not None]
+        if end is not None and self.distance(start, end) is None:
+            end = None
+        if len(stops) <= _exact_max_stops:
+            order = self._exact_order(start, stops, end)
+        else:
+            order = self._two_opt(start, self._nearest_neighbour_order(start, stops), end)
+        if end is not None:
+            order.append(end)
+        return order
+
+    def route_length(self, start: str, route: List[str]) -> int:
+        result = 0
+        prev = start
+        for room_name in route:
+            result += self._dist(prev, room_name)
+            prev = room_name
+        return result
+
+    def _dist(self, from_name: str, to_name: Optional[str]) -> float:
+        if to_name is None:
+            return 0
+        result = self.distance(from_name, to_name)
+        return float('inf') if result is None else result
+
+    def _exact_order(self, start: str, stops: List[str], end: Optional[str]) -> List[str]:
+        # Held-Karp: best[(visited, last)] is the cost of the shortest route from start through visited ending at last.
+        if len(stops) == 0:
+            return []
+        best = {}
+        for i, stop in enumerate(stops):
+            best[(1 << i, i)] = (self._dist(start, stop), None)
+        for size in range(2, len(stops) + 1):
+            for subset in combinations(range(len(stops)), size):
+                visited = 0
+                for i in subset:
+                    visited |= 1 << i
+                for last in subset:
+                    prev_visited = visited & ~(1 << last)
+                    best[(visited, last)] = min(
+                        (best[(prev_visited, prev)][0] + self._dist(stops[prev], stops[last]), prev)
+                        for prev in subset if prev != last)
+        visited = (1 << len(stops)) - 1
+        last = min(range(len(stops)),
+                   key=lambda i: best[(visited, i)][0] + self._dist(stops[i], end))
+        order = []
+        while last is not None:
+            order.append(stops[last])
+            prev = best[(visited, last)][1]
+            visited &= ~(1 << last)
+            last = prev
+        order.reverse()
+        return order
+
+    def _nearest_neighbour_order(self, start: str, stops: List[str]) -> List[str]:
+        remaining = list(stops)
+        order = []
+        current = start
+        while len(remaining) > 0:
+            current = min(remaining, key=lambda stop: self._dist(current, stop))
+            remaining.remove(current)
+            order.append(current)
+        return order
+
+    def _two_opt(self, start: str, order: List[str], end: Optional[str]) -> List[str]:
+        def cost(route):
+            result = self.route_length(start, route)
+            if end is not None:
+                result += self._dist(route[-1], end)
+            return result
+
+        best_cost = cost(order)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 2, len(order) + 1):
+                    candidate = order[:i] + order[i:j][::-1] + order[j:]
+                    candidate_cost = cost(candidate)
+                    if candidate_cost < best_cost:
+                        order, best_cost = candidate, candidate_cost
+                        improved = True
+        return order
@@ -0,0 +1,126 @@
+"""
+A table-driven decision engine.
+
+A policy is an ordered table of rules. The first rule whose predicate holds and whose action produces a command wins.
+Hit and latency counters are kept for each rule to see which rules decide the steps and which ones cost the most time.
+"""
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+
+class Rule(object):
+    def __init__(self, name: str, action: Callable[[Any], Optional[str]],
+                 predicate: Optional[Callable[[Any], bool]] = None,
+                 inputs: Optional[Sequence[Hashable]] = None):
+        """
+        :param name: The name of the rule, also used as the name of the branch that chose the command.
+        :param action: Makes the command from the context.
+            Returns `None` when the rule does not apply after all, then the next rules are tried.
+        :param predicate: If the rule applies to the context. `None` if it always applies.
+        :param inputs: The features that the predicate reads, if it only reads features.
+            While they keep the same values, the predicate isn't evaluated again for the same game.
+        """
+        self.name = name
+        self.action = action
+        self.predicate = predicate
+        self.inputs = tuple(inputs) if inputs is not None else None
+
+
+class RuleStats(object):
+    def __init__(self):
+        self.evaluations = 0
+        """
+        The number of times that the predicate was evaluated.
+        """
+        self.skipped = 0
+        """
+        The number of times that the predicate wasn't evaluated because its inputs did not change.
+        """
+        self.matches = 0
+        self.hits = 0
+        """
+        The number of times that the rule chose the command.
+        """
+        self.seconds = 0.0
+        """
+        The time spent in the predicate and the action.
+        """
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(evaluations=self.evaluations, skipped=self.skipped, matches=self.matches, hits=self.hits,
+                    seconds=self.seconds)
+
+
+class RuleEngine(object):
+    def __init__(self, rules: Sequence[Rule]):
+        names = [rule.name for rule in rules]
+        assert len(set(names)) == len(names), "Rule names must be unique."
+        self.rules = list(rules)
+        self.stats: Dict[str, RuleStats] = {rule.name: RuleStats() for rule in rules}
+        self._memos: Dict[int, Dict[str, Tuple[tuple, bool]]] = {}
+        """
+        For each game, the input values and the result of the last evaluation of each predicate that has inputs.
+        """
+
+    def reset(self, game_index: int) -> None:
+        """
+        Forget the predicate results of a game, e.g. when it starts a new episode.
+        """
+        self._memos.pop(game_index, None)
+
+    def decide(self, game_index: int, feats: Dict, context: Any,
+               before_action: Optional[Callable[[str], None]] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        :param game_index: The game, to remember its predicate results.
+        :param feats: The features of the game that the rule inputs refer to.
+        :param context: What the predicates and the actions are called with.
+        :param before_action: Called with the name of a rule whose predicate holds before its action runs,
+            e.g. to keep the state that the action changes.
+        :return: The name of the rule that chose the command and the command.
+            `(None, None)` if no rule applies.
+        """
+        memo = self._memos.setdefault(game_index, {})
+        for rule in self.rules:
+            stats = self.stats[rule.name]
+            start = time.perf_counter()
+            try:
+                if rule.predicate is not None:
+                    if rule.inputs is not None:
+                        values = tuple(feats[key] for key in rule.inputs)
+                        previous = memo.get(rule.name)
+                        if previous is not None and previous[0] == values:
+                            stats.skipped += 1
+                            applies = previous[1]
+                        else:
+                            stats.evaluations += 1
+                            applies = bool(rule.predicate(context))
+                            memo[rule.name] = (values, applies)
+                    else:
+                        stats.evaluations += 1
+                        applies = rule.predicate(context)
+                    if not applies:
+                        continue
+                stats.matches += 1
+                if before_action is not None:
+                    before_action(rule.name)
+                command = rule.action(context)
+            finally:
+                stats.seconds += time.perf_counter() - start
+            if command is not None:
+                stats.hits += 1
+                return rule.name, command
+        return None, None
+
+    def report(self) -> str:
+        """
+        :return: A table of the counters of the rules, the slowest first.
+        """
+        lines = ["{:<32} {:>8} {:>11} {:>8} {:>8} {:>10}".format(
+            "rule", "hits", "evaluations", "skipped", "matches", "ms")]
+        for name, stats in sorted(self.stats.items(), key=lambda item: item[1].seconds, reverse=True):
+            lines.append("{:<32} {:>8} {:>11} {:>8} {:>8} {:>10.2f}".format(
+                name, stats.hits, stats.evaluations, stats.skipped, stats.matches, stats.seconds * 1000))
+        return '\n'.join(lines)
+
+    def stats_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Run an evaluation in a sandboxed local process instead of a Docker container.
+
+Like the container, the sandbox has no network, the submission and the games are mounted read-only
+and the math libraries use one thread. Processes also get resource limits.
+The sandbox uses Linux user, mount and network namespaces through `unshare`, which doesn't need root.
+The agent runs with the Python of the host, so TextWorld has to be installed there.
+
+A warm worker skips the start up of each evaluation:
+    python sandbox.py serve /tmp/tw-sandbox.sock <submission dir> <games dir>
+keeps TextWorld imported in a sandbox and forks a fresh process for each evaluation that is run with
+    python test_submission.py <submission dir> <games dir> --sandbox --sandbox-socket /tmp/tw-sandbox.sock
+"""
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import traceback
+from typing import Dict, List, Optional, Sequence
+
+_mount_script = '''
+while [ "$1" != "--" ]; do
+    mount --bind "$2" "$2" && mount -o "remount,bind,$1" "$2" || exit 125
+    shift 2
+done
+shift
+exec "$@"
+'''
+"""
+Mounts each (mode, directory) pair over itself with the mode, `ro` or `rw`, and then runs the command.
+"""
+
+_thread_variables = ("MKL_NUM_THREADS", "OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+_kept_variables = ("PATH", "HOME", "LANG", "LC_ALL", "TMPDIR", "TW_RECIPE_CACHE", "TW_LAYOUT_LIBRARY")
+
+_exit_marker = b'\0'
+"""
+Separates the output of an evaluation run by a worker from its exit status.
+"""
+
+
+def sandbox_env() -> Dict[str, str]:
+    """
+    :return: The environment of the sandboxed processes: only what is needed from the environment of the host.
+    """
+    env = {name: os.environ[name] for name in _kept_variables if name in os.environ}
+    env["PYTHONUNBUFFERED"] = "1"
+    for name in _thread_variables:
+        env[name] = "1"
+    return env
+
+
+def sandbox_command(command: Sequence[str], read_only_dirs: Sequence[str],
+                    writable_dirs: Sequence[str] = ()) -> List[str]:
+    """
+    :param writable_dirs: Directories to keep writable, e.g. inside one of the read-only directories.
+    :return: The command to run the command in a sandbox.
+    """
+    mounts = []
+    for mode, dirs in (('ro', read_only_dirs), ('rw', writable_dirs)):
+        for path in dirs:
+            mounts += [mode, os.path.abspath(path)]
+    return ["unshare", "--user", "--map-root-user", "--net", "--mount",
+            "sh", "-c", _mount_script, "sh"] + mounts + ["--"] + list(command)
+
+
+def check_sandbox() -> None:
+    """
+    :raise RuntimeError: If sandboxes can't be made here.
+    """
+    try:
+        subprocess.run(sandbox_command(["true"], ()), check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE)
+    except (OSError, subprocess.CalledProcessError) as e:
+        stderr = getattr(e, 'stderr', None)
+        raise RuntimeError("Can't make a sandbox with `unshare`, it needs Linux with unprivileged user namespaces."
+                           " Run without --sandbox to use Docker. {}".format(
+                               stderr.decode(errors='replace').strip() if stderr else e))
+
+
+def limit_resources(memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None) -> None:
+    """
+    Limit the resources of this process and of the processes that it starts.
+
+    :param memory_mb: The maximum address space of each process.
+    :param cpu_seconds: The maximum CPU time of each process.
+    """
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if memory_mb is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024, memory_mb * 1024 * 1024))
+    if cpu_seconds is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+
+
+def run(evaluate_script: str, argv: Sequence[str], read_only_dirs: Sequence[str], writable_dirs: Sequence[str] = (),
+        memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None, timeout: Optional[float] = None) -> int:
+    """
+    Run an evaluation in a new sandbox.
+
+    :param evaluate_script: The path of `test_submission.py`.
+    :param argv: Its arguments.
+    :return: Its exit code.
+    """
+    check_sandbox()
+    command = sandbox_command([sys.executable, evaluate_script] + list(argv), read_only_dirs, writable_dirs)
+    return subprocess.run(command, env=sandbox_env(), timeout=timeout,
+                          preexec_fn=lambda: limit_resources(memory_mb, cpu_seconds)).returncode
+
+
+def run_in_worker(socket_path: str, argv: Sequence[str], read_only_dirs: Sequence[str],
+                  memory_mb: Optional[int] = None, cpu_seconds: Optional[int] = None,
+                  timeout: Optional[float] = None) -> Optional[int]:
+    """
+    Run an evaluation with a warm worker, showing its output.
+
+    :return: Its exit code. `None` if there is no worker at the path or it can't run it,
+        e.g. because it has other directories mounted.
+    """
+    try:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+    except OSError:
+        return None
+    with connection:
+        request = dict(argv=list(argv), read_only_dirs=[os.path.abspath(path) for path in read_only_dirs],
+                       memory_mb=memory_mb, cpu_seconds=cpu_seconds)
+        connection.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        trailer = None
+        while True:
+            data = connection.recv(1 << 16)
+            if not data:
+                break
+            if trailer is not None:
+                trailer += data
+                continue
+            index = data.find(_exit_marker)
+            if index >= 0:
+                trailer = data[index + 1:]
+                data = data[:index]
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+    if trailer is None:
+        return None
+    status = json.loads(trailer.decode('utf-8'))
+    if status.get('error'):
+        print("The sandbox worker can't run the evaluation: {}".format(status['error']), file=sys.stderr)
+        return None
+    return status['exit_code']
+
+
+def _exit_code(wait_status: int) -> int:
+    if os.WIFSIGNALED(wait_status):
+        return -os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
+
+def _serve_request(connection: socket.socket, evaluate_module, read_only_dirs: List[str]) -> None:
+    with connection, connection.makefile('rb') as reader:
+        request = json.loads(reader.readline().decode('utf-8'))
+        if sorted(request['read_only_dirs']) != sorted(read_only_dirs):
+            connection.sendall(_exit_marker + json.dumps(dict(
+                error="it has {} mounted".format(", ".join(read_only_dirs)))).encode('utf-8'))
+            return
+        pid = os.fork()
+        if pid == 0:
+            # A fresh process for the evaluation, with the modules that were imported already.
+            exit_code = 1
+            try:
+                os.dup2(connection.fileno(), 1)
+                os.dup2(connection.fileno(), 2)
+                limit_resources(request['memory_mb'], request['cpu_seconds'])
+                sys.argv = [evaluate_module.__file__] + request['argv']
+                evaluate_module.main()
+                exit_code = 0
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else int(e.code is not None)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        _, wait_status = os.waitpid(pid, 0)
+        connection.sendall(_exit_marker + json.dumps(dict(exit_code=_exit_code(wait_status))).encode('utf-8'))
+
+
+def serve(socket_path: str, evaluate_script: str, read_only_dirs: List[str]) -> None:
+    """
+    Run evaluations that are requested through a Unix socket, one at a time. Must be run in a sandbox.
+    """
+    spec = importlib.util.spec_from_file_location('evaluate', evaluate_script)
+    evaluate_module = importlib.util.module_from_spec(spec)
+    # Import TextWorld and everything else that evaluations need once.
+    spec.loader.exec_module(evaluate_module)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    print("Sandbox worker ready at {}".format(socket_path), flush=True)
+    try:
+        while True:
+            connection, _ = server.accept()
+            try:
+                _serve_request(connection, evaluate_module, read_only_dirs)
+            except OSError:
+                traceback.print_exc()
+    finally:
+        server.close()
+        os.remove(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve evaluations in a sandbox.")
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help="Start a warm worker.")
+    serve_parser.add_argument("--inside", action="store_true", help=argparse.SUPPRESS)
+    serve_parser.add_argument("socket")
+    serve_parser.add_argument("submission_dir")
+    serve_parser.add_argument("games_dir")
+    args = parser.parse_args()
+    if args.command != 'serve':
+        parser.print_help()
+        return
+
+    socket_path = os.path.abspath(args.socket)
+    read_only_dirs = [os.path.abspath(args.submission_dir), os.path.abspath(args.games_dir)]
+    evaluate_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_submission.py")
+    if args.inside:
+        serve(socket_path, evaluate_script, read_only_dirs)
+        return
+    check_sandbox()
+    command = [sys.executable, os.path.abspath(__file__), 'serve', '--inside', socket_path] + read_only_dirs
+    try:
+        subprocess.run(sandbox_command(command, read_only_dirs), env=sandbox_env())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
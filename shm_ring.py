@@ -0,0 +1,197 @@
+"""
+Rings of records in preallocated shared memory, to pass the observations and the commands between the processes that
+step the environments and the process of the agent without pickling them through pipes.
+
+Each ring has one producer process and one consumer process.
+A record is copied once into the shared memory by the producer and once out of it by the consumer.
+Two semaphores count the records and the free places so that each side only waits when the ring is empty or full,
+and they order the writes of a record before its reads.
+A semaphore shared by several rings can also be released with each record so that one consumer can wait on all of them.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import struct
+from multiprocessing import shared_memory
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+_length = struct.Struct('<I')
+
+_default_capacity = 4
+
+_default_record_size = 64 * 1024
+"""
+The largest record in bytes. Observations of the cooking games are a few KB at most.
+"""
+
+
+class RingBuffer(object):
+    """
+    A queue of byte records in shared memory with the interface of `multiprocessing.Queue`.
+    It must be made before starting the producer and the consumer processes, which get it as an argument.
+    """
+
+    def __init__(self, capacity: int = _default_capacity, record_size: int = _default_record_size,
+                 notify: Optional[Any] = None, context: Optional[Any] = None):
+        """
+        :param notify: A semaphore to release after putting each record.
+        :param context: The multiprocessing context of the processes that use the ring.
+        """
+        context = context or multiprocessing
+        self.capacity = capacity
+        self.record_size = record_size
+        self._stride = _length.size + record_size
+        self._memory = shared_memory.SharedMemory(create=True, size=capacity * self._stride)
+        self._owner_pid = os.getpid()
+        """
+        The process that made the ring and frees it, forked processes have a copy of the ring.
+        """
+        self._items = context.Semaphore(0)
+        self._spaces = context.Semaphore(capacity)
+        self._notify = notify
+        # Only the producer writes and only the consumer reads so each keeps its own position.
+        self._write_index = 0
+        self._read_index = 0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_memory'] = self._memory.name
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memory = shared_memory.SharedMemory(name=state['_memory'])
+
+    def put(self, *parts: bytes, timeout: Optional[float] = None) -> None:
+        """
+        Put one record made of the parts, waiting for a free place if the ring is full.
+
+        :raise ValueError: If the record is larger than `record_size`.
+        :raise queue.Full: If no place got free within the timeout.
+        """
+        size = sum(map(len, parts))
+        if size > self.record_size:
+            raise ValueError("A record of {} bytes doesn't fit in {} bytes.".format(size, self.record_size))
+        if not self._spaces.acquire(timeout=timeout):
+            raise queue.Full
+        buffer = self._memory.buf
+        offset = (self._write_index % self.capacity) * self._stride
+        _length.pack_into(buffer, offset, size)
+        offset += _length.size
+        for part in parts:
+            buffer[offset:offset + len(part)] = part
+            offset += len(part)
+        self._write_index += 1
+        self._items.release()
+        if self._notify is not None:
+            self._notify.release()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> bytes:
+        """
+        :raise queue.Empty: If there is no record and `block` is `False` or none came within the timeout.
+        """
+        if not self._items.acquire(block, timeout):
+            raise queue.Empty
+        buffer = self._memory.buf
+        offset = (self._read_index % self.capacity) * self._stride
+        size, = _length.unpack_from(buffer, offset)
+        offset += _length.size
+        result = bytes(buffer[offset:offset + size])
+        self._read_index += 1
+        self._spaces.release()
+        return result
+
+    def close(self) -> None:
+        """
+        Release the shared memory in this process, and free it if this process made the ring.
+        """
+        self._memory.close()
+        if self._owner_pid == os.getpid():
+            self._memory.unlink()
+            self._owner_pid = None
+
+
+_step_header = struct.Struct('<cq?bbqdI')
+"""
+The kind, the score, if the game is done, if it was won and lost, the maximum score,
+the seconds that the environment took and the size of the observation.
+"""
+
+_step = b'S'
+_error = b'E'
+
+_header_infos = ('has_won', 'has_lost', 'max_score')
+"""
+The infos that are in the header of the records, the other ones are encoded in JSON after the observation.
+"""
+
+
+class StepRecord(NamedTuple):
+    obs: str
+    score: int
+    done: bool
+    infos: Dict[str, Any]
+    seconds: float
+
+
+def _encode_flag(value: Optional[bool]) -> int:
+    return -1 if value is None else int(bool(value))
+
+
+def _decode_flag(value: int) -> Optional[bool]:
+    return None if value < 0 else bool(value)
+
+
+def encode_step(obs: str, score: int, done: bool, infos: Dict[str, Any], seconds: float) -> Tuple[bytes, ...]:
+    """
+    :param infos: The infos of one game.
+    :return: The parts of the record of a step of an environment, to give to `RingBuffer.put`.
+    """
+    obs = obs.encode('utf-8')
+    extra_infos = {key: value for key, value in infos.items() if key not in _header_infos}
+    header = _step_header.pack(_step, score or 0, bool(done), _encode_flag(infos.get('has_won')),
+                               _encode_flag(infos.get('has_lost')), infos.get('max_score') or 0, seconds, len(obs))
+    if len(extra_infos) == 0:
+        return header, obs
+    return header, obs, json.dumps(extra_infos).encode('utf-8')
+
+
+def encode_error(message: str) -> Tuple[bytes, ...]:
+    """
+    :return: The parts of the record of an environment that failed.
+    """
+    return _error, message.encode('utf-8')
+
+
+def decode_step(data: bytes) -> StepRecord:
+    """
+    :raise RuntimeError: If the record is the error of an environment that failed.
+    """
+    if data[:1] == _error:
+        raise RuntimeError("The environment failed: {}".format(data[1:].decode('utf-8')))
+    _, score, done, has_won, has_lost, max_score, seconds, obs_size = _step_header.unpack_from(data)
+    start = _step_header.size
+    obs = data[start:start + obs_size].decode('utf-8')
+    infos = dict(has_won=_decode_flag(has_won), has_lost=_decode_flag(has_lost), max_score=max_score)
+    if len(data) > start + obs_size:
+        infos.update(json.loads(data[start + obs_size:].decode('utf-8')))
+    return StepRecord(obs, score, done, infos, seconds)
+
+
+def encode_command(kind: str, text: str = "") -> bytes:
+    """
+    :param kind: 'reset' to start an episode of the game in the file `text`,
+        'step' to do the command `text` or 'close'.
+    """
+    return kind[0].encode('ascii') + text.encode('utf-8')
+
+
+_command_kinds = {'r': 'reset', 's': 'step', 'c': 'close'}
+
+
+def decode_command(data: bytes) -> Tuple[str, str]:
+    """
+    :return: The kind and the text of a command from `encode_command`.
+    """
+    return _command_kinds[data[:1].decode('ascii')], data[1:].decode('utf-8')
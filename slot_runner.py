@@ -0,0 +1,433 @@
+"""
+Play the episodes of many games with one batched agent in slots that are refilled independently:
+when the episode in a slot ends, the slot gets the next (game, episode) right away,
+so the batch never waits for its slowest game.
+
+The environment of each slot can also be stepped in its own process, see `EnvWorkers`,
+and the agent then acts on the slots whose environments answered while the others are still stepping.
+test_submission.py makes the agent and the environments of the games and collects the results.
+"""
+import collections
+import multiprocessing
+import os
+import queue
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import shm_ring
+
+
+class _Slot(object):
+    """
+    The episode being played in one slot of a continuous batch.
+    """
+
+    def __init__(self):
+        self.gamefile = None
+        self.env = None
+        self.episode = None
+        self.active = False
+        self.waiting = False
+        """
+        If the environment of the slot is in an env worker that didn't answer the last reset or command yet.
+        """
+        self.obs = ""
+        self.score = 0
+        self.steps = 0
+        self.commands = []
+        self.infos = {}
+        self.start_time = None
+
+
+def _env_worker(commands: shm_ring.RingBuffer, observations: shm_ring.RingBuffer,
+                make_env: Callable[[str], Any]) -> None:
+    """
+    Step the environment of one slot in its own process:
+    reset it for each new episode and step it with each command of the agent,
+    answering each with the observation through shared memory.
+
+    :param commands: The ring of the commands from the agent, see `shm_ring.encode_command`.
+    :param observations: The ring of the answers to the agent, see `shm_ring.encode_step`.
+    :param make_env: Makes the environment of a game file, as for `play_games_continuously`.
+    """
+    env = None
+    gamefile = None
+    try:
+        while True:
+            kind, text = shm_ring.decode_command(commands.get())
+            if kind == 'close':
+                break
+            start_time = time.perf_counter()
+            if kind == 'reset':
+                if text != gamefile:
+                    if env is not None:
+                        env.close()
+                    gamefile = text
+                    env = make_env(gamefile)
+                obs, infos = env.reset()
+                scores = [0]
+                dones = [False]
+            else:
+                obs, scores, dones, infos = env.step([text])
+            observations.put(*shm_ring.encode_step(obs[0], scores[0], dones[0],
+                                                   {key: values[0] for key, values in infos.items()},
+                                                   time.perf_counter() - start_time))
+    except Exception as e:
+        observations.put(*shm_ring.encode_error("{!r}".format(e)[:1000]))
+    finally:
+        if env is not None:
+            env.close()
+        commands.close()
+        observations.close()
+
+
+class EnvWorkers(object):
+    """
+    One process per slot that steps the environment of the slot, see `_env_worker`.
+    The observations and the commands go through rings of preallocated shared memory (see shm_ring.py)
+    instead of being pickled through pipes, and the agent can act on the slots whose observations are ready
+    while the environments of the other slots are still stepping.
+    """
+
+    _poll_seconds = 1.0
+    """
+    How often to check that the workers are still alive while waiting for them.
+    """
+
+    def __init__(self, nb_workers: int, make_env: Callable[[str], Any]):
+        """
+        :param make_env: Makes the environment of a game file in the worker processes.
+        """
+        self._ready = multiprocessing.Semaphore(0)
+        """
+        Released with every observation of any worker.
+        """
+        self._commands = [shm_ring.RingBuffer(record_size=4096) for _ in range(nb_workers)]
+        self._observations = [shm_ring.RingBuffer(notify=self._ready) for _ in range(nb_workers)]
+        self._processes = [multiprocessing.Process(target=_env_worker, args=(commands, observations, make_env),
+                                                   daemon=True)
+                           for commands, observations in zip(self._commands, self._observations)]
+        for process in self._processes:
+            process.start()
+
+    def reset(self, slot_index: int, gamefile: str) -> None:
+        self._commands[slot_index].put(shm_ring.encode_command('reset', gamefile))
+
+    def step(self, slot_index: int, command: str) -> None:
+        self._commands[slot_index].put(shm_ring.encode_command('step', command))
+
+    def wait(self) -> List[Tuple[int, shm_ring.StepRecord]]:
+        """
+        Wait for at least one worker to answer.
+
+        :return: The index of the slot and the `shm_ring.StepRecord` of each answer.
+        """
+        while not self._ready.acquire(timeout=self._poll_seconds):
+            for slot_index, process in enumerate(self._processes):
+                if not process.is_alive():
+                    raise RuntimeError("The env worker of slot {} died with exit code {}."
+                                       .format(slot_index, process.exitcode))
+        # Take the other releases first: a release after this is for an answer that is not read below.
+        while self._ready.acquire(block=False):
+            pass
+        result = []
+        for slot_index, observations in enumerate(self._observations):
+            while True:
+                try:
+                    data = observations.get(block=False)
+                except queue.Empty:
+                    break
+                result.append((slot_index, shm_ring.decode_step(data)))
+        return result
+
+    def close(self) -> None:
+        for commands, process in zip(self._commands, self._processes):
+            if process.is_alive():
+                try:
+                    commands.put(shm_ring.encode_command('close'), timeout=self._poll_seconds)
+                except queue.Full:
+                    pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._commands + self._observations:
+            ring.close()
+
+
+def play_games_continuously(agent: Any, make_env: Callable[[str], Any], game_files: Sequence[str], nb_slots: int,
+                            nb_episodes: int, max_episode_steps: int, new_game_stats: Callable[[], Dict[str, Any]],
+                            trace_dir: Optional[str] = None,
+                            callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                            metrics: Optional[Any] = None, memory_accountant: Optional[Any] = None,
+                            env_workers: bool = False, adaptive_episodes: bool = False) -> List[Dict[str, Any]]:
+    """
+    Play every episode of the games with one agent that plays `nb_slots` games at a time.
+
+    :param agent: The agent, with the interface of `CustomAgent`, ready to play.
+    :param make_env: Makes the environment of a game file: a batch of one game with the gym interface.
+    :param new_game_stats: Makes the stats of a game before its first episode.
+    :param callback: Called with the stats of each game by its name, as soon as all of its episodes are done.
+    :param metrics: The `metrics.MetricsReporter` of the evaluation if there is one.
+    :param memory_accountant: Records the memory after each game in its stats if given,
+        see `memory_accounting.py`.
+    :param env_workers: Step the environment of each slot in its own process, see `EnvWorkers`.
+        The agent then acts on the slots whose environments answered instead of waiting for all of them,
+        if it can (see `act_on_slots`).
+    :param adaptive_episodes: Don't start the episodes of a game that are left once its results converged,
+        see `episode_budget.py`. The episodes of the game that are being played still finish.
+    :return: The stats of each game by its name if there is no callback.
+        With a callback, the results are not kept so that memory stays flat over many games.
+    """
+    start_slot_episode = getattr(agent, "start_slot_episode", None)
+    get_trace_info = getattr(agent, "get_trace_info", None)
+    act_on_slots = getattr(agent, "act_on_slots", None)
+    should_abort_game = getattr(agent, "should_abort_game", None)
+    get_failure_counts = getattr(agent, "get_failure_counts", None)
+    episodes_converged = None
+    if adaptive_episodes:
+        from episode_budget import episodes_converged
+
+    episodes_queue = collections.deque((gamefile, no_episode)
+                                       for gamefile in game_files for no_episode in range(nb_episodes))
+    game_stats = {gamefile: new_game_stats() for gamefile in game_files}
+    episodes_left = {gamefile: nb_episodes for gamefile in game_files}
+    trace_writers = {}
+    results = []
+
+    slots = [_Slot() for _ in range(max(1, min(nb_slots, len(episodes_queue))))]
+    workers = EnvWorkers(len(slots), make_env) if env_workers else None
+    # Slots without episodes left that the agent wasn't told about yet.
+    slots_to_release = set()
+
+    def _start_next_episode(slot_index):
+        slot = slots[slot_index]
+        if len(episodes_queue) == 0:
+            slot.active = False
+            slots_to_release.add(slot_index)
+            if slot.env is not None:
+                slot.env.close()
+                slot.env = None
+            return
+
+        gamefile, no_episode = episodes_queue.popleft()
+        if metrics is not None and episodes_left[gamefile] == nb_episodes and no_episode == 0:
+            metrics.game_started()
+        same_game = gamefile == slot.gamefile
+        slot.episode = no_episode
+        slot.active = True
+        slot.start_time = time.time()
+        if workers is not None:
+            # The observation is read when the worker answers.
+            slot.gamefile = gamefile
+            slot.waiting = True
+            workers.reset(slot_index, gamefile)
+        else:
+            if not same_game:
+                if slot.env is not None:
+                    slot.env.close()
+                slot.gamefile = gamefile
+                slot.env = make_env(gamefile)
+            obs, infos = slot.env.reset()
+            slot.obs = obs[0]
+            slot.infos = {key: values[0] for key, values in infos.items()}
+        slot.score = 0
+        slot.steps = 0
+        slot.commands = []
+        if start_slot_episode is not None:
+            start_slot_episode(slot_index, same_game)
+
+    def _end_episode(slot_index, aborted):
+        slot = slots[slot_index]
+        gamefile = slot.gamefile
+        game_name = os.path.basename(gamefile)
+        stats = game_stats[gamefile]
+        elapsed = time.time() - slot.start_time
+        if aborted:
+            steps_reclaimed = max_episode_steps - slot.steps
+            stats["aborted_episodes"] += 1
+            stats["steps_reclaimed"] += steps_reclaimed
+            stats["time_reclaimed"] += steps_reclaimed * elapsed / max(slot.steps, 1)
+
+        while len(stats["runs"]) <= slot.episode:
+            stats["runs"].append(None)
+        stats["runs"][slot.episode] = {
+            "score": slot.score,
+            "steps": slot.steps,
+            "commands": slot.commands,
+            "has_won": slot.infos["has_won"],
+            "has_lost": slot.infos["has_lost"],
+            "aborted": aborted,
+            "failures": get_failure_counts(slot_index) if get_failure_counts is not None else {},
+        }
+        stats["max_scores"] = slot.infos["max_score"]
+        stats["duration"] = stats.get("duration", 0.0) + elapsed
+
+        trace_writer = trace_writers.get(gamefile)
+        if trace_writer is not None:
+            trace_writer.add_episode(game_name, slot.episode, slot.score, slot.steps,
+                                     slot.infos["has_won"], slot.infos["has_lost"])
+
+        if metrics is not None:
+            metrics.episodes_done([slot.score])
+
+        episodes_left[gamefile] -= 1
+        if episodes_left[gamefile] > 0 and episodes_converged is not None and episodes_converged(stats["runs"]):
+            queued = [episode for episode in episodes_queue if episode[0] != gamefile]
+            episodes_left[gamefile] -= len(episodes_queue) - len(queued)
+            episodes_queue.clear()
+            episodes_queue.extend(queued)
+        if episodes_left[gamefile] == 0:
+            stats["episodes_run"] = len(stats["runs"])
+            if trace_writer is not None:
+                trace_writer.close()
+                del trace_writers[gamefile]
+            if metrics is not None:
+                metrics.game_done()
+            # Forget the finished game.
+            del game_stats[gamefile]
+            del episodes_left[gamefile]
+            if memory_accountant is not None:
+                # The agent keeps playing the other games so it is counted.
+                stats["memory"] = memory_accountant.game_done()
+            result = {game_name: stats}
+            if callback is not None:
+                callback(result)
+            else:
+                results.append(result)
+
+        _start_next_episode(slot_index)
+
+    def _step(slot_index, command):
+        """
+        Log the command of the agent for a slot and send it to the environment of the slot.
+
+        :return: The seconds that the environment took, if it was stepped in this process.
+        """
+        slot = slots[slot_index]
+        slot.steps += 1
+        slot.commands.append(command)
+        if trace_dir is not None:
+            trace_writer = trace_writers.get(slot.gamefile)
+            if trace_writer is None:
+                from trace_store import TraceWriter
+                trace_writer = TraceWriter(os.path.join(trace_dir, os.path.basename(slot.gamefile)))
+                trace_writers[slot.gamefile] = trace_writer
+            trace_info = get_trace_info(slot_index) if get_trace_info is not None else {}
+            trace_writer.add_step(os.path.basename(slot.gamefile), slot.episode, slot.steps - 1, slot.obs,
+                                  command, slot.score, **trace_info)
+
+        if workers is not None:
+            slot.waiting = True
+            workers.step(slot_index, command)
+            return 0.0
+        env_start_time = time.perf_counter()
+        obs, scores, dones, infos = slot.env.step([command])
+        env_seconds = time.perf_counter() - env_start_time
+        _record_step(slot_index, obs[0], scores[0], dones[0], {key: values[0] for key, values in infos.items()})
+        return env_seconds
+
+    def _record_step(slot_index, ob, score, done, infos):
+        slot = slots[slot_index]
+        slot.obs = ob
+        slot.score = score
+        slot.infos = infos
+        if done:
+            _end_episode(slot_index, aborted=False)
+
+    def _play_ready_slots():
+        """
+        Wait for the env workers and let the agent act on the slots whose environments answered.
+        """
+        env_seconds = 0.0
+        num_steps = 0
+        for slot_index, record in workers.wait():
+            slot = slots[slot_index]
+            slot.waiting = False
+            env_seconds += record.seconds
+            if slot.steps > 0:
+                num_steps += 1
+            _record_step(slot_index, record.obs, record.score, record.done, record.infos)
+
+        ready = [slot_index for slot_index, slot in enumerate(slots) if slot.active and not slot.waiting]
+        if act_on_slots is None or not agent_started:
+            # The agent needs the whole batch.
+            if any(slot.waiting for slot in slots):
+                return False
+            ready = list(range(len(slots)))
+        else:
+            ready = sorted(set(ready) | slots_to_release)
+        if len(ready) == 0:
+            return False
+        slots_to_release.difference_update(ready)
+
+        obs = [slots[slot_index].obs for slot_index in ready]
+        scores = [slots[slot_index].score for slot_index in ready]
+        dones = [not slots[slot_index].active for slot_index in ready]
+        infos = {key: [slots[slot_index].infos.get(key) for slot_index in ready]
+                 for key in set().union(*(slots[slot_index].infos for slot_index in ready))}
+        agent_start_time = time.perf_counter()
+        if len(ready) == len(slots):
+            commands = agent.act(obs, scores, dones, infos)
+        else:
+            commands = act_on_slots(ready, obs, scores, dones, infos)
+        agent_seconds = time.perf_counter() - agent_start_time
+
+        for slot_index, command in zip(ready, commands):
+            if not slots[slot_index].active:
+                continue
+            if should_abort_game is not None and should_abort_game(slot_index):
+                _end_episode(slot_index, aborted=True)
+                continue
+            _step(slot_index, command)
+
+        if metrics is not None and num_steps > 0:
+            metrics.add_step(agent_seconds, env_seconds, num_steps)
+        return True
+
+    for slot_index in range(len(slots)):
+        _start_next_episode(slot_index)
+
+    try:
+        agent_started = False
+        while workers is not None and any(slot.active for slot in slots):
+            agent_started |= _play_ready_slots()
+    finally:
+        if workers is not None:
+            workers.close()
+
+    while workers is None and any(slot.active for slot in slots):
+        obs = [slot.obs for slot in slots]
+        scores = [slot.score for slot in slots]
+        # Empty slots at the end of the queue look like finished games to the agent.
+        dones = [not slot.active for slot in slots]
+        infos = {key: [slot.infos.get(key) for slot in slots]
+                 for key in set().union(*(slot.infos for slot in slots))}
+        agent_start_time = time.perf_counter()
+        commands = agent.act(obs, scores, dones, infos)
+        agent_seconds = time.perf_counter() - agent_start_time
+        env_seconds = 0.0
+        num_steps = 0
+
+        for slot_index, slot in enumerate(slots):
+            if not slot.active:
+                continue
+            if should_abort_game is not None and should_abort_game(slot_index):
+                _end_episode(slot_index, aborted=True)
+                continue
+
+            env_seconds += _step(slot_index, commands[slot_index])
+            num_steps += 1
+
+        if metrics is not None and num_steps > 0:
+            metrics.add_step(agent_seconds, env_seconds, num_steps)
+
+    if metrics is not None:
+        metrics.flush()
+
+    # Let the agent know that all of the games are done.
+    agent.act([slot.obs for slot in slots], [slot.score for slot in slots], [True] * len(slots),
+              {key: [slot.infos.get(key) for slot in slots] for key in set().union(*(slot.infos for slot in slots))})
+
+    return results
+
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Classify the steps of played episodes to see where the step budget goes, per game and for all of the games.
+
+The steps are read from trace stores (see trace_store.py), e.g. from `test_submission.py --trace-dir traces`,
+which also works when replaying the results of an evaluation.
+A step is classified from its command and the observation that answered it, which is the observation of the next step,
+and from the branch of the agent that chose it when the trace has it, so that the wasted steps point to the
+behaviour of the agent to fix.
+
+Example:
+    python step_report.py traces --top 20
+"""
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from custom_agent import _need_to_open_door_pattern, CustomAgent
+from trace_store import _store_paths, Step, TraceReader
+
+categories = {
+    'scored': "The score went up.",
+    'new_room': "A move to a room that was not visited yet in the episode.",
+    'revisited_room': "A move to a room that was already visited in the episode, "
+                      "including the trips back to the Kitchen that are needed.",
+    'failed_take': "\"You can't see any such thing.\", mostly taking something that is not there.",
+    'capacity_error': "Taking something while carrying too many things.",
+    'door_error': "Going through a door that has to be opened first.",
+    'blocked_move': "Going where there is no exit.",
+    'wait': "The fallback when the agent doesn't know what to do.",
+    'redundant_inventory': "Checking the inventory when it didn't change since the previous check.",
+    'other': "Everything else, e.g. reading the cookbook, opening containers, taking and cooking ingredients.",
+}
+"""
+The categories of steps, by priority: a step is in the first category that it matches.
+"""
+
+wasted_categories = ('failed_take', 'capacity_error', 'door_error', 'blocked_move', 'wait', 'redundant_inventory')
+"""
+The categories of the steps that didn't help.
+"""
+
+_directions = {"north", "east", "south", "west"}
+
+_failed_take = "You can't see any such thing."
+_capacity_error = "You're carrying too many things already."
+_blocked_move = "You can't go that way."
+
+
+def _is_move(action: str) -> bool:
+    if action.startswith("go "):
+        action = action[len("go "):]
+    return action in _directions
+
+
+def classify_episode(steps: Sequence[Step], final_score: Optional[int] = None) -> List[str]:
+    """
+    :param steps: The steps of an episode, in order.
+    :param final_score: The score at the end of the episode, to know if the last step scored.
+    :return: The category of each step.
+    """
+    result = []
+    visited = set()
+    if steps:
+        room = CustomAgent._get_room_name(steps[0].observation or "")
+        if room is not None:
+            visited.add(room)
+    last_inventory = None
+    for index, step in enumerate(steps):
+        action = (step.action or "").strip().lower()
+        if index + 1 < len(steps):
+            response = steps[index + 1].observation or ""
+            score = steps[index + 1].score
+        else:
+            # The observation that ended the episode is not logged.
+            response = None
+            score = final_score
+        text = (response or "").strip()
+        room = CustomAgent._get_room_name(text) if response is not None else None
+
+        if action == "wait":
+            category = 'wait'
+        elif text.startswith(_failed_take):
+            category = 'failed_take'
+        elif text.startswith(_capacity_error):
+            category = 'capacity_error'
+        elif _need_to_open_door_pattern.search(text):
+            category = 'door_error'
+        elif text.startswith(_blocked_move):
+            category = 'blocked_move'
+        elif score is not None and score > step.score:
+            category = 'scored'
+        elif action == "inventory" and response is not None and text == last_inventory:
+            category = 'redundant_inventory'
+        elif _is_move(action) and room is not None:
+            category = 'revisited_room' if room in visited else 'new_room'
+        else:
+            category = 'other'
+
+        if room is not None:
+            visited.add(room)
+        if action == "inventory" and response is not None:
+            last_inventory = text
+        result.append(category)
+    return result
+
+
+def _episode_key(step: Step) -> Tuple[str, int, int]:
+    return step.game, step.run, step.episode
+
+
+def iter_episodes(root: str) -> Iterator[Tuple[str, List[Step], Optional[int], Optional[bool]]]:
+    """
+    Read the episodes of all of the trace stores under `root`, one store at a time.
+
+    :return: For each episode: the game, its steps in order, the final score and if it was won,
+        `None` for the last two if the end of the episode was not logged.
+    """
+    for path in _store_paths(root):
+        with TraceReader(path) as reader:
+            # Episodes played at the same time have their steps interleaved.
+            episodes: Dict[Tuple[str, int, int], List[Step]] = defaultdict(list)
+            for index in range(reader.num_steps):
+                step = reader.step(index)
+                episodes[_episode_key(step)].append(step)
+            ends = {(e.game, e.run, e.episode): e for e in reader.episodes()}
+            for key, steps in episodes.items():
+                steps.sort(key=lambda s: s.step)
+                end = ends.get(key)
+                yield key[0], steps, end.score if end else None, end.has_won if end else None
+
+
+def _new_counts() -> Dict[str, Any]:
+    return dict(episodes=0, won_episodes=0, steps=0, won_steps=0, wasted=0, categories=Counter())
+
+
+def _add(counts: Dict[str, Any], episode_categories: List[str], has_won: Optional[bool]) -> None:
+    counts['episodes'] += 1
+    counts['steps'] += len(episode_categories)
+    if has_won:
+        counts['won_episodes'] += 1
+        counts['won_steps'] += len(episode_categories)
+    counts['categories'].update(episode_categories)
+    counts['wasted'] += sum(1 for category in episode_categories if category in wasted_categories)
+
+
+def report(root: str) -> Dict[str, Any]:
+    """
+    :return: The counts of the steps of each category per game and for all of the games,
+        and for each category, the branches of the agent that chose the steps.
+    """
+    games: Dict[str, Dict[str, Any]] = {}
+    corpus = _new_counts()
+    branches: Dict[str, Counter] = defaultdict(Counter)
+    for game, steps, final_score, has_won in iter_episodes(root):
+        episode_categories = classify_episode(steps, final_score)
+        counts = games.get(game)
+        if counts is None:
+            counts = games[game] = _new_counts()
+        _add(counts, episode_categories, has_won)
+        _add(corpus, episode_categories, has_won)
+        for step, category in zip(steps, episode_categories):
+            branches[category][step.branch or '-'] += 1
+    return dict(games=games, corpus=corpus, branches=branches)
+
+
+def _to_json(counts: Dict[str, Any]) -> Dict[str, Any]:
+    return dict(counts, categories=dict(counts['categories']))
+
+
+def format_report(result: Dict[str, Any], top: int = 10) -> str:
+    corpus = result['corpus']
+    lines = ["{} games, {} episodes, {} steps, {} wasted ({:.1%})".format(
+        len(result['games']), corpus['episodes'], corpus['steps'], corpus['wasted'],
+        corpus['wasted'] / max(corpus['steps'], 1))]
+    if corpus['won_episodes']:
+        lines.append("{:.1f} steps per won episode".format(corpus['won_steps'] / corpus['won_episodes']))
+    lines.append("")
+    lines.append("{:<20} {:>8} {:>7} {:>14}  {}".format("category", "steps", "share", "per episode", "branches"))
+    for category in categories:
+        count = corpus['categories'][category]
+        if count == 0:
+            continue
+        branches = ', '.join("{} {}".format(branch, n) for branch, n in result['branches'][category].most_common(3))
+        lines.append("{:<20} {:>8} {:>7.1%} {:>14.2f}  {}".format(
+            category, count, count / max(corpus['steps'], 1), count / max(corpus['episodes'], 1), branches))
+    worst = sorted(result['games'].items(), key=lambda item: (-item[1]['wasted'] / max(item[1]['episodes'], 1),
+                                                               item[0]))[:top]
+    if worst and worst[0][1]['wasted'] > 0:
+        lines.append("")
+        lines.append("Games with the most wasted steps per episode:")
+        for game, counts in worst:
+            if counts['wasted'] == 0:
+                break
+            most = ', '.join("{} {}".format(category, n) for category, n in counts['categories'].most_common()
+                             if category in wasted_categories)
+            lines.append("  {:<40} {:>6.1f} ({})".format(game, counts['wasted'] / counts['episodes'], most))
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Classify the steps of played episodes to find the wasted steps.")
+    parser.add_argument('trace_dir', help="A trace store or a directory of trace stores.")
+    parser.add_argument('--top', type=int, default=10, help="The number of games with the most wasted steps to list.")
+    parser.add_argument('--output', help="Also write the counts per game and for all of the games to this JSON file.")
+    args = parser.parse_args(argv)
+    result = report(args.trace_dir)
+    print(format_report(result, args.top))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(games={game: _to_json(counts) for game, counts in result['games'].items()},
+                           corpus=_to_json(result['corpus']),
+                           branches={category: dict(c) for category, c in result['branches'].items()}),
+                      f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
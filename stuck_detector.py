@@ -0,0 +1,105 @@
+from collections import Counter, deque
+from typing import Hashable
+
+_cycle_window = 12
+"""
+The number of recent steps in which repeated (observation, action) pairs are counted.
+"""
+
+_max_repeats = 3
+"""
+The number of times an (observation, action) pair can occur in the cycle window before being considered stuck.
+"""
+
+_progress_window = 25
+"""
+The number of steps without any progress before being considered stuck.
+"""
+
+_recovery_steps = 10
+"""
+The number of steps given to a recovery to make progress before giving up on the episode.
+"""
+
+
+class StuckDetector(object):
+    """
+    Detects when a game stopped making progress:
+    the same (observation, action) pairs keep coming back
+    or nothing new happened for a while.
+
+    The first time it is stuck, a recovery is requested.
+    If the recovery does not lead to progress, it gives up so that the episode can be ended early.
+    """
+
+    def __init__(self, cycle_window: int = _cycle_window, max_repeats: int = _max_repeats,
+                 progress_window: int = _progress_window, recovery_steps: int = _recovery_steps):
+        self._max_repeats = max_repeats
+        self._progress_window = progress_window
+        self._recovery_steps = recovery_steps
+        self._recent = deque(maxlen=cycle_window)
+        self._recent_counts = Counter()
+        self._seen_progress = set()
+        self._best_score = None
+        self.steps_without_progress = 0
+        self.needs_recovery = False
+        self.recovering = False
+        self._steps_since_recovery = 0
+        self.num_recoveries = 0
+        self.gave_up = False
+
+    def record(self, observation: str, action: str, score: int, progress: Hashable) -> None:
+        """
+        Record a step.
+
+        :param observation: The observation that the action was chosen for.
+        :param action: The action taken.
+        :param score: The current score.
+        :param progress: A summary of the state of the game. A value that was never seen before counts as progress.
+        """
+        if self.gave_up:
+            return
+
+        key = (observation, action)
+        if len(self._recent) == self._recent.maxlen:
+            old_key = self._recent[0]
+            self._recent_counts[old_key] -= 1
+            if self._recent_counts[old_key] == 0:
+                del self._recent_counts[old_key]
+        self._recent.append(key)
+        self._recent_counts[key] += 1
+
+        made_progress = progress not in self._seen_progress
+        self._seen_progress.add(progress)
+        if self._best_score is None or score > self._best_score:
+            made_progress = made_progress or self._best_score is not None
+            self._best_score = score
+
+        if made_progress:
+            self.steps_without_progress = 0
+            self.recovering = False
+        else:
+            self.steps_without_progress += 1
+
+        if self.recovering:
+            self._steps_since_recovery += 1
+            if self._steps_since_recovery >= self._recovery_steps:
+                self.recovering = False
+                self.gave_up = True
+        elif self._is_stuck(key):
+            self.needs_recovery = True
+
+    def start_recovery(self) -> None:
+        """
+        Tell the detector that a recovery strategy is being applied.
+        """
+        self.needs_recovery = False
+        self.recovering = True
+        self._steps_since_recovery = 0
+        self.num_recoveries += 1
+        self._recent.clear()
+        self._recent_counts.clear()
+
+    def _is_stuck(self, key) -> bool:
+        return self._recent_counts[key] >= self._max_repeats \
+               or self.steps_without_progress >= self._progress_window
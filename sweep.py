@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Sweep the configuration of the agent over a fixed set of games to tune it.
+
+Each (configuration, game, seed) is played by `test_submission._play_game` in a pool of processes.
+Results are cached in an SQLite file by a hash of the configuration, the game file, the seed and the code of the agent
+so that a sweep can be extended or run again without playing the same games again.
+The report marks the configurations on the Pareto front of a high score and few steps per win.
+
+Example:
+    python sweep.py games/ --grid '{"max_capacity": [2, 3], "explore_order": ["random", "fixed"]}' --seeds 0 1
+"""
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+_default_cache_path = os.path.join(tempfile.gettempdir(), 'textworld-sweep-cache.sqlite')
+
+_code_dir = os.path.dirname(os.path.abspath(__file__))
+
+Job = Tuple[Dict[str, Any], str, int]
+"""
+A configuration of the agent, a game file and a seed.
+"""
+
+
+def grid_configs(space: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    :param space: The values to try for each configuration key.
+    :return: All of the combinations of the values.
+    """
+    keys = sorted(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+
+def random_configs(space: Dict[str, Sequence[Any]], num_configs: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    :return: Different combinations of the values picked at random, at most all of them.
+    """
+    rng = random.Random(seed)
+    keys = sorted(space)
+    num_configs = min(num_configs, len(grid_configs(space)))
+    result = []
+    seen = set()
+    while len(result) < num_configs:
+        config = {key: rng.choice(space[key]) for key in keys}
+        key = _config_key(config)
+        if key not in seen:
+            seen.add(key)
+            result.append(config)
+    return result
+
+
+def select_games(games_dir: str, num_games: Optional[int] = None, seed: int = 0) -> List[str]:
+    """
+    :return: The same games for the same arguments, so that configurations are compared on the same games.
+    """
+    games = sorted(glob.glob(os.path.join(games_dir, "**/*.ulx"), recursive=True))
+    if num_games is not None and num_games < len(games):
+        games = sorted(random.Random(seed).sample(games, num_games))
+    return games
+
+
+def _config_key(config: Dict[str, Any]) -> str:
+    return json.dumps(config, sort_keys=True)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(code_dir: str = _code_dir) -> str:
+    """
+    :return: A hash of the code that plays the games so that cached results of older code are not used.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(code_dir, '*.py'))):
+        if os.path.basename(path) != os.path.basename(__file__):
+            digest.update(os.path.basename(path).encode('utf-8'))
+            digest.update(_file_digest(path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Results of played jobs. Only the main process of a sweep uses it.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: The database file. `None` to only cache in memory.
+        """
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self._connection.commit()
+
+    @staticmethod
+    def key(config: Dict[str, Any], game_digest: str, seed: int, version: str) -> str:
+        return hashlib.sha256('\n'.join((_config_key(config), game_digest, str(seed), version)).encode('utf-8')) \
+            .hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self._memory.get(key)
+        if result is None and self._connection is not None:
+            row = self._connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                self._memory[key] = result
+        return result
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self._memory[key] = value
+        if self._connection is not None:
+            self._connection.execute('INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)',
+                                     (key, json.dumps(value)))
+            self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def _play(job: Job) -> Dict[str, Any]:
+    """
+    Play all of the episodes of a game with a configuration of the agent.
+
+    :return: The totals of the episodes.
+    """
+    config, game_file, seed = job
+    # Imported here since only the processes that play need TextWorld.
+    from custom_agent import CustomAgent
+    from test_submission import _play_game
+
+    # The agent breaks ties at random.
+    random.seed(seed)
+    # Results are cached by job, so they must not depend on the layouts of the games that other jobs played before.
+    os.environ['TW_LAYOUT_LIBRARY'] = ''
+    data, _ = _play_game(CustomAgent, config, game_file)
+    stats = list(data.values())[0]
+    runs = stats["runs"]
+    return dict(
+        score=sum(run["score"] for run in runs),
+        max_score=stats["max_scores"] * len(runs),
+        steps=sum(run["steps"] for run in runs),
+        wins=sum(bool(run["has_won"]) for run in runs),
+        episodes=len(runs),
+        duration=stats["duration"],
+    )
+
+
+def _play_job(args: Tuple[Callable[[Job], Dict[str, Any]], str, Job]) -> Tuple[str, Dict[str, Any]]:
+    play, key, job = args
+    return key, play(job)
+
+
+def run_sweep(configs: Sequence[Dict[str, Any]], game_files: Sequence[str], seeds: Iterable[int],
+              nb_processes: int = 1, cache: Optional[ResultCache] = None,
+              play: Callable[[Job], Dict[str, Any]] = _play,
+              callback: Optional[Callable[[Job, Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Play every game with every configuration and seed, skipping the ones with cached results.
+
+    :param play: Plays a job and returns its totals. It must be picklable when `nb_processes > 1`.
+    :param callback: Called with each job and its totals once it is played.
+    :return: For each configuration, its totals over all of the games and seeds.
+    """
+    if cache is None:
+        cache = ResultCache()
+    seeds = list(seeds)
+    version = code_version()
+    game_digests = {game_file: _file_digest(game_file) for game_file in game_files}
+    jobs: Dict[str, Job] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    for config in configs:
+        for game_file in game_files:
+            for seed in seeds:
+                key = ResultCache.key(config, game_digests[game_file], seed, version)
+                cached = cache.get(key)
+                if cached is not None:
+                    results[key] = cached
+                else:
+                    jobs[key] = (config, game_file, seed)
+
+    def _done(key, value):
+        cache.put(key, value)
+        results[key] = value
+        if callback is not None:
+            callback(jobs[key], value)
+
+    tasks = [(play, key, job) for key, job in jobs.items()]
+    if nb_processes > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(nb_processes) as pool:
+            for key, value in pool.imap_unordered(_play_job, tasks):
+                _done(key, value)
+    else:
+        for task in tasks:
+            _done(*_play_job(task))
+
+    rows = []
+    for config in configs:
+        totals = dict(score=0, max_score=0, steps=0, wins=0, episodes=0, duration=0.0)
+        for game_file in game_files:
+            for seed in seeds:
+                value = results[ResultCache.key(config, game_digests[game_file], seed, version)]
+                for name in totals:
+                    totals[name] += value[name]
+        totals['config'] = config
+        totals['normalized_score'] = totals['score'] / totals['max_score'] if totals['max_score'] > 0 else 0.0
+        totals['steps_per_win'] = totals['steps'] / totals['wins'] if totals['wins'] > 0 else None
+        rows.append(totals)
+    return rows
+
+
+def pareto_front(rows: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    :return: The rows that no other row beats on both a higher `normalized_score` and fewer `steps_per_win`.
+    """
+
+    def objectives(row):
+        steps_per_win = row['steps_per_win']
+        return row['normalized_score'], -(steps_per_win if steps_per_win is not None else float('inf'))
+
+    result = []
+    for row in rows:
+        score, steps = objectives(row)
+        dominated = False
+        for other in rows:
+            other_score, other_steps = objectives(other)
+            if other_score >= score and other_steps >= steps and (other_score > score or other_steps > steps):
+                dominated = True
+                break
+        if not dominated:
+            result.append(row)
+    return result
+
+
+def format_report(rows: Sequence[Dict[str, Any]]) -> str:
+    """
+    :return: A table of the configurations, the best scores first. `*` marks the Pareto front.
+    """
+    front = {id(row) for row in pareto_front(rows)}
+    lines = ["  {:>7} {:>9} {:>6} {:>13}  {}".format("score", "episodes", "wins", "steps per win", "config")]
+    for row in sorted(rows, key=lambda r: r['normalized_score'], reverse=True):
+        steps_per_win = row['steps_per_win']
+        lines.append("{} {:>7.3f} {:>9} {:>6} {:>13}  {}".format(
+            '*' if id(row) in front else ' ', row['normalized_score'], row['episodes'], row['wins'],
+            "{:.1f}".format(steps_per_win) if steps_per_win is not None else "-", _config_key(row['config'])))
+    return '\n'.join(lines)
+
+
+def _load_space(value: str) -> Dict[str, List[Any]]:
+    if os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep configurations of the agent.")
+    parser.add_argument("games_dir")
+    parser.add_argument("--grid", required=True,
+                        help="JSON, or a JSON file, with the values to try for each key of"
+                             " `custom_agent.default_config`.")
+    parser.add_argument("--random", type=int, metavar="N",
+                        help="Try N combinations picked at random instead of all of them.")
+    parser.add_argument("--seeds", type=int, nargs='+', default=[0],
+                        help="Play each game once for each seed of the agent's random choices.")
+    parser.add_argument("--nb-games", type=int, help="Play a subset of the games, picked with --games-seed.")
+    parser.add_argument("--games-seed", type=int, default=0)
+    parser.add_argument("--nb-processes", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--cache", default=_default_cache_path,
+                        help="The file of the cached results. Default: %(default)s")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    space = _load_space(args.grid)
+    if args.random is not None:
+        configs = random_configs(space, args.random, args.games_seed)
+    else:
+        configs = grid_configs(space)
+    game_files = select_games(args.games_dir, args.nb_games, args.games_seed)
+    print("Playing {} games with {} configurations and {} seeds.".format(len(game_files), len(configs),
+                                                                         len(args.seeds)))
+
+    def _report_job(job, value):
+        config, game_file, seed = job
+        print("{:3d} / {:3d}\t{}\tseed {}\t{}".format(value['score'], value['steps'], os.path.basename(game_file),
+                                                      seed, _config_key(config)))
+
+    cache = ResultCache(args.cache)
+    try:
+        rows = run_sweep(configs, game_files, args.seeds, args.nb_processes, cache, callback=_report_job)
+    finally:
+        cache.close()
+    print(format_report(rows))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(results=rows, pareto_front=pareto_front(rows)), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,13 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
+import gc
 import glob
 import json
 import multiprocessing
 import os
+import queue
 import sys
 import tempfile
 import time
@@ -83,13 +86,53 @@ class _ReplayAgent:
         step = self._step
         self._step += 1
 
-        command = self._stats["games"][self._game]["runs"][self._episode]["commands"][step]
-        return [command]
+        commands = self._stats["games"][self._game]["runs"][self._episode]["commands"]
+        if step >= len(commands):
+            # The episode was ended early.
+            return ["wait"]
+        return [commands[step]]
 
+    def should_abort_episode(self):
+        if self._game is None:
+            return False
+        run = self._stats["games"][self._game]["runs"][self._episode]
+        return run.get("aborted", False) and self._step > len(run["commands"])
 
-def _play_game(agent_class, agent_class_args, gamefile):
-    game_name = os.path.basename(gamefile)
+    def nb_episodes(self, game_name):
+        # Evaluations with --adaptive-episodes played fewer episodes of some games.
+        return len(self._stats["games"][game_name]["runs"])
+
+    def get_failure_counts(self, game_index=None):
+        # The episode is over when the counts are asked for.
+        runs = self._stats["games"][self._game]["runs"]
+        return runs[self._episode - 1].get("failures", {})
+
+
+def _should_abort_episode(agent):
+    """
+    Agents can end an episode early, e.g. when they are stuck, to save environment steps.
+    """
+    should_abort_episode = getattr(agent, "should_abort_episode", None)
+    return should_abort_episode is not None and should_abort_episode()
+
+
+def _should_abort_game(agent, game_index):
+    """
+    Agents that play games in slots that are refilled independently can end the episode of one game early.
+    """
+    should_abort_game = getattr(agent, "should_abort_game", None)
+    return should_abort_game is not None and should_abort_game(game_index)
+
+
+def _failure_counts(agent, game_index):
+    """
+    Agents can count the failures of their policy by kind in each episode.
+    """
+    get_failure_counts = getattr(agent, "get_failure_counts", None)
+    return get_failure_counts(game_index) if get_failure_counts is not None else {}
 
+
+def _make_agent(agent_class, agent_class_args):
     if agent_class_args:
         agent = agent_class(agent_class_args)
     else:
@@ -103,40 +146,123 @@ def _play_game(agent_class, agent_class_args, gamefile):
     requested_infos.has_won = True
     requested_infos.has_lost = True
     requested_infos.max_score = True
+    return agent, requested_infos
 
-    stats = {}
-    start_time = time.time()
-
-    stats["runs"] = []
 
+def _register_game(gamefile, requested_infos, batch_size=1):
     name = "test_{}".format(hash(gamefile))
     env_id = textworld.gym.register_games([gamefile], requested_infos,
                                             max_episode_steps=MAX_EPISODE_STEPS,
                                             name=name)
-    env_id = textworld.gym.make_batch(env_id, batch_size=1)
+    # Step the copies of the game in parallel processes.
+    return textworld.gym.make_batch(env_id, batch_size=batch_size, parallel=batch_size > 1)
+
+
+def _new_game_stats():
+    return {
+        "runs": [],
+        "aborted_episodes": 0,
+        "steps_reclaimed": 0,
+        "time_reclaimed": 0.0,
+    }
+
+
+def _make_metrics_reporter(metrics_queue):
+    if metrics_queue is None:
+        return None
+    from metrics import MetricsReporter
+    return MetricsReporter(metrics_queue)
+
+
+def _get_memory_accountant(memory_report):
+    if not memory_report:
+        return None
+    from memory_accounting import get_accountant
+    return get_accountant()
+
+
+def _episodes_converged(adaptive_episodes, runs):
+    """
+    With adaptive episodes, the episodes of a game stop once the ones played so far estimate its score and steps.
+    """
+    if not adaptive_episodes:
+        return False
+    from episode_budget import episodes_converged
+    return episodes_converged(runs)
+
+
+def _play_game(agent_class, agent_class_args, gamefile, trace_dir=None, metrics_queue=None, memory_report=False,
+               adaptive_episodes=False):
+    """
+    :param adaptive_episodes: Stop playing the game before `NB_EPISODES` episodes once its results converged,
+        see `episode_budget.py`.
+    """
+    game_name = os.path.basename(gamefile)
+
+    memory_accountant = _get_memory_accountant(memory_report)
+    agent, requested_infos = _make_agent(agent_class, agent_class_args)
+    metrics = _make_metrics_reporter(metrics_queue)
+    if metrics is not None:
+        metrics.game_started()
+
+    start_time = time.time()
+    stats = _new_game_stats()
+
+    env_id = _register_game(gamefile, requested_infos)
     env = gym.make(env_id)
 
-    for no_episode in range(NB_EPISODES):
+    trace_writer = None
+    get_trace_info = getattr(agent, "get_trace_info", None)
+    if trace_dir is not None:
+        from trace_store import TraceWriter
+        # One store per game so that processes never write to the same files.
+        trace_writer = TraceWriter(os.path.join(trace_dir, game_name))
+
+    nb_episodes = agent.nb_episodes(game_name) if isinstance(agent, _ReplayAgent) else NB_EPISODES
+    for no_episode in range(nb_episodes):
+        episode_start_time = time.time()
         obs, infos = env.reset()
 
         all_commands = []
         scores = [0] * len(obs)
         dones = [False] * len(obs)
         steps = [0] * len(obs)
+        aborted = False
         while not all(dones):
-            # Increase step counts.
-            steps = [step + int(not done) for step, done in zip(steps, dones)]
-
             # HACK to get the replay agent the current game
             if isinstance(agent, _ReplayAgent):
                 infos["_name"] = game_name
 
+            agent_start_time = time.perf_counter()
             commands = agent.act(obs, scores, dones, infos)
+            agent_seconds = time.perf_counter() - agent_start_time
+            if _should_abort_episode(agent):
+                aborted = True
+                break
+
+            # Increase step counts.
+            steps = [step + int(not done) for step, done in zip(steps, dones)]
+
             all_commands.append(commands)
+            if trace_writer is not None:
+                trace_info = get_trace_info(0) if get_trace_info is not None else {}
+                trace_writer.add_step(game_name, no_episode, steps[0] - 1, obs[0], commands[0], scores[0],
+                                      **trace_info)
+            env_start_time = time.perf_counter()
             obs, scores, dones, infos = env.step(commands)
+            if metrics is not None:
+                metrics.add_step(agent_seconds, time.perf_counter() - env_start_time)
 
         # Let the agent knows the game is done.
-        agent.act(obs, scores, dones, infos)
+        if aborted:
+            agent.act(obs, scores, [True] * len(obs), infos)
+            steps_reclaimed = MAX_EPISODE_STEPS - steps[0]
+            stats["aborted_episodes"] += 1
+            stats["steps_reclaimed"] += steps_reclaimed
+            # Estimate from the time that the steps took so far.
+            stats["time_reclaimed"] += steps_reclaimed * (time.time() - episode_start_time) / max(steps[0], 1)
+        else:
+            agent.act(obs, scores, dones, infos)
 
         # Collect stats
         stats["runs"].append({})
@@ -145,57 +271,354 @@ def _play_game(agent_class, agent_class_args, gamefile):
         stats["runs"][no_episode]["commands"] = [cmds[0] for cmds in all_commands]
         stats["runs"][no_episode]["has_won"] = infos["has_won"][0]
         stats["runs"][no_episode]["has_lost"] = infos["has_lost"][0]
+        stats["runs"][no_episode]["aborted"] = aborted
+        stats["runs"][no_episode]["failures"] = _failure_counts(agent, 0)
+        if trace_writer is not None:
+            trace_writer.add_episode(game_name, no_episode, scores[0], steps[0],
+                                     infos["has_won"][0], infos["has_lost"][0])
+        if metrics is not None:
+            metrics.episodes_done([scores[0]])
+        if _episodes_converged(adaptive_episodes, stats["runs"]):
+            break
+
+    if trace_writer is not None:
+        trace_writer.close()
 
     env.close()
     stats["max_scores"] = infos["max_score"][0]
+    stats["episodes_run"] = len(stats["runs"])
     elapsed = time.time() - start_time
     stats["duration"] = elapsed
+    if metrics is not None:
+        metrics.game_done()
+    if memory_accountant is not None:
+        # Don't count the agent, it is done with the game. Its bound methods refer to it and it has cycles.
+        del agent, get_trace_info
+        gc.collect()
+        stats["memory"] = memory_accountant.game_done()
+
+    return {game_name: stats}, requested_infos.basics + requested_infos.extras
+
+
+def _play_game_episodes_concurrently(agent_class, agent_class_args, gamefile, trace_dir=None, metrics_queue=None,
+                                     memory_report=False):
+    """
+    Like `_play_game` but the episodes are played at the same time as one batch of copies of the game.
+    """
+    game_name = os.path.basename(gamefile)
+
+    memory_accountant = _get_memory_accountant(memory_report)
+    agent, requested_infos = _make_agent(agent_class, agent_class_args)
+    metrics = _make_metrics_reporter(metrics_queue)
+    if metrics is not None:
+        metrics.game_started()
+
+    start_time = time.time()
+    stats = _new_game_stats()
+
+    env_id = _register_game(gamefile, requested_infos, batch_size=NB_EPISODES)
+    env = gym.make(env_id)
+
+    share_game_memory = getattr(agent, "share_game_memory", None)
+    if share_game_memory is not None:
+        share_game_memory(range(NB_EPISODES))
+
+    trace_writer = None
+    get_trace_info = getattr(agent, "get_trace_info", None)
+    if trace_dir is not None:
+        from trace_store import TraceWriter
+        trace_writer = TraceWriter(os.path.join(trace_dir, game_name))
+
+    obs, infos = env.reset()
+    all_commands = [[] for _ in obs]
+    scores = [0] * len(obs)
+    steps = [0] * len(obs)
+    # An episode ends when its game is done or when the agent ends it early.
+    # The batch keeps going until every episode ended so the results are kept from when each one ended.
+    ended = [False] * len(obs)
+    aborted = [False] * len(obs)
+    has_won = [False] * len(obs)
+    has_lost = [False] * len(obs)
+    while not all(ended):
+        agent_start_time = time.perf_counter()
+        commands = agent.act(obs, scores, ended, infos)
+        agent_seconds = time.perf_counter() - agent_start_time
+        num_steps = 0
+        for no_episode in range(len(obs)):
+            if ended[no_episode]:
+                continue
+            if _should_abort_game(agent, no_episode):
+                ended[no_episode] = True
+                aborted[no_episode] = True
+                steps_reclaimed = MAX_EPISODE_STEPS - steps[no_episode]
+                stats["aborted_episodes"] += 1
+                stats["steps_reclaimed"] += steps_reclaimed
+                stats["time_reclaimed"] += steps_reclaimed * (time.time() - start_time) / max(steps[no_episode], 1)
+                continue
+
+            steps[no_episode] += 1
+            num_steps += 1
+            all_commands[no_episode].append(commands[no_episode])
+            if trace_writer is not None:
+                trace_info = get_trace_info(no_episode) if get_trace_info is not None else {}
+                trace_writer.add_step(game_name, no_episode, steps[no_episode] - 1, obs[no_episode],
+                                      commands[no_episode], scores[no_episode], **trace_info)
+
+        if all(ended):
+            break
+
+        env_start_time = time.perf_counter()
+        obs, new_scores, dones, infos = env.step(commands)
+        if metrics is not None:
+            metrics.add_step(agent_seconds, time.perf_counter() - env_start_time, num_steps)
+        for no_episode, done in enumerate(dones):
+            if not ended[no_episode]:
+                scores[no_episode] = new_scores[no_episode]
+                has_won[no_episode] = infos["has_won"][no_episode]
+                has_lost[no_episode] = infos["has_lost"][no_episode]
+                ended[no_episode] = done
+
+    # Let the agent knows the games are done.
+    agent.act(obs, scores, [True] * len(obs), infos)
+
+    for no_episode in range(len(obs)):
+        stats["runs"].append({
+            "score": scores[no_episode],
+            "steps": steps[no_episode],
+            "commands": all_commands[no_episode],
+            "has_won": has_won[no_episode],
+            "has_lost": has_lost[no_episode],
+            "aborted": aborted[no_episode],
+            "failures": _failure_counts(agent, no_episode),
+        })
+        if trace_writer is not None:
+            trace_writer.add_episode(game_name, no_episode, scores[no_episode], steps[no_episode],
+                                     has_won[no_episode], has_lost[no_episode])
+
+    if trace_writer is not None:
+        trace_writer.close()
+
+    env.close()
+    stats["max_scores"] = infos["max_score"][0]
+    stats["episodes_run"] = len(stats["runs"])
+    stats["duration"] = time.time() - start_time
+    if metrics is not None:
+        metrics.episodes_done(scores)
+        metrics.game_done()
+    if memory_accountant is not None:
+        # Don't count the agent, it is done with the game. Its bound methods refer to it and it has cycles.
+        del agent, get_trace_info, share_game_memory
+        gc.collect()
+        stats["memory"] = memory_accountant.game_done()
 
     return {game_name: stats}, requested_infos.basics + requested_infos.extras
 
 
-def evaluate(agent_class, agent_class_args, game_files, nb_processes):
+def _make_env(requested_infos, env_ids, gamefile):
+    """
+    :param env_ids: The ids of the games registered so far, so that each game is registered once.
+    """
+    if gamefile not in env_ids:
+        env_ids[gamefile] = _register_game(gamefile, requested_infos)
+    return gym.make(env_ids[gamefile])
+
+
+def _play_games_continuously(agent_class, agent_class_args, game_files, nb_slots, trace_dir=None, callback=None,
+                             metrics_queue=None, memory_report=False, env_workers=False, adaptive_episodes=False):
+    """
+    Like `_play_game` for many games at a time with one agent, see `slot_runner.play_games_continuously`.
+
+    :param callback: Called with the results of each game, in the same format as `_play_game`,
+        as soon as all of its episodes are done.
+    :return: The results of each game if there is no callback.
+    """
+    from slot_runner import play_games_continuously
+
+    memory_accountant = _get_memory_accountant(memory_report)
+    agent, requested_infos = _make_agent(agent_class, agent_class_args)
+    infos = requested_infos.basics + requested_infos.extras
+    game_callback = (lambda data: callback((data, infos))) if callback is not None else None
+    results = play_games_continuously(agent, functools.partial(_make_env, requested_infos, {}), game_files, nb_slots,
+                                      NB_EPISODES, MAX_EPISODE_STEPS, _new_game_stats, trace_dir, game_callback,
+                                      _make_metrics_reporter(metrics_queue), memory_accountant, env_workers,
+                                      adaptive_episodes)
+    return [(data, infos) for data in results]
+
+
+def evaluate(agent_class, agent_class_args, game_files, nb_processes, trace_dir=None, nb_slots=None,
+             concurrent_episodes=False, metrics_file=None, metrics_port=None, memory_report=False,
+             keep_commands=True, env_workers=False, adaptive_episodes=False):
+    """
+    :param memory_report: Record the memory of the processes after each game in its results
+        and a summary in `stats["memory"]`.
+    :param env_workers: With `nb_slots`, play all of the games with one agent in this process
+        and step the environment of each slot in its own process, see `slot_runner.EnvWorkers`.
+    :param keep_commands: `False` to drop the commands of the episodes from the results once a game is done,
+        so that the results of many games stay small. The results can't be replayed then.
+    :param adaptive_episodes: Stop playing each game once its results converged instead of always playing
+        `NB_EPISODES` episodes, see `episode_budget.py`. Not with `concurrent_episodes`, which plays them all at once.
+    """
     stats = {"games": {}, "requested_infos": []}
+    if concurrent_episodes:
+        play_game = _play_game_episodes_concurrently
+    else:
+        play_game = functools.partial(_play_game, adaptive_episodes=adaptive_episodes)
 
     print("Using {} processes.".format(nb_processes))
     desc = "Evaluating {} games".format(len(game_files))
     pbar = tqdm.tqdm(total=len(game_files), desc=desc)
 
+    metrics_queue = None
+    metrics_exporter = None
+    if metrics_file is not None or metrics_port is not None:
+        from metrics import EvaluationMetrics, MetricsExporter
+        # Processes of a pool can only share a queue through a manager.
+        metrics_queue = multiprocessing.Manager().Queue() if nb_processes > 1 else queue.Queue()
+        metrics_exporter = MetricsExporter(EvaluationMetrics(len(game_files)), metrics_queue,
+                                           path=metrics_file, port=metrics_port).start()
+        if metrics_port is not None:
+            print("Serving metrics at http://127.0.0.1:{}/metrics".format(metrics_exporter.port))
+
     def _assemble_results(args):
         data, requested_infos = args
+        if not keep_commands:
+            for game_stats in data.values():
+                for run in game_stats["runs"]:
+                    run.pop("commands", None)
         stats["games"].update(data)
         stats["requested_infos"] = requested_infos
 
         game_name, infos = list(data.items())[0]
-        total_scores = sum(d["score"] for d in infos["runs"])
-        total_steps = sum(d["steps"] for d in infos["runs"])
-
-        desc = "{:2d} / {}:\t{}".format(total_scores, total_steps, game_name)
+        runs = infos["runs"]
+        total_scores = sum(d["score"] for d in runs)
+        total_steps = sum(d["steps"] for d in runs)
+
+        if len(runs) < NB_EPISODES:
+            # Scale the totals of the games that converged so that they compare with the other games.
+            scale = NB_EPISODES / len(runs)
+            desc = "{:4.1f} / {:.0f}:\t{}\t(converged after {} episodes, totals scaled to {})".format(
+                total_scores * scale, total_steps * scale, game_name, len(runs), NB_EPISODES)
+        else:
+            desc = "{:2d} / {}:\t{}".format(total_scores, total_steps, game_name)
+        if infos.get("aborted_episodes"):
+            desc += "\t(ended {} stuck episodes early, saved {} steps, {:.1f}s)".format(
+                infos["aborted_episodes"], infos["steps_reclaimed"], infos["time_reclaimed"])
         pbar.write(desc)
         pbar.update()
 
-    if nb_processes > 1:
-        pool = multiprocessing.Pool(nb_processes)
-        for game_file in game_files:
-            pool.apply_async(_play_game, (agent_class, agent_class_args, game_file), callback=_assemble_results)
+    def _record_failure(error):
+        pbar.write("Failed: {!r}".format(error))
+        if metrics_queue is not None:
+            metrics_queue.put(("failure", os.getpid()))
+
+    try:
+        if nb_slots:
+            print("Playing {} games at a time {}.".format(
+                nb_slots, "with one process per environment" if env_workers else "in each process"))
+            if env_workers:
+                # The processes of a pool can't start processes so the agent plays in this one.
+                _play_games_continuously(agent_class, agent_class_args, game_files, nb_slots, trace_dir,
+                                         callback=_assemble_results, metrics_queue=metrics_queue,
+                                         memory_report=memory_report, env_workers=True,
+                                         adaptive_episodes=adaptive_episodes)
+            elif nb_processes > 1:
+                pool = multiprocessing.Pool(nb_processes)
+                for i in range(nb_processes):
+                    # Each process keeps its own slots busy with its share of the games.
+                    pool.apply_async(_play_games_continuously,
+                                     (agent_class, agent_class_args, game_files[i::nb_processes], nb_slots,
+                                      trace_dir, None, metrics_queue, memory_report, False, adaptive_episodes),
+                                     callback=lambda results: [_assemble_results(result) for result in results],
+                                     error_callback=_record_failure)
+
+                pool.close()
+                pool.join()
+            else:
+                _play_games_continuously(agent_class, agent_class_args, game_files, nb_slots, trace_dir,
+                                         callback=_assemble_results, metrics_queue=metrics_queue,
+                                         memory_report=memory_report, adaptive_episodes=adaptive_episodes)
 
-        pool.close()
-        pool.join()
-        pbar.close()
+            pbar.close()
 
-    else:
-        for game_file in game_files:
-            data = _play_game(agent_class, agent_class_args, game_file)
-            _assemble_results(data)
+        elif nb_processes > 1:
+            pool = multiprocessing.Pool(nb_processes)
+            for game_file in game_files:
+                pool.apply_async(play_game,
+                                 (agent_class, agent_class_args, game_file, trace_dir, metrics_queue, memory_report),
+                                 callback=_assemble_results, error_callback=_record_failure)
+
+            pool.close()
+            pool.join()
+            pbar.close()
 
-        pbar.close()
+        else:
+            for game_file in game_files:
+                data = play_game(agent_class, agent_class_args, game_file, trace_dir, metrics_queue, memory_report)
+                _assemble_results(data)
+
+            pbar.close()
+    finally:
+        if metrics_exporter is not None:
+            metrics_exporter.stop()
+
+    if adaptive_episodes:
+        episodes_run = sum(len(game_stats["runs"]) for game_stats in stats["games"].values())
+        print("Played {} of {} episodes.".format(episodes_run, NB_EPISODES * len(stats["games"])))
+
+    if memory_report:
+        from memory_accounting import summarize
+        stats["memory"] = summarize(game_stats["memory"] for game_stats in stats["games"].values()
+                                    if "memory" in game_stats)
+        print("Memory: {:.1f} MB traced at most, {:.1f} MB peak, {:+.1f} MB growth over the games of a process."
+              .format(stats["memory"]["max_traced_bytes"] / 1e6, stats["memory"]["max_peak_bytes"] / 1e6,
+                      stats["memory"]["growth_bytes"] / 1e6))
 
     return stats
 
 
-def _run_evaluation(agent_class, args, agent_class_args=None):
-    games = glob.glob(os.path.join(args.games_dir, "**/*.ulx"), recursive=True)
-    stats = evaluate(agent_class, agent_class_args, games, args.nb_processes)
+def _select_games(args):
+    """
+    :return: The paths of the games to evaluate: the ones in the games list if there is one,
+        the ones picked from the manifest if there is one or else all of the games in the games directory.
+    """
+    if args.games_list:
+        with open(args.games_list) as f:
+            return [os.path.join(args.games_dir, line.rstrip('\n')) for line in f if line.strip()]
+    if args.manifest:
+        from game_manifest import load_manifest
+        manifest = load_manifest(args.manifest, args.games_dir, rescan=args.rescan_games)
+        return manifest.select(args.nb_games, args.games_seed)
+    return glob.glob(os.path.join(args.games_dir, "**/*.ulx"), recursive=True)
+
+
+def _write_games_list(args, games, path):
+    """
+    Write the games to evaluate for an evaluation in a container or a sandbox, relative to the games directory.
+    """
+    games_dir = os.path.abspath(args.games_dir)
+    with open(path, 'w') as f:
+        for game in games:
+            f.write(os.path.relpath(os.path.abspath(game), games_dir) + '\n')
+
+
+def _record_in_manifest(args, stats):
+    """
+    Keep the durations, steps and scores of the games in the manifest to order the games of the next evaluations.
+    """
+    if not args.manifest:
+        return
+    from game_manifest import GameManifest
+    manifest = GameManifest.load(args.manifest, args.games_dir)
+    manifest.record_results(stats)
+    manifest.save()
+
+
+def _run_evaluation(agent_class, args, agent_class_args=None, games=None):
+    if games is None:
+        games = _select_games(args)
+    stats = evaluate(agent_class, agent_class_args, games, args.nb_processes, args.trace_dir, args.nb_slots,
+                     args.concurrent_episodes, args.metrics_file, args.metrics_port, args.memory_report,
+                     not args.discard_commands, args.env_workers, args.adaptive_episodes)
 
     out_dir = os.path.dirname(os.path.abspath(args.output))
     if not os.path.isdir(out_dir):
@@ -204,14 +627,20 @@ def _run_evaluation(agent_class, args, agent_class_args=None):
     with open(args.output, "w") as f:
         json.dump(stats, f)
 
+    if agent_class is not _ReplayAgent:
+        _record_in_manifest(args, stats)
+
 
 def _dockerize(args):
     submission_dir = os.path.abspath(args.submission_dir)
     games_dir = os.path.abspath(args.games_dir)
     output_dir = os.path.dirname(os.path.abspath(args.output))
     self_file = os.path.abspath(__file__)
+    games = _select_games(args)
 
-    with tempfile.NamedTemporaryFile(dir=output_dir) as output_file:
+    with tempfile.NamedTemporaryFile(dir=output_dir) as output_file, \
+            tempfile.NamedTemporaryFile(dir=output_dir, suffix=".txt") as games_list_file:
+        _write_games_list(args, games, games_list_file.name)
         client = docker.from_env()
 
         image_path = os.path.join(submission_dir, "Dockerimage")
@@ -238,6 +667,10 @@ def _dockerize(args):
                 "bind": "/usr/bin/evaluate.py",
                 "mode": "ro",
             },
+            games_list_file.name: {
+                "bind": "/usr/share/textworld-games.txt",
+                "mode": "ro",
+            },
         }
 
         command = [
@@ -247,10 +680,18 @@ def _dockerize(args):
             "/usr/src/submission",
             "/usr/share/textworld-games",
             "/usr/share/textworld-stats.json",
+            "--games-list", "/usr/share/textworld-games.txt",
         ]
 
-        if args.debug:
-            command += ["--debug"]
+        command += _forwarded_options(args)
+        if args.metrics_file:
+            metrics_dir = os.path.dirname(os.path.abspath(args.metrics_file))
+            os.makedirs(metrics_dir, exist_ok=True)
+            volumes[metrics_dir] = {
+                "bind": "/usr/share/textworld-metrics",
+                "mode": "rw",
+            }
+            command += ["--metrics-file", "/usr/share/textworld-metrics/" + os.path.basename(args.metrics_file)]
 
         print("Loading {}...".format(image))
         container = client.containers.run(
@@ -273,7 +714,95 @@ def _dockerize(args):
         print("Done")
         stats = json.load(output_file)
 
-    _run_evaluation(_ReplayAgent, args, agent_class_args=stats)
+    _record_in_manifest(args, stats)
+    _replay(args, stats, games)
+
+
+def _sandbox(args):
+    """
+    Like `_dockerize` but the evaluation runs in a sandboxed local process, see sandbox.py.
+    """
+    import sandbox
+
+    submission_dir = os.path.abspath(args.submission_dir)
+    games_dir = os.path.abspath(args.games_dir)
+    read_only_dirs = [submission_dir, games_dir]
+    games = _select_games(args)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        output = os.path.join(output_dir, "stats.json")
+        games_list = os.path.join(output_dir, "games.txt")
+        _write_games_list(args, games, games_list)
+        argv = ["--in-docker", submission_dir, games_dir, output, "--nb-processes", str(args.nb_processes),
+                "--games-list", games_list]
+        argv += _forwarded_options(args)
+        writable_dirs = [output_dir]
+        metrics_in_read_only_dir = False
+        if args.metrics_file:
+            metrics_file = os.path.abspath(args.metrics_file)
+            metrics_dir = os.path.dirname(metrics_file)
+            os.makedirs(metrics_dir, exist_ok=True)
+            writable_dirs.append(metrics_dir)
+            argv += ["--metrics-file", metrics_file]
+            metrics_in_read_only_dir = any(metrics_dir == d or metrics_dir.startswith(d + os.sep)
+                                           for d in read_only_dirs)
+
+        exit_code = None
+        if args.sandbox_socket and not metrics_in_read_only_dir:
+            exit_code = sandbox.run_in_worker(args.sandbox_socket, argv, read_only_dirs, args.sandbox_memory_mb,
+                                              cpu_seconds=TIMEOUT, timeout=TIMEOUT)
+            if exit_code is None:
+                print("No sandbox worker for these directories at {}, starting a new sandbox."
+                      .format(args.sandbox_socket))
+        if exit_code is None:
+            exit_code = sandbox.run(os.path.abspath(__file__), argv, read_only_dirs, writable_dirs,
+                                    args.sandbox_memory_mb, cpu_seconds=TIMEOUT, timeout=TIMEOUT)
+        if exit_code != 0:
+            sys.exit("The evaluation failed in the sandbox with exit code {}.".format(exit_code))
+
+        print("Done")
+        with open(output) as f:
+            stats = json.load(f)
+
+    _record_in_manifest(args, stats)
+    _replay(args, stats, games)
+
+
+def _forwarded_options(args):
+    """
+    :return: The options for the evaluation in a container or a sandbox, except the paths.
+    """
+    options = []
+    if args.debug:
+        options += ["--debug"]
+    if args.nb_slots:
+        options += ["--nb-slots", str(args.nb_slots)]
+    if args.concurrent_episodes:
+        options += ["--concurrent-episodes"]
+    if args.memory_report:
+        options += ["--memory-report"]
+    if args.env_workers:
+        options += ["--env-workers"]
+    if args.adaptive_episodes:
+        options += ["--adaptive-episodes"]
+    return options
+
+
+def _replay(args, stats, games):
+    """
+    Check the results of an evaluation that ran in a container or a sandbox by replaying their commands here.
+    """
+    # The replay agent plays one game at a time.
+    args.nb_slots = None
+    args.concurrent_episodes = False
+    args.env_workers = False
+    # The replay plays the episodes that were played.
+    args.adaptive_episodes = False
+    # The metrics are about playing the games, not about replaying them.
+    args.metrics_file = None
+    args.metrics_port = None
+    args.memory_report = False
+    _run_evaluation(_ReplayAgent, args, agent_class_args=stats, games=games)
 
 
 def main():
@@ -284,7 +813,56 @@ def main():
     parser.add_argument("output", nargs='?', default="stats.json")
     parser.add_argument("--nb-processes", type=int)
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--trace-dir",
+                        help="Log every step to a trace store in this directory, see trace_store.py."
+                             " When not running in Docker, the steps are logged while replaying the results"
+                             " so only the observations and the actions are available.")
+    parser.add_argument("--nb-slots", type=int,
+                        help="Play this many games at a time in each process with one batched agent."
+                             " A slot gets the next episode to play as soon as its episode ends.")
+    parser.add_argument("--env-workers", action="store_true",
+                        help="With --nb-slots, step the environment of each slot in its own process and pass the"
+                             " observations and the commands through shared memory, see shm_ring.py."
+                             " One agent in the main process acts on the slots whose environments answered.")
+    parser.add_argument("--concurrent-episodes", action="store_true",
+                        help="Play the episodes of a game at the same time as one batch of copies of the game.")
+    parser.add_argument("--adaptive-episodes", action="store_true",
+                        help="Stop playing a game before all of its episodes once its results converged: its first"
+                             " episodes all had the same result or the confidence intervals of its mean score and"
+                             " steps are narrow, see episode_budget.py.")
+    parser.add_argument("--metrics-file",
+                        help="Rewrite live metrics of the evaluation (throughput, latencies, scores) to this file"
+                             " in the Prometheus text format, see metrics.py.")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve the live metrics at http://127.0.0.1:<port>/metrics."
+                             " Only with --in-docker since the container has no network.")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Record the memory of the processes after each game, by subsystem, with tracemalloc."
+                             " It slows the evaluation down.")
+    parser.add_argument("--discard-commands", action="store_true",
+                        help="Don't keep the commands of the episodes in the results,"
+                             " to keep the memory flat over many games.")
+    parser.add_argument("--manifest",
+                        help="Pick the games from this manifest of the games directory instead of walking it,"
+                             " longest first, and keep their results in it, see game_manifest.py."
+                             " It is built if it doesn't exist.")
+    parser.add_argument("--rescan-games", action="store_true",
+                        help="With --manifest, update the manifest with the new and changed games first.")
+    parser.add_argument("--nb-games", type=int,
+                        help="With --manifest, evaluate this many games picked at random.")
+    parser.add_argument("--games-seed", type=int, default=0,
+                        help="With --nb-games, the seed to pick the games.")
+    parser.add_argument("--games-list", help=argparse.SUPPRESS)
+    parser.add_argument("--sandbox", action="store_true",
+                        help="Run the evaluation in a sandboxed local process instead of Docker, see sandbox.py.")
+    parser.add_argument("--sandbox-socket",
+                        help="With --sandbox, run the evaluation with the warm worker serving at this socket"
+                             " if there is one.")
+    parser.add_argument("--sandbox-memory-mb", type=int,
+                        help="With --sandbox, the maximum memory of each process of the evaluation.")
     args = parser.parse_args()
+    if args.adaptive_episodes and args.concurrent_episodes:
+        parser.error("--adaptive-episodes can't stop the episodes of --concurrent-episodes, they are played at once.")
 
     args.nb_processes = args.nb_processes or multiprocessing.cpu_count()
     if args.debug:
@@ -296,10 +874,20 @@ def main():
         args.submission_dir = os.path.abspath(args.submission_dir)
         args.games_dir = os.path.abspath(args.games_dir)
         args.output = os.path.abspath(args.output)
+        if args.trace_dir:
+            args.trace_dir = os.path.abspath(args.trace_dir)
+        if args.metrics_file:
+            args.metrics_file = os.path.abspath(args.metrics_file)
+        if args.manifest:
+            args.manifest = os.path.abspath(args.manifest)
+        if args.games_list:
+            args.games_list = os.path.abspath(args.games_list)
         os.chdir(args.submission_dir)  # Needed to load local files (e.g. vocab.txt)
         sys.path = [args.submission_dir] + sys.path  # Prepend to PYTHONPATH
         from custom_agent import CustomAgent
         _run_evaluation(CustomAgent, args)
+    elif args.sandbox:
+        _sandbox(args)
     else:
         _dockerize(args)
 
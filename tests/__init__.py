@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# The agents of the tests share their caches in a directory of their own,
+# never with the evaluations that ran on the machine.
+_cache_dir = tempfile.mkdtemp(prefix='tw-tests-')
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+os.environ['TW_RECIPE_CACHE'] = os.path.join(_cache_dir, 'recipe-cache.sqlite')
+os.environ['TW_LAYOUT_LIBRARY'] = os.path.join(_cache_dir, 'layout-library.sqlite')
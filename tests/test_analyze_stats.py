@@ -0,0 +1,84 @@
+import json
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from analyze_stats import compare, iter_games, load_runs, summarize, welch_t_test
+
+
+def _runs(scores, steps=10):
+    return [dict(score=score, steps=steps, has_won=score == 3, has_lost=False, aborted=False,
+                 commands=["go north"] * steps) for score in scores]
+
+
+class TestAnalyzeStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, games):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            json.dump(dict(requested_infos=["description"], games=games, memory=dict(games=len(games))), f,
+                      indent=1)
+        return path
+
+    def test_iter_games(self):
+        games = {
+            'a.ulx': dict(runs=_runs([1, 2]), max_scores=3, duration=1.25),
+            'b "quoted".ulx': dict(runs=_runs([3]), max_scores=3, duration=12345678901),
+        }
+        path = self._write('stats.json', games)
+        # Chunks smaller than the values make the reader read more in the middle of them.
+        self.assertEqual(list(games.items()), list(iter_games(path, chunk_size=7)))
+        self.assertEqual([], list(iter_games(self._write('empty.json', {}), chunk_size=3)))
+
+    def test_load_runs(self):
+        path = self._write('stats.json', {
+            'a.ulx': dict(runs=_runs([1, 2]), max_scores=3),
+            'b.ulx': dict(runs=_runs([3, 3, 0], steps=4), max_scores=3),
+        })
+        table = load_runs(path, chunk_size=16)
+        self.assertEqual(['a.ulx', 'b.ulx'], table.names)
+        np.testing.assert_array_equal([[1, 2, np.nan], [3, 3, 0]], table.scores)
+        summary = summarize(table)
+        self.assertEqual((5, 9.0, 15.0, 2), (summary['episodes'], summary['score'], summary['max_score'],
+                                              summary['wins']))
+        self.assertEqual(4, summary['won_steps']['p50'])
+
+    def test_welch_t_test(self):
+        a = np.array([[1, 2, 3, 4, 5], [1, 1, 1, np.nan, np.nan], [2, 2, 2, 2, 2], [1, np.nan, np.nan, 2, 3]])
+        b = np.array([[2, 4, 6, 8, 10], [1, 1, 1, 1, 1], [3, 3, 3, 3, 3], [1, 2, 3, 4, 5]])
+        t, p = welch_t_test(a, b)
+        # Same as scipy.stats.ttest_ind(a, b, equal_var=False).
+        self.assertAlmostEqual(1.8973666, t[0], places=6)
+        self.assertAlmostEqual(0.1075312, p[0], places=6)
+        self.assertEqual((0, 1), (t[1], p[1]))
+        self.assertEqual((math.inf, 0), (t[2], p[2]))
+        self.assertAlmostEqual(1.0954451, t[3], places=6)
+        self.assertAlmostEqual(0.3161334, p[3], places=6)
+
+    def test_compare(self):
+        base = self._write('base.json', {
+            'same.ulx': dict(runs=_runs([3, 3, 3, 3]), max_scores=3),
+            'worse.ulx': dict(runs=_runs([3, 3, 3, 2]), max_scores=3),
+            'slower.ulx': dict(runs=_runs([1, 1, 1, 1]), max_scores=3),
+            'gone.ulx': dict(runs=_runs([1]), max_scores=3),
+        })
+        new = self._write('new.json', {
+            'same.ulx': dict(runs=_runs([3, 3, 3, 3]), max_scores=3),
+            'worse.ulx': dict(runs=_runs([0, 1, 0, 1]), max_scores=3),
+            'slower.ulx': dict(runs=_runs([1, 1, 1, 1], steps=20), max_scores=3),
+        })
+        comparison = compare(load_runs(base), load_runs(new), top=5)
+        self.assertEqual((3, 1, 0), (comparison['games'], comparison['only_in_base'], comparison['only_in_new']))
+        self.assertEqual((0, 1), (comparison['significantly_better'], comparison['significantly_worse']))
+        self.assertEqual(['worse.ulx', 'slower.ulx'], [row['game'] for row in comparison['regressions']])
+        self.assertEqual(-2.25, comparison['regressions'][0]['score_delta'])
+        self.assertEqual(10, comparison['regressions'][1]['steps_delta'])
+        self.assertEqual(4, comparison['new']['wins'])
@@ -0,0 +1,88 @@
+import unittest
+
+from batched_paths import BatchedPaths
+from room import Room
+from room_search import opposite_dir, RoomSearch
+
+
+def _connect(a, direction, b):
+    a.directions[direction] = b
+    b.directions[opposite_dir(direction)] = a
+
+
+def _make_map():
+    """
+    Kitchen - Corridor - Backyard, with a closed door between the Kitchen and the Pantry to the north of it
+    and the Pantry also going east to the Backyard.
+    """
+    rooms = {name: Room(name, ["north", "east", "south", "west"])
+             for name in ("Kitchen", "Corridor", "Backyard", "Pantry", "Garden")}
+    _connect(rooms["Kitchen"], "east", rooms["Corridor"])
+    _connect(rooms["Corridor"], "east", rooms["Backyard"])
+    _connect(rooms["Kitchen"], "north", rooms["Pantry"])
+    _connect(rooms["Pantry"], "east", rooms["Backyard"])
+    rooms["Kitchen"].set_door("north", "wooden door", is_open=False)
+    return rooms
+
+
+class TestBatchedPaths(unittest.TestCase):
+    def test_paths(self):
+        rooms = _make_map()
+        other = {"Kitchen": Room("Kitchen", ["south"])}
+        paths = BatchedPaths()
+        paths.invalidate(0, rooms)
+        paths.invalidate(3, other)
+        self.assertEqual(2, paths.distance(0, "Kitchen", "Backyard"))
+        self.assertEqual(["east", "east"], paths.path(0, "Kitchen", "Backyard"))
+        # The door only costs more one way.
+        self.assertEqual(2, paths.distance(0, "Kitchen", "Pantry"))
+        self.assertEqual(1, paths.distance(0, "Pantry", "Kitchen"))
+        self.assertEqual([], paths.path(3, "Kitchen", "Kitchen"))
+        self.assertIsNone(paths.path(0, "Kitchen", "Garden"))
+        self.assertIsNone(paths.distance(0, "Kitchen", "Supermarket"))
+        self.assertIsNone(paths.path(1, "Kitchen", "Pantry"))
+
+        # The paths are kept until the map changes.
+        distance = paths.frozen_distance(0)
+        self.assertTrue(rooms["Kitchen"].set_door("north", "wooden door", is_open=True))
+        self.assertFalse(rooms["Kitchen"].set_door("north", "wooden door", is_open=True))
+        self.assertEqual(2, paths.distance(0, "Kitchen", "Pantry"))
+        paths.invalidate(0)
+        self.assertEqual(1, paths.distance(0, "Kitchen", "Pantry"))
+        self.assertEqual(2, distance("Kitchen", "Pantry"))
+        self.assertIsNone(paths.frozen_distance(1)("Kitchen", "Pantry"))
+
+        paths.forget(0)
+        self.assertIsNone(paths.path(0, "Kitchen", "Pantry"))
+
+    def test_same_as_search(self):
+        rooms = _make_map()
+        paths = BatchedPaths()
+        paths.invalidate(0, rooms)
+        for start in rooms:
+            for target in rooms:
+                search = RoomSearch(rooms, rooms[start], target)
+                try:
+                    expected = search.get_path_to(target)
+                except KeyError:
+                    expected = None
+                path = paths.path(0, start, target)
+                if expected is None:
+                    self.assertIsNone(path)
+                    continue
+                cost = lambda p: sum(rooms[r].step_cost(d) for r, d in zip(_rooms_on(rooms, start, p), p))
+                self.assertEqual(cost(expected), cost(path))
+                self.assertEqual(cost(path), paths.distance(0, start, target))
+
+        search = RoomSearch(rooms, rooms["Backyard"], "Kitchen", find_path=lambda a, b: ["north", "west", "south"])
+        self.assertEqual("north", search.get_next_direction())
+
+
+def _rooms_on(rooms, start, path):
+    """
+    :return: The rooms that each direction of the path is taken from.
+    """
+    result = [start]
+    for direction in path[:-1]:
+        result.append(rooms[result[-1]].directions[direction].name)
+    return result
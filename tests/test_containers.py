@@ -0,0 +1,75 @@
+import unittest
+
+from containers import ContainerTracker
+
+_kitchen_ob = """-= Kitchen =-
+What's that over there? It looks like it's a fridge. You see a closed oven right there by you.
+You can make out a table. On the table you see a cookbook. Look over there! a counter.
+On the counter you make out a knife and a red apple.
+
+There is a closed frosted-glass door leading west. There is an exit to the east.
+"""
+
+_shed_ob = """-= Shed =-
+You see a closed toolbox. You can make out a workbench. But the thing hasn't got anything on it.
+"""
+
+
+class TestContainerTracker(unittest.TestCase):
+    def test_parse_room(self):
+        tracker = ContainerTracker()
+        tracker.update("Kitchen", _kitchen_ob)
+        containers = {container.name: container for container in tracker.containers("Kitchen")}
+        self.assertCountEqual(["fridge", "oven", "table", "counter"], containers)
+        self.assertIsNone(containers["fridge"].is_open)
+        self.assertFalse(containers["oven"].is_open)
+        self.assertTrue(containers["counter"].is_supporter)
+        self.assertEqual({"knife", "red apple"}, containers["counter"].contents)
+
+    def test_doors(self):
+        tracker = ContainerTracker()
+        tracker.update("Kitchen", "You see a closed fridge and a closed toolbox.\n\nThere is a closed sliding patio door"
+                                  " leading west. There is an opened commercial glass door leading north."
+                                  " There is a closed wooden door leading south.")
+        self.assertCountEqual(["fridge", "toolbox"], [container.name for container in tracker.containers("Kitchen")])
+        self.assertFalse(tracker.get("Kitchen", "toolbox").is_open)
+
+    def test_containers_to_open(self):
+        tracker = ContainerTracker()
+        tracker.update("Kitchen", _kitchen_ob)
+        tracker.update("Shed", _shed_ob)
+        # Never worth opening the oven to find ingredients.
+        self.assertEqual(["fridge"], tracker.containers_to_open("Kitchen", ["carrot"]))
+        self.assertEqual(["toolbox"], tracker.containers_to_open("Shed", ["carrot"]))
+
+        tracker.mark_opened("Kitchen", "fridge")
+        tracker.update("Kitchen", "You open the fridge, revealing a red onion and a carrot.")
+        self.assertEqual([], tracker.containers_to_open("Kitchen", ["carrot"]))
+        self.assertEqual(["Kitchen"], tracker.find("carrot"))
+        tracker.update("Shed", "You open the toolbox.")
+        self.assertEqual([], tracker.containers_to_open("Shed", ["carrot"]))
+        self.assertEqual(set(), tracker.get("Shed", "toolbox").contents)
+
+        tracker.update("Kitchen", "You take the carrot from the fridge.")
+        self.assertEqual([], tracker.find("carrot"))
+
+    def test_next_episode(self):
+        tracker = ContainerTracker()
+        tracker.update("Kitchen", _kitchen_ob)
+        tracker.update("Kitchen", "You open the fridge, revealing a red onion and a carrot.")
+        tracker.update("Shed", _shed_ob)
+        tracker.update("Shed", "You open the toolbox.")
+        tracker.start_episode()
+        # What was inside in the previous episodes only orders the containers.
+        self.assertEqual(["fridge"], tracker.containers_to_open("Kitchen", ["carrot"]))
+        self.assertEqual(["fridge"], tracker.containers_to_open("Kitchen", ["potato"]))
+        self.assertEqual(["toolbox"], tracker.containers_to_open("Shed", ["carrot"]))
+        self.assertEqual([], tracker.find("red onion"))
+        tracker.update("Shed", "You see a closed chest.")
+        self.assertEqual(["chest", "toolbox"], tracker.containers_to_open("Shed", ["carrot"]))
+        tracker.update("Shed", "You see a closed trunk.")
+        tracker.update("Shed", "You open the trunk, revealing a carrot.")
+        tracker.start_episode()
+        self.assertEqual(["trunk", "chest", "toolbox"], tracker.containers_to_open("Shed", ["carrot"]))
+        tracker.update("Kitchen", "You open the fridge, revealing a red onion and a carrot.")
+        self.assertEqual(["Kitchen"], tracker.find("red onion"))
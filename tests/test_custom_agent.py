@@ -1,9 +1,193 @@
+import copy
+import random
+import re
 import unittest
 
 from custom_agent import (
     _base_ingredient,
+    _gather_inventory,
+    _get_doors,
     _get_ingredients_present,
+    _ingredient_feat,
+    _need_to_open_door_pattern,
+    _parse_recipe,
+    _recipe_step_task,
+    _recipe_step_feat,
+    _recipe_text,
+    _searched_room_feat,
+    _you_open_door_pattern,
+    CustomAgent,
+    Feature,
 )
+from room import Room
+
+
+_opposite = dict(north="south", south="north", east="west", west="east")
+
+
+def _closed_door(name):
+    return [name, False]
+
+
+class _FakeGame(object):
+    """
+    A small cooking game that answers commands in the words of TextWorld, to play whole episodes.
+    """
+
+    def __init__(self, rooms, ingredients, steps, shown=None):
+        """
+        :param rooms: For each room, its `exits` by direction as the room and the door, `None` or from `_closed_door`,
+            and the items on its `floor`, on its `supporters` and in its `containers` as whether it's open and items.
+        :param steps: The recipe steps before "prepare meal".
+        :param shown: How items are shown in the descriptions if not by their name, e.g. "raw red potato".
+        """
+        self._initial_rooms = rooms
+        self._ingredients = ingredients
+        self._steps = steps
+        self._shown = shown or {}
+
+    def reset(self) -> str:
+        self._rooms = copy.deepcopy(self._initial_rooms)
+        self._room = "Kitchen"
+        self._held = []
+        self._scored = set()
+        self.score = 0
+        self.done = False
+        return self._describe()
+
+    def _list(self, items):
+        items = ["a " + self._shown.get(item, item) for item in items]
+        return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+    def _describe(self):
+        room = self._rooms[self._room]
+        lines = ["-= {} =-".format(self._room)]
+        for name, (is_open, items) in sorted(room.get('containers', {}).items()):
+            if not is_open:
+                lines.append("You see a closed {}.".format(name))
+            else:
+                lines.append("The {} contains {}.".format(name, self._list(items)) if items
+                             else "The {} is empty.".format(name))
+        for name, items in sorted(room.get('supporters', {}).items()):
+            lines.append("On the {} you see {}.".format(name, self._list(items)) if items
+                         else "The {} is empty.".format(name))
+        if room.get('floor'):
+            lines.append("There is {} on the floor.".format(self._list(room['floor'])))
+        for direction, (_, door) in sorted(room['exits'].items()):
+            if door is None:
+                lines.append("There is an exit to the {}.".format(direction))
+            else:
+                lines.append("There is a {} {} leading {}.".format("open" if door[1] else "closed", door[0], direction))
+        return "\n".join(lines)
+
+    def _point(self, key):
+        if key in self._scored:
+            return ""
+        self._scored.add(key)
+        self.score += 1
+        return "\n\nYour score has just gone up by one point."
+
+    def _hold(self, item, ob):
+        self._held.append(item)
+        return ob + (self._point(item) if item in self._ingredients else "")
+
+    def step(self, command: str) -> str:
+        room = self._rooms[self._room]
+        if command in _opposite:
+            if command not in room['exits']:
+                return "You can't go that way."
+            target, door = room['exits'][command]
+            if door is not None and not door[1]:
+                return "You have to open the {} first.".format(door[0])
+            self._room = target
+            return self._describe()
+        if command == "look":
+            return self._describe()
+        if command == "inventory":
+            return "You are carrying:\n" + "\n".join("  a " + item for item in self._held) if self._held \
+                else "You are carrying nothing."
+        if command == "look cookbook" and self._room == "Kitchen":
+            return "You open the copy of \"Cooking: A Modern Approach (3rd Ed.)\" and start reading:\n\n" \
+                   "Ingredients:\n  {}\n\nDirections:\n  {}\n".format(
+                       "\n  ".join(self._ingredients), "\n  ".join(self._steps + ["prepare meal"]))
+        m = re.fullmatch(r'open (?:the )?(.+)', command)
+        if m:
+            for direction, (target, door) in room['exits'].items():
+                if door is not None and door[0] == m.group(1):
+                    door[1] = self._rooms[target]['exits'][_opposite[direction]][1][1] = True
+                    return "You open {}.".format(door[0])
+            container = room.get('containers', {}).get(m.group(1))
+            if container is not None:
+                container[0] = True
+                return "You open the {}, revealing {}.".format(m.group(1), self._list(container[1])) if container[1] \
+                    else "You open the {}.".format(m.group(1))
+        m = re.fullmatch(r'take (.+)', command)
+        if m:
+            item = m.group(1)
+            if item in room.get('floor', ()):
+                room['floor'].remove(item)
+                return self._hold(item, "You pick up the {} from the ground.".format(item))
+            places = list(room.get('supporters', {}).items()) \
+                + [(name, items) for name, (is_open, items) in room.get('containers', {}).items() if is_open]
+            for name, items in places:
+                if item in items:
+                    items.remove(item)
+                    return self._hold(item, "You take the {} from the {}.".format(item, name))
+        m = re.fullmatch(r'drop (.+)', command)
+        if m and m.group(1) in self._held:
+            self._held.remove(m.group(1))
+            room.setdefault('floor', []).append(m.group(1))
+            return "You drop the {} on the ground.".format(m.group(1))
+        m = re.fullmatch(r'cook (.+) with .+', command)
+        if m:
+            command = next((step for step in self._steps if step.startswith(("fry", "roast", "grill"))
+                            and step.endswith(m.group(1))), command)
+        if command in self._steps and command.split(" ", 2)[2] in self._held:
+            if command.startswith(("slice", "chop", "dice")) and "knife" not in self._held:
+                return "Cutting something requires a knife."
+            return "You {} the {}.".format(*command.split(" the ")) + self._point(command)
+        if command == "prepare meal" and self._room == "Kitchen" and self._scored.issuperset(self._steps):
+            self._held = ["meal"]
+            return "Adding the meal to your inventory." + self._point(command)
+        if command == "eat meal" and "meal" in self._held:
+            self.done = True
+            return "You eat the meal. Not bad." + self._point(command)
+        return "You can't see any such thing."
+
+
+def _fake_game(garden=(), fridge=(), shelf=()):
+    """
+    :return: A game to make a carrot and a red potato, whose ingredients are in the Garden, the fridge of the Kitchen
+        or the Pantry: Pantry -door- Kitchen - Corridor - Garden, with the Shed north of the Corridor.
+    """
+    rooms = {
+        "Kitchen": dict(exits=dict(east=["Corridor", None], west=["Pantry", _closed_door("wooden door")]),
+                        supporters=dict(counter=["cookbook", "knife"]), containers=dict(fridge=[False, list(fridge)])),
+        "Pantry": dict(exits=dict(east=["Kitchen", _closed_door("wooden door")]), supporters=dict(shelf=list(shelf))),
+        "Corridor": dict(exits=dict(west=["Kitchen", None], east=["Garden", None], north=["Shed", None])),
+        "Garden": dict(exits=dict(west=["Corridor", None]), floor=list(garden)),
+        "Shed": dict(exits=dict(south=["Corridor", None]), containers=dict(toolbox=[False, []])),
+    }
+    return _FakeGame(rooms, ["carrot", "red potato"], ["slice the carrot", "fry the red potato"],
+                     shown={"red potato": "raw red potato"})
+
+
+def _play(agent, game, nb_episodes, max_steps=100):
+    """
+    :return: The score and the steps of each episode, played one after the other like test_submission.py does.
+    """
+    result = []
+    for no_episode in range(nb_episodes):
+        # The same random choices in each episode.
+        random.seed(0)
+        ob, score, steps = game.reset(), 0, 0
+        while not game.done and steps < max_steps:
+            ob = game.step(agent.act([ob], [score], [False], {})[0])
+            score = game.score
+            steps += 1
+        agent.act([ob], [score], [True], {})
+        result.append((score, steps))
+    return result
 
 
 class TestCustomAgent(unittest.TestCase):
@@ -27,3 +211,223 @@ class TestCustomAgent(unittest.TestCase):
         ingredient_candidates = ["pepper", "hot pepper"]
         ingredients_present = _get_ingredients_present(ob, ingredient_candidates)
         self.assertEqual(["hot pepper"], ingredients_present)
+
+        # Names are matched literally.
+        ob = "You see some tofu (firm), a c++ carrot and a carrrot."
+        ingredient_candidates = ["tofu (firm)", "c++ carrot", "carrot", "car+ot", "[a-z"]
+        ingredients_present = _get_ingredients_present(ob, ingredient_candidates)
+        self.assertEqual(["tofu (firm)", "c++ carrot"], ingredients_present)
+
+        # In any case, also in text that isn't ASCII.
+        ob = "You see a Red Onion and a crème brûlée."
+        ingredient_candidates = ["red onion", "CRÈME BRÛLÉE", "onions"]
+        ingredients_present = _get_ingredients_present(ob, ingredient_candidates)
+        self.assertEqual(["CRÈME BRÛLÉE", "red onion"], ingredients_present)
+
+    def test_door_patterns(self):
+        m = _need_to_open_door_pattern.search("You have to open the sliding patio door first.")
+        self.assertEqual("open the sliding patio door", m.group('task'))
+        m = _you_open_door_pattern.search("You open wooden door. You see a door.")
+        self.assertEqual("wooden door", m.group(1))
+        self.assertIsNone(_you_open_door_pattern.search("You open the fridge. It's a door."))
+        self.assertEqual("Kitchen", CustomAgent._get_room_name("\n\n-= Kitchen =-\nYou've entered a kitchen."))
+        self.assertIsNone(CustomAgent._get_room_name("-=" + " " * 1000))
+
+    def test_gather_inventory(self):
+        self.assertEqual(["black pepper", "red apple"],
+                         _gather_inventory("You are carrying:\n  a black pepper\n  a red apple\n"))
+        self.assertEqual(["knife", "orange bell pepper", "carrot"],
+                         _gather_inventory("You are carrying: a knife, an orange bell pepper and a raw carrot.\n\n>"))
+        self.assertEqual([], _gather_inventory("You are carrying nothing.\n"))
+
+    def test_recipe_step_task(self):
+        task = _recipe_step_task("grill the red hot pepper")
+        self.assertEqual(("red hot pepper", "Backyard", False, False),
+                         (task.ingredient, task.room, task.needs_knife, task.last))
+        task = _recipe_step_task("dice the carrot")
+        self.assertEqual(("carrot", None, True), (task.ingredient, task.room, task.needs_knife))
+        task = _recipe_step_task("prepare meal")
+        self.assertEqual(("Kitchen", True), (task.room, task.last))
+
+    def test_get_doors(self):
+        ob = "-= Kitchen =-\nThere is a closed frosted-glass door leading west. There is an exit to the east. " \
+             "There is an open barn door leading south."
+        self.assertEqual({'west': ("frosted-glass door", False), 'south': ("barn door", True)}, _get_doors(ob))
+
+
+    def test_config(self):
+        agent = CustomAgent(dict(max_capacity=5, rooms_with_ingredients=["Garden"]))
+        self.assertEqual(5, agent._max_capacity)
+        self.assertEqual(["Garden"], agent._ingredient_to_rooms["carrot"])
+        self.assertEqual(["Kitchen", "Supermarket"], agent._ingredient_to_rooms["egg"])
+        self.assertEqual('random', agent.config['explore_order'])
+        with self.assertRaises(ValueError):
+            CustomAgent(dict(max_capcity=5))
+
+    def test_start_slot_episode(self):
+        agent = CustomAgent()
+        kitchen = "-= Kitchen =-\nThere is a closed wooden door leading west. There is an exit to the east."
+        garden = "-= Garden =-\nThere is an exit to the north."
+        agent.act([kitchen, garden], [0, 0], [False, False], {})
+        self.assertEqual("Kitchen", agent._game_features[0][Feature.CURRENT_ROOM])
+        memory = agent._game_memories[0]
+
+        agent.start_slot_episode(0, same_game=True)
+        self.assertFalse(agent._game_features[0][Feature.CURRENT_ROOM])
+        self.assertEqual({}, agent._rooms[0])
+        self.assertIs(memory, agent._game_memories[0])
+        # The other game keeps playing.
+        self.assertEqual("Garden", agent._game_features[1][Feature.CURRENT_ROOM])
+        self.assertIn("Garden", agent._rooms[1])
+
+        agent.start_slot_episode(0, same_game=False)
+        self.assertIsNot(memory, agent._game_memories[0])
+
+    def test_compact_done_game(self):
+        agent = CustomAgent(dict(max_features=0))
+        kitchen = "-= Kitchen =-\nThere is a closed wooden door leading west. There is an exit to the east."
+        agent.act([kitchen, kitchen], [0, 0], [False, False], {})
+        feats = agent._game_features[0]
+        feats[('carrying', 'red apple')] = False
+        agent.act([kitchen, kitchen], [0, 0], [False, False], {})
+        self.assertNotIn(('carrying', 'red apple'), feats)
+        self.assertIn("Kitchen", agent._rooms[0])
+
+        agent.act([kitchen, kitchen], [0, 0], [True, False], {})
+        self.assertEqual({}, agent._rooms[0])
+        self.assertIsNone(agent._route_planners[0])
+        self.assertEqual("Kitchen", agent._game_features[0][Feature.CURRENT_ROOM])
+        self.assertIn("Kitchen", agent._rooms[1])
+
+    def test_repair_failures(self):
+        agent = CustomAgent()
+        kitchen = "-= Kitchen =-\nThere is a closed wooden door leading west. There is an exit to the east."
+        # Without the name of the room, look again.
+        self.assertEqual(["look"], agent.act(["Welcome to TextWorld!"], [0], [False], {}))
+        self.assertEqual('error', agent.get_trace_info(0)['branch'])
+        self.assertEqual(dict(map=1), agent.get_failure_counts(0))
+        agent.act([kitchen], [0], [False], {})
+
+        # Only needed ingredients are carried so nothing can be dropped, check the inventory instead.
+        feats = agent._game_features[0]
+        agent._searches[0] = None
+        feats[('carrying', 'carrot')] = True
+        feats[_ingredient_feat('carrot')] = True
+        self.assertEqual(["inventory"], agent.act(["You're carrying too many things already."], [0], [False], {}))
+        self.assertFalse(feats[('carrying', 'carrot')])
+        self.assertEqual(dict(map=1, inventory=1), agent.get_failure_counts(0))
+        self.assertEqual(dict(map=1, inventory=1), agent.get_failure_counts())
+
+        agent.start_slot_episode(0, same_game=True)
+        self.assertEqual({}, agent.get_failure_counts(0))
+
+    def test_snapshot_game(self):
+        agent = CustomAgent(dict(lookahead_depth=2))
+        kitchen = "-= Kitchen =-\nThere is a closed wooden door leading west. There is an exit to the east."
+        agent.act([kitchen], [0], [False], {})
+        snapshot = agent.snapshot_game(0)
+        agent._game_features[0][Feature.NUM_ITEMS_HELD] = 2
+        del agent._rooms[0]["Kitchen"].directions['east']
+        agent.restore_game(0, snapshot)
+        self.assertFalse(agent._game_features[0][Feature.NUM_ITEMS_HELD])
+        self.assertIn('east', agent._rooms[0]["Kitchen"].directions)
+        self.assertIs(snapshot['rooms'], agent._rooms[0])
+
+    def test_lookahead(self):
+        # Shed - Garden - Living Room - Kitchen - Pantry, the salt can be in the Shed or in the Pantry.
+        living_room = "-= Living Room =-\nThere is an exit to the east. There is an exit to the west."
+        commands = {}
+        for depth in (0, 2):
+            agent = CustomAgent(dict(lookahead_depth=depth, predict_layout=False,
+                                     ingredient_rooms=dict(salt=["Pantry", "Shed"])))
+            agent.act([living_room], [0], [False], {})
+            rooms = agent._rooms[0]
+            names = ["Shed", "Garden", "Living Room", "Kitchen", "Pantry"]
+            for west_name, east_name in zip(names, names[1:]):
+                for name in (west_name, east_name):
+                    if name not in rooms:
+                        rooms[name] = Room(name, [])
+                        agent._route_planners[0].add_room(name)
+                rooms[west_name].directions['east'] = rooms[east_name]
+                rooms[east_name].directions['west'] = rooms[west_name]
+                agent._route_planners[0].add_connection(west_name, east_name)
+            agent._paths.invalidate(0)
+            feats = agent._game_features[0]
+            feats[Feature.SEEN_COOKBOOK] = True
+            feats[_ingredient_feat('salt')] = True
+            feats[_recipe_step_feat(0, "prepare meal")] = True
+            for name in ("Garden", "Living Room", "Kitchen"):
+                feats[_searched_room_feat(name)] = True
+
+            commands[depth] = agent.act([living_room], [0], [False], {})
+            branch = agent.get_trace_info(0)['branch']
+        # The route visits the farther Shed first to end in the Kitchen,
+        # the lookahead first looks in the Pantry next to the Kitchen.
+        self.assertEqual(["west"], commands[0])
+        self.assertEqual(["east"], commands[2])
+        self.assertEqual('lookahead', branch)
+        self.assertEqual("Kitchen", agent._searches[0].target_name)
+
+    def test_next_episode(self):
+        # The ingredients are seen on the way to explore the rooms.
+        agent = CustomAgent(dict(predict_layout=False))
+        results = _play(agent, _fake_game(garden=["carrot", "red potato"], fridge=["red onion"]), 2)
+        self.assertEqual(6, results[0][0])
+        self.assertGreaterEqual(results[1][0], results[0][0])
+        # Only the episodes played at the same time share the recipe.
+        game = _fake_game()
+        self.assertEqual(["look cookbook"], agent.act([game.reset()], [0], [False], {}))
+
+    def test_next_episode_containers(self):
+        # The red potato in the fridge is shown as "raw red potato".
+        agent = CustomAgent(dict(predict_layout=False))
+        results = _play(agent, _fake_game(garden=["carrot"], fridge=["red potato"]), 2)
+        self.assertEqual(6, results[0][0])
+        self.assertGreaterEqual(results[1][0], results[0][0])
+
+    def test_share_game_memory(self):
+        agent = CustomAgent()
+        agent.share_game_memory([0, 1])
+        kitchen = "-= Kitchen =-\nYou see a cookbook. There is a closed wooden door leading west."
+        cookbook = "You open the copy of \"Cooking: A Modern Approach (3rd Ed.)\" and start reading:\n\n" \
+                   "Ingredients:\ncarrot\n\nDirections:\nslice the carrot\n  prepare meal\n"
+        agent.act([kitchen, kitchen], [0, 0], [False, False], {})
+        self.assertIs(agent._game_memories[0]['doors'], agent._game_memories[1]['doors'])
+        self.assertIsNot(agent._game_memories[0]['containers'], agent._game_memories[1]['containers'])
+
+        agent.act([cookbook, kitchen], [0, 0], [False, False], {})
+        self.assertTrue(agent._game_features[1][Feature.SEEN_COOKBOOK])
+        self.assertTrue(agent._game_features[1][_ingredient_feat('carrot')])
+
+    def test_act_on_slots(self):
+        agent = CustomAgent()
+        kitchen = "-= Kitchen =-\nYou see a cookbook. There is a closed wooden door leading west."
+        pantry = "-= Pantry =-\nThere is an exit to the east."
+        with self.assertRaises(ValueError):
+            agent.act_on_slots([1], [kitchen], [0], [False], {})
+        agent.act([kitchen, pantry, pantry], [0, 0, 0], [False, False, False], {})
+        features = [dict(feats) for feats in agent._game_features]
+
+        # The inventory was checked at the first step, go find the Kitchen.
+        self.assertEqual(["east"], agent.act_on_slots([2], ["You are carrying nothing."], [0], [False], {}))
+        self.assertEqual('find_kitchen', agent.get_trace_info(2)['branch'])
+        self.assertEqual(features[:2], [dict(feats) for feats in agent._game_features[:2]])
+        self.assertEqual('check_inventory', agent.get_trace_info(1)['branch'])
+
+        # The commands are in the order of the slots given.
+        commands = agent.act_on_slots([2, 0], [pantry, kitchen], [0, 0], [True, False], {})
+        self.assertEqual("wait", commands[0])
+        self.assertEqual("look cookbook", commands[1])
+        self.assertEqual('done', agent.get_trace_info(2)['branch'])
+
+    def test_parse_recipe(self):
+        ob = "You open the copy of \"Cooking: A Modern Approach (3rd Ed.)\" and start reading:\n\n" \
+             "Ingredients:\nred apple\n  carrot\n\nDirections:\nslice the red apple\n  roast the carrot\n" \
+             "  fry the red apple\n  prepare meal\n"
+        recipe = _parse_recipe(_recipe_text(ob))
+        self.assertEqual(["red apple", "carrot"], recipe['ingredients'])
+        self.assertEqual(["slice the red apple", "roast the carrot", "fry the red apple", "prepare meal"],
+                         recipe['steps'])
+        self.assertEqual(["sliced red apple", "roasted carrot", "fried red apple"], recipe['derived_ingredients'])
+        self.assertEqual(["knife"], recipe['tools'])
+        self.assertEqual(["oven", "stove"], recipe['heat_sources'])
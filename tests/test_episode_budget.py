@@ -0,0 +1,41 @@
+import unittest
+
+from episode_budget import episodes_converged, finished_runs, t_quantile_975
+
+
+def make_runs(results):
+    return [None if result is None else dict(score=result[0], steps=result[1], has_won=result[0] == 3)
+            for result in results]
+
+
+class TestEpisodeBudget(unittest.TestCase):
+    def test_t_quantile(self):
+        self.assertEqual(12.706, t_quantile_975(1))
+        self.assertEqual(2.228, t_quantile_975(10))
+        self.assertAlmostEqual(2.201, t_quantile_975(11), places=2)
+        self.assertAlmostEqual(2.042, t_quantile_975(30), places=3)
+        with self.assertRaises(ValueError):
+            t_quantile_975(0)
+
+    def test_same_results(self):
+        self.assertFalse(episodes_converged(make_runs([(3, 20), (3, 20)])))
+        self.assertTrue(episodes_converged(make_runs([(3, 20), (3, 20), (3, 20)])))
+        self.assertFalse(episodes_converged(make_runs([(3, 20), (3, 20), (3, 30)])))
+        # The agent remembers the game, so it can still win the next episodes.
+        self.assertFalse(episodes_converged(make_runs([(1, 100), (1, 100), (1, 100), (1, 100)])))
+
+    def test_confidence_intervals(self):
+        # The steps vary by a few percent.
+        runs = make_runs([(3, 40), (3, 41), (3, 40), (3, 42), (3, 41)])
+        self.assertTrue(episodes_converged(runs))
+        self.assertFalse(episodes_converged(runs, steps_tolerance=0.01))
+        # The score varies too much.
+        self.assertFalse(episodes_converged(make_runs([(3, 40), (1, 40), (3, 40), (2, 40), (3, 40)])))
+
+    def test_episodes_being_played(self):
+        runs = make_runs([None, (3, 20), (3, 20), (3, 20)])
+        self.assertEqual([], finished_runs(runs))
+        self.assertFalse(episodes_converged(runs))
+        runs = make_runs([(3, 20), (3, 20), (3, 20), None, (1, 100)])
+        self.assertEqual(3, len(finished_runs(runs)))
+        self.assertTrue(episodes_converged(runs))
@@ -0,0 +1,35 @@
+import unittest
+
+from fault_recovery import classify, FailureCounter, InventoryFailure, MapFailure
+
+
+def _raise_in(file_name):
+    try:
+        exec(compile("raise KeyError('Kitchen')", file_name, 'exec'))
+    except KeyError as e:
+        return e
+
+
+class TestFaultRecovery(unittest.TestCase):
+    def test_classify(self):
+        self.assertEqual('inventory', classify(InventoryFailure()))
+        self.assertEqual('map', classify(MapFailure()))
+        self.assertEqual('search', classify(_raise_in("/somewhere/room_search.py")))
+        self.assertEqual('lookahead', classify(_raise_in("world_model.py")))
+        self.assertEqual('unknown', classify(_raise_in("custom_agent.py")))
+        self.assertEqual('unknown', classify(ValueError()))
+
+    def test_counter(self):
+        counter = FailureCounter()
+        self.assertEqual(1, counter.record(0, 'map'))
+        self.assertEqual(2, counter.record(0, 'inventory'))
+        self.assertEqual(1, counter.record(1, 'map'))
+        counter.succeeded(0)
+        self.assertEqual(1, counter.record(0, 'map'))
+        self.assertEqual(dict(map=2, inventory=1), counter.counts(0))
+        self.assertEqual(dict(map=3, inventory=1), counter.counts())
+
+        counter.reset(0)
+        self.assertEqual({}, counter.counts(0))
+        self.assertEqual(1, counter.record(0, 'map'))
+        self.assertEqual(dict(map=4, inventory=1), counter.counts())
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import game_manifest
+from game_manifest import load_manifest
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _stats(**durations):
+    return dict(games={
+        name: dict(runs=[dict(score=1, steps=5), dict(score=2, steps=7)], max_scores=3, duration=duration)
+        for name, duration in durations.items()
+    })
+
+
+class TestGameManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.games_dir = os.path.join(self.tmp, 'games')
+        self.path = os.path.join(self.tmp, 'manifest.json')
+        _write(os.path.join(self.games_dir, 'a.ulx'), 'a')
+        _write(os.path.join(self.games_dir, 'sub', 'b.ulx'), 'bbbb')
+        _write(os.path.join(self.games_dir, 'sub', 'b.json'), '{}')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_and_reload(self):
+        manifest = load_manifest(self.path, self.games_dir)
+        self.assertEqual(['a.ulx', os.path.join('sub', 'b.ulx')], sorted(manifest.games))
+        self.assertEqual(4, manifest.games[os.path.join('sub', 'b.ulx')]['size'])
+
+        # Loading it again doesn't walk the games directory.
+        with mock.patch.object(game_manifest, '_find_games') as find_games:
+            again = load_manifest(self.path, self.games_dir)
+        find_games.assert_not_called()
+        self.assertEqual(manifest.games, again.games)
+
+    def test_update_only_hashes_changes(self):
+        manifest = load_manifest(self.path, self.games_dir)
+        manifest.record_results(_stats(**{'a.ulx': 2.0}))
+        a_id = manifest.games['a.ulx']['id']
+
+        os.rename(os.path.join(self.games_dir, 'a.ulx'), os.path.join(self.games_dir, 'moved.ulx'))
+        _write(os.path.join(self.games_dir, 'sub', 'b.ulx'), 'changed')
+        _write(os.path.join(self.games_dir, 'c.ulx'), 'c')
+        with mock.patch.object(game_manifest, '_hash_file', wraps=game_manifest._hash_file) as hash_file:
+            self.assertEqual((2, 1, 1), manifest.update())
+        self.assertEqual(3, hash_file.call_count)
+        # The history follows the game that was moved.
+        self.assertEqual(a_id, manifest.games['moved.ulx']['id'])
+        self.assertEqual(2.0, manifest.games['moved.ulx']['history']['duration'])
+
+        with mock.patch.object(game_manifest, '_hash_file') as hash_file:
+            self.assertEqual((0, 0, 0), manifest.update())
+        hash_file.assert_not_called()
+
+    def test_record_results(self):
+        manifest = load_manifest(self.path, self.games_dir)
+        manifest.record_results(_stats(**{'b.ulx': 1.5}))
+        manifest.record_results(_stats(**{'b.ulx': 2.5}))
+        history = manifest.games[os.path.join('sub', 'b.ulx')]['history']
+        self.assertEqual(2, history['evaluations'])
+        self.assertEqual(2.5, history['duration'])
+        self.assertEqual((2, 12, 3, 3), (history['episodes'], history['steps'], history['score'],
+                                         history['max_score']))
+        self.assertNotIn('history', manifest.games['a.ulx'])
+
+    def test_select(self):
+        _write(os.path.join(self.games_dir, 'c.ulx'), 'cc')
+        manifest = load_manifest(self.path, self.games_dir)
+        names = lambda games: [os.path.basename(game) for game in games]
+        # Without any history, the largest games are expected to take the longest.
+        self.assertEqual(['b.ulx', 'c.ulx', 'a.ulx'], names(manifest.select()))
+
+        manifest.record_results(_stats(**{'a.ulx': 3.0, 'b.ulx': 1.0}))
+        # c is estimated from the median time per byte of the others.
+        self.assertEqual(['c.ulx', 'a.ulx', 'b.ulx'], names(manifest.select()))
+        # Otherwise by path.
+        self.assertEqual(['a.ulx', 'c.ulx', 'b.ulx'], names(manifest.select(longest_first=False)))
+
+        subset = manifest.select(2, seed=1)
+        self.assertEqual(2, len(subset))
+        self.assertEqual(subset, manifest.select(2, seed=1))
+        self.assertTrue(all(os.path.exists(game) for game in subset))
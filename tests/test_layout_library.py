@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+
+from layout_library import fingerprint, LayoutLibrary
+from room import Room
+from room_search import opposite_dir, RoomSearch
+
+
+def make_map(connections, exits=None):
+    """
+    :param connections: (room, direction, neighbour) for each connection, the way back is added.
+    :param exits: More directions of rooms that lead to rooms that were not found yet.
+    """
+    rooms = {}
+    for room_name, direction, neighbour_name in connections:
+        room = rooms.setdefault(room_name, Room(room_name, []))
+        neighbour = rooms.setdefault(neighbour_name, Room(neighbour_name, []))
+        room.directions[direction] = neighbour
+        neighbour.directions[opposite_dir(direction)] = room
+    for room_name, directions in (exits or {}).items():
+        room = rooms.setdefault(room_name, Room(room_name, []))
+        for direction in directions:
+            room.directions.setdefault(direction, None)
+    return rooms
+
+
+# Kitchen -east-> Corridor -east-> Living Room
+#                    |north
+#                 Pantry
+_full_map = [
+    ("Kitchen", 'east', "Corridor"),
+    ("Corridor", 'east', "Living Room"),
+    ("Corridor", 'north', "Pantry"),
+]
+
+
+class TestLayoutLibrary(unittest.TestCase):
+    def test_fingerprint(self):
+        rooms = make_map([("Kitchen", 'east', "Corridor")], exits=dict(Corridor=['north']))
+        self.assertEqual({("Kitchen", 'east', "Corridor"), ("Corridor", 'west', "Kitchen")}, fingerprint(rooms))
+
+    def test_predict(self):
+        library = LayoutLibrary()
+        library.add(make_map(_full_map))
+        # The start of a new game with the same layout.
+        rooms = make_map([("Kitchen", 'east', "Corridor")], exits=dict(Corridor=['north', 'east']))
+        self.assertEqual('north', library.direction_towards(rooms, "Corridor", "Pantry", ['north', 'east']))
+        self.assertEqual('east', library.direction_towards(rooms, "Corridor", "Living Room", ['north', 'east']))
+        # Not in the layout.
+        self.assertIsNone(library.direction_towards(rooms, "Corridor", "Backyard", ['north', 'east']))
+        self.assertEqual(2, library.predictions)
+
+        # Too little is known.
+        self.assertIsNone(library.direction_towards(make_map([], exits=dict(Corridor=['north', 'east'])),
+                                                    "Corridor", "Pantry", ['north', 'east']))
+
+    def test_contradiction(self):
+        library = LayoutLibrary()
+        library.add(make_map(_full_map))
+        # Another room is north of the Corridor in this game.
+        rooms = make_map([("Kitchen", 'east', "Corridor"), ("Corridor", 'north', "Bedroom")],
+                         exits=dict(Corridor=['east']))
+        self.assertIsNone(library.best_match(rooms))
+        # The Corridor has no exit east in this game.
+        rooms = make_map([("Kitchen", 'east', "Corridor")], exits=dict(Corridor=['north']))
+        self.assertIsNone(library.best_match(rooms))
+
+        other_layout = [("Kitchen", 'east', "Corridor"), ("Corridor", 'north', "Bedroom"),
+                        ("Bedroom", 'north', "Pantry")]
+        library.add(make_map(other_layout))
+        rooms = make_map([("Kitchen", 'east', "Corridor"), ("Corridor", 'north', "Bedroom")],
+                         exits=dict(Bedroom=['north']))
+        self.assertEqual(fingerprint(make_map(other_layout)), library.best_match(rooms).triples)
+
+    def test_merge(self):
+        library = LayoutLibrary()
+        library.add(make_map(_full_map[:1]))
+        library.add(make_map(_full_map[:2]))
+        # The smaller map was the start of the larger one.
+        self.assertEqual(1, len(library))
+        library.add(make_map(_full_map[1:2]))
+        self.assertEqual(1, len(library))
+        rooms = make_map(_full_map[:1], exits=dict(Corridor=['east']))
+        self.assertEqual(3, library.best_match(rooms).count)
+
+        library.add(make_map([("Kitchen", 'south', "Backyard")]))
+        self.assertEqual(2, len(library))
+
+    def test_search_uses_prediction(self):
+        library = LayoutLibrary()
+        library.add(make_map(_full_map))
+        rooms = make_map([("Kitchen", 'east', "Corridor")], exits=dict(Corridor=['north', 'east']))
+        for _ in range(5):
+            search = RoomSearch(rooms, rooms["Corridor"], "Pantry",
+                                predict_direction=lambda *args: library.direction_towards(rooms, *args))
+            self.assertEqual('north', search.get_next_direction())
+
+    def test_shared_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'layouts.sqlite')
+            LayoutLibrary(path).add(make_map(_full_map))
+
+            library = LayoutLibrary(path)
+            rooms = make_map([("Kitchen", 'east', "Corridor")], exits=dict(Corridor=['north', 'east']))
+            self.assertIsNone(library.best_match(rooms))
+            library.refresh()
+            self.assertEqual('north', library.direction_towards(rooms, "Corridor", "Pantry", ['north', 'east']))
+
+            # Only the new layouts are read again.
+            LayoutLibrary(path).add(make_map([("Kitchen", 'south', "Backyard")]))
+            library.refresh()
+            self.assertEqual(2, len(library))
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'layouts.sqlite')
+            library = LayoutLibrary(path, max_layouts=2)
+            for i in range(5):
+                library.add(make_map([("Kitchen", 'east', "Room {}".format(i))]))
+            other = LayoutLibrary(path)
+            other.refresh()
+            self.assertEqual(2, len(other))
+
+    def test_broken_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # A directory can't be opened as a database.
+            library = LayoutLibrary(tmp)
+            with self.assertLogs(level='WARNING'):
+                library.add(make_map(_full_map))
+            self.assertIsNone(library.path)
+            self.assertEqual(1, len(library))
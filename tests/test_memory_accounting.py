@@ -0,0 +1,48 @@
+import os
+import tracemalloc
+import unittest
+
+import memory_accounting
+from memory_accounting import MemoryAccountant, subsystem, summarize
+
+
+class TestMemoryAccounting(unittest.TestCase):
+    def test_subsystem(self):
+        code_dir = os.path.dirname(os.path.abspath(memory_accounting.__file__))
+        self.assertEqual('custom_agent', subsystem(os.path.join(code_dir, 'custom_agent.py')))
+        self.assertEqual('tests.test_custom_agent', subsystem(os.path.join(code_dir, 'tests', 'test_custom_agent.py')))
+        self.assertEqual('textworld',
+                         subsystem('/usr/lib/python3/dist-packages/textworld/envs/glulx/git_glulx.py'))
+        self.assertEqual('python', subsystem(os.__file__))
+
+    def test_game_done(self):
+        was_tracing = tracemalloc.is_tracing()
+        accountant = MemoryAccountant()
+        try:
+            kept = [bytearray(1 << 20)]
+            first = accountant.game_done()
+            self.assertEqual(1, first['game_number'])
+            self.assertGreaterEqual(first['traced_bytes'], 1 << 20)
+            self.assertGreaterEqual(first['by_subsystem']['tests.test_memory_accounting'], 1 << 20)
+            del kept
+            second = accountant.game_done()
+            self.assertEqual(2, second['game_number'])
+            self.assertLess(second['traced_bytes'], first['traced_bytes'])
+        finally:
+            accountant.stop()
+        self.assertEqual(was_tracing, tracemalloc.is_tracing())
+
+    def test_summarize(self):
+        records = [
+            dict(pid=1, game_number=2, traced_bytes=150, peak_bytes=400, by_subsystem=dict(custom_agent=50)),
+            dict(pid=1, game_number=1, traced_bytes=100, peak_bytes=300, by_subsystem=dict(custom_agent=60)),
+            dict(pid=2, game_number=1, traced_bytes=500, peak_bytes=600, by_subsystem=dict(textworld=10)),
+        ]
+        summary = summarize(records)
+        self.assertEqual(3, summary['games'])
+        self.assertEqual(2, summary['processes'])
+        self.assertEqual(500, summary['max_traced_bytes'])
+        self.assertEqual(600, summary['max_peak_bytes'])
+        self.assertEqual(50, summary['growth_bytes'])
+        self.assertEqual(dict(custom_agent=60, textworld=10), summary['by_subsystem'])
+        self.assertEqual(0, summarize([])['games'])
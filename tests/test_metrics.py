@@ -0,0 +1,67 @@
+import os
+import queue
+import tempfile
+import unittest
+from urllib.request import urlopen
+
+from metrics import EvaluationMetrics, MetricsExporter, MetricsReporter
+
+
+def _parse(text):
+    result = {}
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            result[name] = float(value)
+    return result
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        events = queue.Queue()
+        reporter = MetricsReporter(events)
+        reporter.game_started()
+        for step in range(100):
+            reporter.add_step(agent_seconds=0.001 * (step + 1), env_seconds=0.01)
+        reporter.episodes_done([3])
+        reporter.add_step(agent_seconds=0.001, env_seconds=0.01, num_steps=4)
+        reporter.episodes_done([1, 2, 2, 2])
+        reporter.game_done()
+        events.put(('failure', 'main'))
+
+        metrics = EvaluationMetrics(total_games=3)
+        while not events.empty():
+            metrics.handle(events.get())
+        samples = _parse(metrics.render())
+
+        self.assertEqual(2, samples['tw_eval_games_done_total'])
+        self.assertEqual(1, samples['tw_eval_failures_total'])
+        self.assertEqual(2, samples['tw_eval_queue_depth'])
+        self.assertEqual(5, samples['tw_eval_episodes_total'])
+        self.assertEqual(104, samples['tw_eval_steps_total'])
+        self.assertEqual(2, samples['tw_eval_rolling_score'])
+        self.assertAlmostEqual(0.05, samples['tw_eval_step_latency_seconds{part="agent",quantile="0.5"}'])
+        self.assertAlmostEqual(0.095, samples['tw_eval_step_latency_seconds{part="agent",quantile="0.95"}'])
+        self.assertAlmostEqual(0.01, samples['tw_eval_step_latency_seconds{part="env",quantile="0.99"}'])
+        self.assertIn('tw_eval_worker_utilization{{worker="{}"}}'.format(os.getpid()), samples)
+
+    def test_exporter(self):
+        events = queue.Queue()
+        reporter = MetricsReporter(events)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metrics.prom')
+            exporter = MetricsExporter(EvaluationMetrics(total_games=1), events, path=path, port=0, interval=0.01)
+            with exporter:
+                reporter.game_started()
+                reporter.add_step(0.1, 0.2)
+                reporter.episodes_done([1])
+                exporter.drain()
+                with urlopen('http://127.0.0.1:{}/metrics'.format(exporter.port)) as response:
+                    samples = _parse(response.read().decode('utf-8'))
+                self.assertEqual(1, samples['tw_eval_steps_total'])
+                reporter.game_done()
+
+            with open(path) as f:
+                samples = _parse(f.read())
+            self.assertEqual(1, samples['tw_eval_games_done_total'])
+            self.assertEqual(0, samples['tw_eval_queue_depth'])
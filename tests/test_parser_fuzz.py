@@ -0,0 +1,29 @@
+import re
+import unittest
+
+from parser_fuzz import format_report, generators, growth_exponent, run, stress
+
+
+class TestParserFuzz(unittest.TestCase):
+    def test_growth_exponent(self):
+        self.assertAlmostEqual(1, growth_exponent([1, 2, 4], [3, 6, 12]))
+        self.assertAlmostEqual(2, growth_exponent([1, 2, 4], [1, 4, 16]))
+        self.assertIsNone(growth_exponent([1], [1]))
+
+    def test_flags_backtracking(self):
+        # The room name pattern before it was bounded backtracks from every space.
+        backtracking = re.compile(r'-=\s*([^=]+) =-').search
+        result = stress(backtracking, generators["spaces"], sizes=(500, 1000, 2000))
+        self.assertTrue(result['super_linear'], result)
+        self.assertFalse(stress(str.split, generators["spaces"], sizes=(500, 1000, 2000))['super_linear'])
+
+    def test_reports_errors(self):
+        # Like searching for a name that was not escaped.
+        result = stress(lambda ob: re.search(r'\b{}\b'.format("[a-z"), ob), generators["word soup"], sizes=(500, 1000))
+        self.assertEqual([], result['sizes'])
+        self.assertTrue(result['error'].startswith("error on 500 characters"), result['error'])
+
+    def test_parsers_are_linear(self):
+        report = run(sizes=(1000, 2000, 4000))
+        self.assertEqual([], report['super_linear'] + report['errors'], format_report(report))
+        self.assertIn('_get_ingredients_present', report['worst'])
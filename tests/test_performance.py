@@ -0,0 +1,250 @@
+"""
+Benchmarks for the hot paths of the agent, the parsers and the room search.
+
+Times are measured relative to a fixed pure Python calibration loop so that the baseline works across machines.
+The results are compared to the baseline in `performance_baseline.json`.
+A benchmark fails if it is slower than its baseline by more than the tolerance
+or by more than 3 times the noise that was measured when the baseline was recorded,
+and it is still that slow when it is measured again.
+
+To record a new baseline:
+```bash
+TW_UPDATE_PERF_BASELINE=1 python3 -m unittest tests.test_performance
+```
+"""
+import gc
+import json
+import os
+import random
+import time
+import unittest
+
+from custom_agent import (
+    _get_ingredients_present,
+    _parse_recipe,
+    _recipe_text,
+    CustomAgent,
+    Feature,
+)
+from room import Room
+from room_search import opposite_dir, RoomSearch
+
+_baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performance_baseline.json')
+
+_update_baseline = os.environ.get('TW_UPDATE_PERF_BASELINE') == '1'
+
+_tolerance = float(os.environ.get('TW_PERF_TOLERANCE', '0.5'))
+"""
+The relative slowdown allowed compared to the baseline.
+"""
+
+_repeat = 7
+
+_retries = 2
+"""
+The number of times a benchmark is measured again before reporting a regression.
+"""
+
+_kitchen_ob = """
+-= Kitchen =-
+You've entered a kitchen.
+
+You see a closed fridge. You make out an oven. You can make out a table. On the table you make out a cookbook.
+You see a counter. On the counter you can see a knife and a red apple. You can see a stove.
+
+There is a closed wooden door leading west. You need an exit without a door? You should try going east.
+There is an exit to the south.
+"""
+
+_cookbook_ob = """
+You open the copy of "Cooking: A Modern Approach (3rd Ed.)" and start reading:
+
+Recipe #1
+---------
+Gather all following ingredients and follow the directions to prepare this tasty meal.
+
+Ingredients:
+red hot pepper
+  yellow bell pepper
+  carrot
+  black pepper
+
+Directions:
+slice the red hot pepper
+  fry the red hot pepper
+  dice the yellow bell pepper
+  grill the yellow bell pepper
+  chop the carrot
+  roast the carrot
+  prepare meal
+"""
+
+_inventory_ob = """
+You are carrying:
+  a black pepper
+  a red apple
+"""
+
+_garden_ob = """
+-= Garden =-
+You find yourself in a garden. An usual kind of place.
+
+You see a red hot pepper, a yellow bell pepper, a purple potato, a red onion and a white onion on the floor.
+
+There is an exit to the north. Don't worry, there is no door. There is an exit to the west.
+"""
+
+_ingredient_candidates = [
+    "red hot pepper", "yellow bell pepper", "carrot", "black pepper", "hot pepper", "bell pepper",
+    "sliced red hot pepper", "fried red hot pepper", "diced yellow bell pepper",
+    "grilled yellow bell pepper", "chopped carrot", "roasted carrot",
+]
+
+
+def _calibrate(number=100000):
+    def work():
+        total = 0
+        items = {}
+        for i in range(number):
+            total += i * i
+            items[i & 255] = str(i)
+        return total, len(items)
+
+    best = None
+    for _ in range(_repeat):
+        start = time.perf_counter()
+        work()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _measure(func, number, setup=None):
+    """
+    :return: The best and the median time for `number` calls of `func`, over several repeats.
+        `setup` is called before each call of `func`, without being timed, to make its arguments.
+    """
+    times = []
+    for _ in range(_repeat):
+        args = [setup() if setup is not None else () for _ in range(number)]
+        # Like timeit, don't let garbage collections of the setup make the timing noisy.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for a in args:
+                func(*a)
+            times.append(time.perf_counter() - start)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def _grid_map(size):
+    """
+    :return: The rooms of a fully connected grid map with `size` rows and columns.
+    """
+    grid = [[Room("Room {} {}".format(row, col), {}) for col in range(size)] for row in range(size)]
+    for row in range(size):
+        for col in range(size):
+            room = grid[row][col]
+            for direction, (r, c) in (('east', (row, col + 1)), ('south', (row + 1, col))):
+                if r < size and c < size:
+                    room.directions[direction] = grid[r][c]
+                    grid[r][c].directions[opposite_dir(direction)] = room
+    return {room.name: room for row in grid for room in row}
+
+
+def _agent_after_cookbook():
+    random.seed(0)
+    agent = CustomAgent()
+    for ob in (_kitchen_ob, _cookbook_ob, _inventory_ob):
+        agent.act([ob], [0], [False], {})
+    return agent
+
+
+class TestPerformance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = {}
+        if os.path.exists(_baseline_path):
+            with open(_baseline_path) as f:
+                cls.baseline = json.load(f)
+        else:
+            cls.baseline = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if _update_baseline:
+            baseline = dict(cls.baseline)
+            baseline.update(cls.results)
+            with open(_baseline_path, 'w') as f:
+                json.dump(baseline, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    def _run(self, func, number, setup):
+        # Calibrate right before measuring in case the speed of the machine changed since the previous benchmark.
+        calibration = _calibrate()
+        best, median = _measure(func, number, setup)
+        return best / number / calibration, (median - best) / best
+
+    def _check(self, name, func, number, setup=None):
+        relative, noise = self._run(func, number, setup)
+        self.results[name] = dict(relative_time=relative, noise=noise)
+        if _update_baseline:
+            return
+        expected = self.baseline.get(name)
+        if expected is None:
+            self.fail(f"No baseline for \"{name}\". Record one with TW_UPDATE_PERF_BASELINE=1.")
+        allowed = expected['relative_time'] * (1 + max(_tolerance, 3 * expected['noise']))
+        for _ in range(_retries):
+            if relative <= allowed:
+                break
+            # Make sure that it's not just a noisy run.
+            relative = min(relative, self._run(func, number, setup)[0])
+        if relative > allowed:
+            self.fail(f"Performance regression in \"{name}\": "
+                      f"{relative:.3g} calibration units per call, the baseline is {expected['relative_time']:.3g} "
+                      f"and at most {allowed:.3g} is allowed ({relative / expected['relative_time'] - 1:+.0%}).")
+
+    def test_add_features(self):
+        def setup():
+            agent = _agent_after_cookbook()
+            return agent, [_garden_ob]
+
+        self._check('_add_features', lambda agent, obs: agent._add_features(obs, {}), number=200, setup=setup)
+
+    def test_get_ingredients_present(self):
+        self._check('_get_ingredients_present',
+                    lambda: _get_ingredients_present(_garden_ob, _ingredient_candidates), number=500)
+
+    def test_parse_recipe(self):
+        # Not `CustomAgent._gather_recipe`, which only parses a cookbook once and then finds it in the recipe cache.
+        text = _recipe_text(_cookbook_ob)
+        self._check('_parse_recipe', lambda: _parse_recipe(text), number=2000)
+
+    def test_get_path_to(self):
+        rooms = _grid_map(8)
+        search = RoomSearch(rooms, rooms["Room 0 0"], "Room 7 7")
+        self._check('RoomSearch.get_path_to', lambda: search.get_path_to("Room 7 7"), number=200)
+
+    def test_get_next_direction(self):
+        rooms = _grid_map(8)
+
+        def setup():
+            search = RoomSearch(rooms, rooms["Room 0 0"], "Room 7 7")
+            return search,
+
+        self._check('RoomSearch.get_next_direction', lambda search: search.get_next_direction(),
+                    number=200, setup=setup)
+
+    def test_act(self):
+        def setup():
+            agent = _agent_after_cookbook()
+            self.assertTrue(agent._game_features[0][Feature.SEEN_COOKBOOK])
+            return agent,
+
+        self._check('CustomAgent.act', lambda agent: agent.act([_garden_ob], [1], [False], {}),
+                    number=200, setup=setup)
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from recipe_cache import RecipeCache
+
+
+class TestRecipeCache(unittest.TestCase):
+    def test_memory_only(self):
+        cache = RecipeCache()
+        parsed = []
+
+        def parse(text):
+            parsed.append(text)
+            return dict(steps=[text])
+
+        self.assertEqual(dict(steps=["a"]), cache.get_or_parse("a", parse))
+        self.assertEqual(dict(steps=["a"]), cache.get_or_parse("a", parse))
+        self.assertEqual(["a"], parsed)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_shared_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'recipes.sqlite')
+            RecipeCache(path, version=1).put("recipe", dict(steps=["slice the carrot"]))
+
+            self.assertEqual(dict(steps=["slice the carrot"]), RecipeCache(path, version=1).get("recipe"))
+            # Recipes parsed by another version of the parser are not used.
+            self.assertIsNone(RecipeCache(path, version=2).get("recipe"))
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'recipes.sqlite')
+            cache = RecipeCache(path, max_bytes=100, memory_entries=1)
+            for i in range(10):
+                cache.put("recipe {}".format(i), dict(steps=["step {}".format(i)]))
+            # Only the most recent entries fit.
+            other = RecipeCache(path)
+            self.assertIsNotNone(other.get("recipe 9"))
+            self.assertIsNone(other.get("recipe 0"))
+
+    def test_broken_database(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # A directory can't be opened as a database.
+            cache = RecipeCache(tmp)
+            with self.assertLogs(level='WARNING'):
+                self.assertEqual(dict(steps=[]), cache.get_or_parse("recipe", lambda text: dict(steps=[])))
+            self.assertIsNone(cache.path)
+            self.assertEqual(dict(steps=[]), cache.get("recipe"))
@@ -0,0 +1,60 @@
+import unittest
+
+from recipe_scheduler import RecipeTask, schedule
+
+_distances = {
+    frozenset(("Kitchen", "Backyard")): 3,
+    frozenset(("Kitchen", "Pantry")): 1,
+    frozenset(("Pantry", "Backyard")): 4,
+}
+
+
+def _distance(from_name, to_name):
+    return _distances.get(frozenset((from_name, to_name)))
+
+
+def _steps(tasks):
+    return [task.step for task in tasks]
+
+
+class TestRecipeScheduler(unittest.TestCase):
+    def test_groups_by_room(self):
+        tasks = [
+            RecipeTask("grill the carrot", "carrot", "Backyard"),
+            RecipeTask("fry the egg", "egg", "Kitchen"),
+            RecipeTask("grill the pork", "pork", "Backyard"),
+            RecipeTask("prepare meal", room="Kitchen", last=True),
+        ]
+        # Both grills at once instead of going back and forth as in the cookbook.
+        self.assertEqual(["grill the carrot", "grill the pork", "fry the egg", "prepare meal"],
+                         _steps(schedule(tasks, "Kitchen", _distance)))
+        self.assertEqual(["grill the carrot", "grill the pork", "fry the egg", "prepare meal"],
+                         _steps(schedule(tasks, "Backyard", _distance)))
+
+    def test_same_ingredient_keeps_order(self):
+        tasks = [
+            RecipeTask("slice the carrot", "carrot", needs_knife=True),
+            RecipeTask("grill the carrot", "carrot", "Backyard"),
+            RecipeTask("fry the egg", "egg", "Kitchen"),
+        ]
+        # Grilling the carrot first and getting the knife on the way to the Kitchen would be shorter.
+        self.assertEqual(["slice the carrot", "fry the egg", "grill the carrot"],
+                         _steps(schedule(tasks, "Backyard", _distance, knife_location="Pantry")))
+
+    def test_knife(self):
+        tasks = [
+            RecipeTask("grill the pork", "pork", "Backyard"),
+            RecipeTask("slice the carrot", "carrot", needs_knife=True),
+            RecipeTask("fry the egg", "egg", "Kitchen"),
+            RecipeTask("dice the egg", "egg", needs_knife=True),
+        ]
+        # Get the knife in the Pantry next to the Kitchen before going to the Backyard.
+        self.assertEqual(["slice the carrot", "fry the egg", "grill the pork", "dice the egg"],
+                         _steps(schedule(tasks, "Kitchen", _distance, knife_location="Pantry")))
+        # Holding the knife, the cuts can wait.
+        self.assertEqual(["grill the pork", "slice the carrot", "fry the egg", "dice the egg"],
+                         _steps(schedule(tasks, "Backyard", _distance, holding_knife=True)))
+
+    def test_unknown_rooms(self):
+        tasks = [RecipeTask("roast the apple", "apple", "Kitchen"), RecipeTask("grill the pork", "pork", "Backyard")]
+        self.assertEqual(["roast the apple", "grill the pork"], _steps(schedule(tasks, "Garden", lambda a, b: None)))
@@ -19,6 +19,13 @@ class TestRoomSearch(unittest.TestCase):
         s = RoomSearch(rooms, current_room, target)
         self.assertEqual('west', s.get_next_direction())
 
+    def test_search_fixed_order(self):
+        current_room = Room("Kitchen", ['west', 'north', 'east'])
+        rooms = dict(Kitchen=current_room)
+        for _ in range(5):
+            s = RoomSearch(rooms, current_room, "Supermarket", explore_order='fixed')
+            self.assertEqual('west', s.get_next_direction())
+
     def test_search_discover_along_the_way(self):
         # Kitchen -> Living Room -> Driveway -> Street -> Supermarket
         #    v            v
@@ -252,3 +259,28 @@ class TestRoomSearch(unittest.TestCase):
                 break
 
         self.assertIsNone(direction)
+
+    def test_path_avoids_closed_door(self):
+        # Kitchen -> Living Room -> Corridor
+        #    v                         v
+        #  Pantry    ---------->    Backyard
+        backyard = Room("Backyard", {})
+        corridor = Room("Corridor", {'south': backyard})
+        living_room = Room("Living Room", {'east': corridor})
+        pantry = Room("Pantry", {'east': backyard})
+        kitchen = Room("Kitchen", {'east': living_room, 'south': pantry})
+        rooms = [kitchen, living_room, corridor, pantry, backyard]
+        complete_map(rooms)
+        rooms = {room.name: room for room in rooms}
+
+        s = RoomSearch(rooms, kitchen, "Backyard")
+        self.assertEqual(['south', 'east'], s.get_path_to("Backyard"))
+
+        # Opening each door costs a command so the way without doors is shorter.
+        kitchen.set_door('south', "wooden door", is_open=False)
+        pantry.set_door('east', "barn door", is_open=False)
+        self.assertEqual(['east', 'east', 'south'], s.get_path_to("Backyard"))
+
+        kitchen.set_door('south', "wooden door", is_open=True)
+        self.assertEqual(['south', 'east'], s.get_path_to("Backyard"))
+
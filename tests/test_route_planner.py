@@ -0,0 +1,75 @@
+import unittest
+from itertools import permutations
+
+from room import Room
+from route_planner import RoutePlanner
+from tests.test_room_search import complete_map
+
+
+def _build_map():
+    # Kitchen -> Living Room -> Driveway -> Street -> Supermarket
+    #    v            v
+    #  Pantry     Corridor -> Garden
+    sup = Room("Supermarket", {})
+    street = Room("Street", {'east': sup})
+    driveway = Room("Driveway", {'east': street})
+    garden = Room("Garden", {})
+    corridor = Room("Corridor", {'east': garden})
+    living_room = Room("Living Room", {'east': driveway, 'south': corridor})
+    pantry = Room("Pantry", {})
+    kitchen = Room("Kitchen", {'east': living_room, 'south': pantry})
+    rooms = [
+        kitchen, living_room, driveway, street, sup,
+        pantry, corridor, garden,
+    ]
+    complete_map(rooms)
+    return {room.name: room for room in rooms}
+
+
+class TestRoutePlanner(unittest.TestCase):
+    def test_distances(self):
+        planner = RoutePlanner()
+        planner.update_from_rooms(_build_map())
+        self.assertEqual(0, planner.distance("Kitchen", "Kitchen"))
+        self.assertEqual(4, planner.distance("Kitchen", "Supermarket"))
+        self.assertEqual(4, planner.distance("Pantry", "Garden"))
+        self.assertIsNone(planner.distance("Kitchen", "Shed"))
+
+    def test_incremental_update(self):
+        planner = RoutePlanner()
+        planner.add_connection("Kitchen", "Living Room")
+        planner.add_connection("Living Room", "Corridor")
+        planner.add_room("Backyard")
+        self.assertIsNone(planner.distance("Kitchen", "Backyard"))
+        planner.add_connection("Corridor", "Backyard")
+        self.assertEqual(3, planner.distance("Kitchen", "Backyard"))
+        # A shortcut.
+        planner.add_connection("Kitchen", "Backyard")
+        self.assertEqual(1, planner.distance("Kitchen", "Backyard"))
+        self.assertEqual(2, planner.distance("Living Room", "Backyard"))
+
+    def test_plan_route_exact(self):
+        planner = RoutePlanner()
+        planner.update_from_rooms(_build_map())
+        stops = ["Supermarket", "Pantry", "Garden"]
+        route = planner.plan_route("Kitchen", stops, end="Kitchen")
+        self.assertEqual("Kitchen", route[-1])
+        self.assertCountEqual(stops, route[:-1])
+        best = min(planner.route_length("Kitchen", list(order) + ["Kitchen"]) for order in permutations(stops))
+        self.assertEqual(best, planner.route_length("Kitchen", route))
+
+    def test_plan_route_skips_unreachable(self):
+        planner = RoutePlanner()
+        planner.update_from_rooms(_build_map())
+        planner.add_room("Shed")
+        self.assertEqual(["Pantry"], planner.plan_route("Kitchen", ["Shed", "Pantry"]))
+
+    def test_plan_route_heuristic(self):
+        planner = RoutePlanner()
+        # A long corridor of rooms.
+        names = ["Room {}".format(i) for i in range(12)]
+        for from_name, to_name in zip(names, names[1:]):
+            planner.add_connection(from_name, to_name)
+        stops = names[1:][::-1]
+        route = planner.plan_route(names[0], stops)
+        self.assertEqual(names[1:], route)
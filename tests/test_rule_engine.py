@@ -0,0 +1,70 @@
+import unittest
+
+from rule_engine import Rule, RuleEngine
+
+
+class TestRuleEngine(unittest.TestCase):
+    def test_first_match(self):
+        engine = RuleEngine([
+            Rule('never', lambda c: "never", lambda c: False),
+            Rule('first', lambda c: "first", lambda c: True),
+            Rule('second', lambda c: "second"),
+        ])
+        self.assertEqual(('first', "first"), engine.decide(0, {}, None))
+        stats = engine.stats_dict()
+        self.assertEqual(1, stats['never']['evaluations'])
+        self.assertEqual(0, stats['never']['hits'])
+        self.assertEqual(1, stats['first']['hits'])
+        self.assertEqual(0, stats['second']['matches'])
+
+    def test_fall_through(self):
+        engine = RuleEngine([
+            Rule('nothing_to_do', lambda c: None),
+            Rule('fallback', lambda c: "wait"),
+        ])
+        self.assertEqual(('fallback', "wait"), engine.decide(0, {}, None))
+        stats = engine.stats_dict()
+        self.assertEqual(1, stats['nothing_to_do']['matches'])
+        self.assertEqual(0, stats['nothing_to_do']['hits'])
+
+        self.assertEqual((None, None), RuleEngine([]).decide(0, {}, None))
+
+        # Only the rules whose predicates hold are about to act.
+        names = []
+        engine = RuleEngine([Rule('never', lambda c: "never", lambda c: False)] + engine.rules)
+        self.assertEqual(('fallback', "wait"), engine.decide(0, {}, None, before_action=names.append))
+        self.assertEqual(['nothing_to_do', 'fallback'], names)
+
+    def test_skip_unchanged_inputs(self):
+        calls = []
+
+        def predicate(feats):
+            calls.append(feats['a'])
+            return feats['a'] > 1
+
+        engine = RuleEngine([
+            Rule('big', lambda feats: "big", predicate, inputs=('a',)),
+            Rule('small', lambda feats: "small"),
+        ])
+        feats = dict(a=1, b=0)
+        self.assertEqual('small', engine.decide(0, feats, feats)[1])
+        feats['b'] = 1
+        self.assertEqual('small', engine.decide(0, feats, feats)[1])
+        self.assertEqual([1], calls)
+        # Other games have their own results.
+        self.assertEqual('small', engine.decide(1, feats, feats)[1])
+        self.assertEqual([1, 1], calls)
+
+        feats['a'] = 2
+        self.assertEqual('big', engine.decide(0, feats, feats)[1])
+        engine.reset(0)
+        self.assertEqual('big', engine.decide(0, feats, feats)[1])
+        self.assertEqual([1, 1, 2, 2], calls)
+        stats = engine.stats_dict()['big']
+        self.assertEqual(4, stats['evaluations'])
+        self.assertEqual(1, stats['skipped'])
+        self.assertEqual(2, stats['hits'])
+
+    def test_unique_names(self):
+        with self.assertRaises(AssertionError):
+            RuleEngine([Rule('a', lambda c: None), Rule('a', lambda c: None)])
@@ -0,0 +1,101 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import sandbox
+
+_evaluate_script = '''
+import json
+import os
+import socket
+import sys
+
+
+def main():
+    output, read_only_dir = sys.argv[1:3]
+    result = dict(threads=os.environ.get("MKL_NUM_THREADS"), pid=os.getpid())
+    try:
+        open(os.path.join(read_only_dir, "written"), 'w').close()
+        result['read_only'] = False
+    except OSError:
+        result['read_only'] = True
+    with socket.socket() as s:
+        s.settimeout(1)
+        result['network'] = s.connect_ex(("1.1.1.1", 53)) == 0
+    with open(output, 'w') as f:
+        json.dump(result, f)
+    print("played")
+    sys.exit(int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def _can_sandbox():
+    try:
+        sandbox.check_sandbox()
+        return True
+    except RuntimeError:
+        return False
+
+
+@unittest.skipUnless(_can_sandbox(), "Sandboxes need unprivileged user namespaces.")
+class TestSandbox(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.read_only_dir = os.path.join(self._tmp.name, "submission")
+        self.output_dir = os.path.join(self._tmp.name, "output")
+        os.makedirs(self.read_only_dir)
+        os.makedirs(self.output_dir)
+        self.script = os.path.join(self.read_only_dir, "evaluate.py")
+        with open(self.script, 'w') as f:
+            f.write(_evaluate_script)
+        self.output = os.path.join(self.output_dir, "stats.json")
+
+    def _result(self):
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_run(self):
+        exit_code = sandbox.run(self.script, [self.output, self.read_only_dir], [self.read_only_dir],
+                                [self.output_dir], memory_mb=2048, timeout=60)
+        self.assertEqual(0, exit_code)
+        result = self._result()
+        self.assertTrue(result['read_only'])
+        self.assertFalse(result['network'])
+        self.assertEqual("1", result['threads'])
+        self.assertFalse(os.path.exists(os.path.join(self.read_only_dir, "written")))
+
+        self.assertEqual(3, sandbox.run(self.script, [self.output, self.read_only_dir, "3"], [self.read_only_dir],
+                                        timeout=60))
+
+    def test_worker(self):
+        socket_path = os.path.join(self._tmp.name, "worker.sock")
+        self.assertIsNone(sandbox.run_in_worker(socket_path, [], [self.read_only_dir]))
+
+        code = "import sys; sys.path.insert(0, {!r}); import sandbox; sandbox.serve({!r}, {!r}, [{!r}])".format(
+            os.path.dirname(os.path.abspath(sandbox.__file__)), socket_path, self.script, self.read_only_dir)
+        worker = subprocess.Popen(sandbox.sandbox_command([sys.executable, "-c", code], [self.read_only_dir]),
+                                  env=sandbox.sandbox_env(), stdout=subprocess.PIPE)
+        self.addCleanup(worker.wait)
+        self.addCleanup(worker.kill)
+        worker.stdout.readline()
+
+        self.assertEqual(0, sandbox.run_in_worker(socket_path, [self.output, self.read_only_dir],
+                                                  [self.read_only_dir], timeout=60))
+        first = self._result()
+        self.assertTrue(first['read_only'])
+        self.assertFalse(first['network'])
+        self.assertEqual(2, sandbox.run_in_worker(socket_path, [self.output, self.read_only_dir, "2"],
+                                                  [self.read_only_dir], timeout=60))
+        # Each evaluation gets a new process.
+        self.assertNotEqual(first['pid'], self._result()['pid'])
+
+        # The worker only has its own directories mounted.
+        self.assertIsNone(sandbox.run_in_worker(socket_path, [], [self.output_dir], timeout=60))
@@ -0,0 +1,85 @@
+import multiprocessing
+import queue
+import unittest
+
+import shm_ring
+from shm_ring import RingBuffer
+
+
+def _echo(commands, observations):
+    while True:
+        kind, text = shm_ring.decode_command(commands.get())
+        if kind == 'close':
+            break
+        observations.put(*shm_ring.encode_step("You {} and see a {}.".format(kind, text), len(text), text == "done",
+                                               dict(has_won=text == "done", has_lost=False, max_score=3), 0.5))
+
+
+class TestShmRing(unittest.TestCase):
+    def test_ring(self):
+        ring = RingBuffer(capacity=2, record_size=8)
+        try:
+            ring.put(b"ab", b"cd")
+            ring.put(b"")
+            with self.assertRaises(queue.Full):
+                ring.put(b"e", timeout=0.01)
+            with self.assertRaises(ValueError):
+                ring.put(b"123456789")
+            self.assertEqual(b"abcd", ring.get())
+            # The places are reused.
+            ring.put(b"12345678")
+            self.assertEqual(b"", ring.get())
+            self.assertEqual(b"12345678", ring.get())
+            with self.assertRaises(queue.Empty):
+                ring.get(block=False)
+        finally:
+            ring.close()
+
+    def test_notify(self):
+        ready = multiprocessing.Semaphore(0)
+        rings = [RingBuffer(notify=ready) for _ in range(2)]
+        try:
+            rings[1].put(b"x")
+            self.assertTrue(ready.acquire(timeout=1))
+            self.assertFalse(ready.acquire(block=False))
+            self.assertEqual(b"x", rings[1].get(block=False))
+        finally:
+            for ring in rings:
+                ring.close()
+
+    def test_codecs(self):
+        record = shm_ring.decode_step(b"".join(shm_ring.encode_step(
+            "-= Kitchen =-\nYou see a crème brûlée.", 2, True,
+            dict(has_won=True, has_lost=None, max_score=5, inventory="You are carrying nothing."), 0.25)))
+        self.assertEqual("-= Kitchen =-\nYou see a crème brûlée.", record.obs)
+        self.assertEqual((2, True, 0.25), (record.score, record.done, record.seconds))
+        self.assertEqual(dict(has_won=True, has_lost=None, max_score=5, inventory="You are carrying nothing."),
+                         record.infos)
+        with self.assertRaisesRegex(RuntimeError, "boom"):
+            shm_ring.decode_step(b"".join(shm_ring.encode_error("boom")))
+
+        self.assertEqual(('step', "take the red apple"),
+                         shm_ring.decode_command(shm_ring.encode_command('step', "take the red apple")))
+        self.assertEqual(('close', ""), shm_ring.decode_command(shm_ring.encode_command('close')))
+
+    def test_processes(self):
+        commands = RingBuffer(record_size=256)
+        observations = RingBuffer()
+        process = multiprocessing.Process(target=_echo, args=(commands, observations))
+        process.start()
+        try:
+            for text in ("north", "done"):
+                commands.put(shm_ring.encode_command('step', text))
+                record = shm_ring.decode_step(observations.get(timeout=10))
+                self.assertEqual("You step and see a {}.".format(text), record.obs)
+                self.assertEqual(len(text), record.score)
+                self.assertEqual(text == "done", record.done)
+                self.assertEqual(text == "done", record.infos['has_won'])
+            commands.put(shm_ring.encode_command('close'))
+            process.join(timeout=10)
+            self.assertEqual(0, process.exitcode)
+        finally:
+            if process.is_alive():
+                process.terminate()
+            commands.close()
+            observations.close()
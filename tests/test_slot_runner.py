@@ -0,0 +1,82 @@
+import os
+import unittest
+
+from slot_runner import play_games_continuously
+
+
+class _CountingEnv(object):
+    """
+    A batch of one game that is won after as many steps as the number in the name of its file.
+    """
+
+    def __init__(self, gamefile):
+        self._length = int(os.path.splitext(os.path.basename(gamefile))[0].split("_")[-1])
+        self._steps = 0
+
+    def _infos(self, done):
+        return dict(has_won=[done], has_lost=[False], max_score=[self._length])
+
+    def reset(self):
+        self._steps = 0
+        return ["-= Kitchen =-"], self._infos(False)
+
+    def step(self, commands):
+        self._steps += 1
+        done = self._steps == self._length
+        return ["You {}.".format(commands[0])], [self._steps], [done], self._infos(done)
+
+    def close(self):
+        pass
+
+
+class _WaitingAgent(object):
+    def __init__(self):
+        self.episodes = []
+
+    def act(self, obs, scores, dones, infos):
+        return ["wait"] * len(obs)
+
+    def start_slot_episode(self, slot_index, same_game):
+        self.episodes.append((slot_index, same_game))
+
+
+def _new_game_stats():
+    return {"runs": [], "aborted_episodes": 0, "steps_reclaimed": 0, "time_reclaimed": 0.0}
+
+
+class TestSlotRunner(unittest.TestCase):
+    game_files = ["games/tw_3.ulx", "games/tw_1.ulx", "games/tw_2.ulx"]
+
+    def _play(self, agent, nb_slots, **kwargs):
+        results = {}
+        play_games_continuously(agent, _CountingEnv, self.game_files, nb_slots, 2, 100, _new_game_stats,
+                                callback=results.update, **kwargs)
+        return results
+
+    def test_slots(self):
+        agent = _WaitingAgent()
+        results = self._play(agent, 2)
+        self.assertEqual({"tw_1.ulx", "tw_2.ulx", "tw_3.ulx"}, set(results))
+        for game_name, length in [("tw_1.ulx", 1), ("tw_2.ulx", 2), ("tw_3.ulx", 3)]:
+            stats = results[game_name]
+            self.assertEqual(2, stats["episodes_run"])
+            self.assertEqual([length, length], [run["score"] for run in stats["runs"]])
+            self.assertEqual([["wait"] * length] * 2, [run["commands"] for run in stats["runs"]])
+            self.assertEqual(length, stats["max_scores"])
+        # The two episodes of each game are played at the same time in the two slots.
+        self.assertEqual([(0, False), (1, False)] * 3, agent.episodes)
+
+    def test_results_without_callback(self):
+        results = play_games_continuously(_WaitingAgent(), _CountingEnv, self.game_files[:1], 4, 3, 100,
+                                          _new_game_stats)
+        self.assertEqual(1, len(results))
+        self.assertEqual([3, 3, 3], [run["steps"] for run in results[0]["tw_3.ulx"]["runs"]])
+
+    def test_env_workers(self):
+        results = self._play(_WaitingAgent(), 2, env_workers=True)
+        self.assertEqual([2, 2], [run["score"] for run in results["tw_2.ulx"]["runs"]])
+        self.assertEqual([3, 3], [run["steps"] for run in results["tw_3.ulx"]["runs"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
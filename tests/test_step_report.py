@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from step_report import format_report, report
+from trace_store import TraceWriter
+
+_episode = [
+    ("-= Kitchen =-\nYou've entered a kitchen.", "north", 0, "search"),
+    ("-= Garden =-\nYou find yourself in a garden.", "go south", 0, "bring_to_kitchen"),
+    ("-= Kitchen =-\nYou've entered a kitchen.", "inventory", 0, "check_inventory"),
+    ("You are carrying nothing.", "inventory", 0, "check_inventory"),
+    ("You are carrying nothing.", "take carrot", 0, "take_ingredient"),
+    ("You can't see any such thing.", "west", 0, "search"),
+    ("You have to open the wooden door first.", "wait", 0, "error"),
+    ("Time passes.", "take apple", 0, "take_ingredient"),
+]
+
+
+class TestStepReport(unittest.TestCase):
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as root:
+            with TraceWriter(os.path.join(root, "game1.ulx")) as writer:
+                # Steps of episodes played at the same time are interleaved.
+                for step, (ob, action, score, branch) in enumerate(_episode):
+                    writer.add_step("game1.ulx", 0, step, ob, action, score, branch=branch)
+                    if step < 2:
+                        writer.add_step("game1.ulx", 1, step, ob, action, score)
+                writer.add_episode("game1.ulx", 0, 1, len(_episode), True, False)
+                writer.add_episode("game1.ulx", 1, 0, 2, False, False)
+            with TraceWriter(os.path.join(root, "game2.ulx")) as writer:
+                writer.add_step("game2.ulx", 0, 1, "Time passes.", "wait", 0)
+                writer.add_step("game2.ulx", 0, 0, "-= Garden =-", "wait", 0)
+
+            result = report(root)
+
+        game1 = result['games']["game1.ulx"]
+        self.assertEqual(dict(new_room=2, revisited_room=1, other=2, redundant_inventory=1, failed_take=1,
+                              door_error=1, wait=1, scored=1), dict(game1['categories']))
+        self.assertEqual((2, 1, 10, 8, 4), (game1['episodes'], game1['won_episodes'], game1['steps'],
+                                            game1['won_steps'], game1['wasted']))
+        self.assertEqual(dict(wait=2), dict(result['games']["game2.ulx"]['categories']))
+        self.assertEqual(6, result['corpus']['wasted'])
+        self.assertEqual({'search': 1, '-': 1}, dict(result['branches']['new_room']))
+        text = format_report(result)
+        self.assertIn("3 episodes, 12 steps, 6 wasted (50.0%)", text)
+        self.assertIn("game2.ulx", text)
@@ -0,0 +1,58 @@
+import unittest
+
+from stuck_detector import StuckDetector
+
+
+class TestStuckDetector(unittest.TestCase):
+    def test_progress_is_not_stuck(self):
+        detector = StuckDetector()
+        for step in range(50):
+            detector.record("You are in room {}.".format(step), "north", 0, step)
+        self.assertFalse(detector.needs_recovery)
+        self.assertFalse(detector.gave_up)
+
+    def test_cycle(self):
+        detector = StuckDetector(progress_window=100)
+        for step in range(3):
+            self.assertFalse(detector.needs_recovery)
+            detector.record("You can't see any such thing.", "take carrot", 0, step % 2)
+            detector.record("-= Kitchen =-", "look", 0, step % 2)
+        self.assertTrue(detector.needs_recovery)
+
+    def test_no_progress(self):
+        detector = StuckDetector(progress_window=5)
+        detector.record("first ob", "first action", 0, "same")
+        for step in range(5):
+            self.assertFalse(detector.needs_recovery)
+            detector.record("ob {}".format(step), "action {}".format(step), 0, "same")
+        self.assertTrue(detector.needs_recovery)
+
+    def test_score_is_progress(self):
+        detector = StuckDetector(progress_window=5)
+        for step in range(20):
+            detector.record("ob {}".format(step), "action {}".format(step), step, "same")
+        self.assertFalse(detector.needs_recovery)
+
+    def test_recovery_then_give_up(self):
+        detector = StuckDetector(progress_window=3, recovery_steps=4)
+        for step in range(3):
+            detector.record("ob", "wait", 0, "same")
+        self.assertTrue(detector.needs_recovery)
+        detector.start_recovery()
+        self.assertFalse(detector.needs_recovery)
+        for step in range(4):
+            self.assertFalse(detector.gave_up)
+            detector.record("ob", "wait", 0, "same")
+        self.assertTrue(detector.gave_up)
+        self.assertEqual(1, detector.num_recoveries)
+
+    def test_successful_recovery(self):
+        detector = StuckDetector(progress_window=3, recovery_steps=4)
+        for step in range(3):
+            detector.record("ob", "wait", 0, "same")
+        detector.start_recovery()
+        detector.record("ob", "look", 0, "new")
+        for step in range(10):
+            detector.record("ob {}".format(step), "north", 0, step)
+        self.assertFalse(detector.gave_up)
+        self.assertFalse(detector.recovering)
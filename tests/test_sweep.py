@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from sweep import grid_configs, pareto_front, random_configs, ResultCache, run_sweep
+
+
+def _fake_play(job):
+    config, game_file, seed = job
+    return dict(score=config['a'] + seed, max_score=10, steps=10 * config['b'], wins=config['a'], episodes=2,
+                duration=0.5)
+
+
+class TestSweep(unittest.TestCase):
+    def test_configs(self):
+        space = dict(a=[1, 2], b=['x', 'y', 'z'])
+        configs = grid_configs(space)
+        self.assertEqual(6, len(configs))
+        self.assertIn(dict(a=2, b='y'), configs)
+
+        sampled = random_configs(space, 4, seed=3)
+        self.assertEqual(4, len(sampled))
+        self.assertEqual(4, len({(c['a'], c['b']) for c in sampled}))
+        self.assertEqual(sampled, random_configs(space, 4, seed=3))
+        self.assertEqual(6, len(random_configs(space, 100)))
+
+    def test_pareto_front(self):
+        rows = [
+            dict(name='best score', normalized_score=0.9, steps_per_win=50),
+            dict(name='fastest', normalized_score=0.5, steps_per_win=10),
+            dict(name='dominated', normalized_score=0.5, steps_per_win=60),
+            dict(name='no wins', normalized_score=0.1, steps_per_win=None),
+        ]
+        self.assertEqual(['best score', 'fastest'], [row['name'] for row in pareto_front(rows)])
+
+    def test_run_sweep_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            game_files = []
+            for name in ('g1.ulx', 'g2.ulx'):
+                path = os.path.join(tmp, name)
+                with open(path, 'w') as f:
+                    f.write(name)
+                game_files.append(path)
+            configs = grid_configs(dict(a=[0, 1], b=[2]))
+            played = []
+            cache = ResultCache(os.path.join(tmp, 'cache.sqlite'))
+            rows = run_sweep(configs, game_files, [0, 1], cache=cache, play=_fake_play,
+                             callback=lambda job, value: played.append(job))
+            cache.close()
+            self.assertEqual(8, len(played))
+            self.assertEqual([0, 1], [row['config']['a'] for row in rows])
+            self.assertEqual([2, 6], [row['score'] for row in rows])
+            self.assertIsNone(rows[0]['steps_per_win'])
+            self.assertEqual(80 / 4, rows[1]['steps_per_win'])
+
+            played = []
+            cache = ResultCache(os.path.join(tmp, 'cache.sqlite'))
+            configs.append(dict(a=2, b=1))
+            again = run_sweep(configs, game_files, [0, 1], nb_processes=2, cache=cache, play=_fake_play,
+                              callback=lambda job, value: played.append(job))
+            cache.close()
+            self.assertEqual(4, len(played))
+            self.assertTrue(all(job[0] == dict(a=2, b=1) for job in played))
+            self.assertEqual(rows, again[:2])
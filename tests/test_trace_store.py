@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+from trace_store import query, TraceReader, TraceWriter
+
+
+class TestTraceStore(unittest.TestCase):
+    def test_write_read(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "game1.ulx")
+            with TraceWriter(path, buffer_size=2) as writer:
+                writer.add_step("game1.ulx", 0, 0, "-= Kitchen =-", "look cookbook", 0, "CURRENT_ROOM=Kitchen",
+                                "read_cookbook")
+                writer.add_step("game1.ulx", 0, 1, "Ingredients:", "inventory", 1, None, "check_inventory")
+                writer.add_step("game1.ulx", 0, 2, "-= Kitchen =-", "open fridge", 1)
+                writer.add_episode("game1.ulx", 0, 1, 3, False, False)
+
+            with TraceReader(path) as reader:
+                self.assertEqual(3, reader.num_steps)
+                step = reader.step(0)
+                self.assertEqual("game1.ulx", step.game)
+                self.assertEqual("-= Kitchen =-", step.observation)
+                self.assertEqual("look cookbook", step.action)
+                self.assertEqual("CURRENT_ROOM=Kitchen", step.features)
+                self.assertEqual("read_cookbook", step.branch)
+                self.assertIsNone(reader.step(1).features)
+                self.assertIsNone(reader.step(2).branch)
+                # Strings are deduplicated.
+                self.assertEqual(reader.step(0).observation, reader.step(2).observation)
+                self.assertEqual("open fridge", reader.string(reader.string_id("open fridge")))
+                self.assertIsNone(reader.string_id("eat meal"))
+                self.assertEqual([(0, 1, 3, False, False)],
+                                 [(e.episode, e.score, e.steps, e.has_won, e.has_lost) for e in reader.episodes()])
+
+    def test_append_and_query(self):
+        with tempfile.TemporaryDirectory() as root:
+            for game in ("game1.ulx", "game2.ulx"):
+                with TraceWriter(os.path.join(root, game)) as writer:
+                    for episode in range(2):
+                        writer.add_step(game, episode, 0, "ob", "look cookbook", 0, branch="read_cookbook")
+                        writer.add_step(game, episode, 1, "ob", "eat meal", 1, branch="eat_meal")
+                        writer.add_episode(game, episode, 1, 2, episode == 0, False)
+            # Another run appends to the same store.
+            with TraceWriter(os.path.join(root, "game1.ulx")) as writer:
+                self.assertEqual(1, writer.run)
+                writer.add_step("game1.ulx", 0, 0, "new ob", "wait", 0, branch="error")
+                writer.add_episode("game1.ulx", 0, 0, 1, False, True)
+
+            self.assertEqual(9, len(list(query(root))))
+            self.assertEqual(5, len(list(query(root, game="game1.ulx"))))
+            self.assertEqual(0, len(list(query(root, game="game3.ulx"))))
+            self.assertEqual(["eat meal"] * 4, [step.action for step in query(root, branch="eat_meal")])
+            won = list(query(root, outcome="won"))
+            self.assertEqual(4, len(won))
+            self.assertTrue(all(step.episode == 0 and step.run == 0 for step in won))
+            lost = list(query(root, game="game1.ulx", outcome="lost"))
+            self.assertEqual([("new ob", 1)], [(step.observation, step.run) for step in lost])
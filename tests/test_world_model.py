@@ -0,0 +1,83 @@
+import unittest
+
+from room import Room
+from world_model import _unknown_location_steps, best_command, lookahead, WorldGraph, WorldState
+
+
+def _make_map():
+    # Pantry - Kitchen - Living Room = Garden
+    # The door between the Living Room and the Garden is closed.
+    kitchen = Room("Kitchen", {})
+    pantry = Room("Pantry", {})
+    living_room = Room("Living Room", {})
+    garden = Room("Garden", {})
+    kitchen.directions.update(west=pantry, east=living_room)
+    pantry.directions['east'] = kitchen
+    living_room.directions.update(west=kitchen, east=garden)
+    garden.directions['west'] = living_room
+    living_room.set_door('east', "screen door", is_open=False)
+    garden.set_door('west', "screen door", is_open=False)
+    return {room.name: room for room in (kitchen, pantry, living_room, garden)}
+
+
+class TestWorldModel(unittest.TestCase):
+    def test_distance(self):
+        graph = WorldGraph(_make_map())
+        self.assertEqual(0, graph.distance("Kitchen", "Kitchen"))
+        self.assertEqual(1, graph.distance("Kitchen", "Pantry"))
+        self.assertEqual(3, graph.distance("Kitchen", "Garden"))
+        self.assertEqual(2, graph.distance("Garden", "Living Room"))
+        self.assertEqual(1, graph.distance("Living Room", "Kitchen"))
+        self.assertEqual(_unknown_location_steps, graph.distance("Kitchen", "Shed"))
+
+    def test_apply_and_fork(self):
+        state = WorldState(WorldGraph(_make_map()), "Kitchen", ["carrot"], dict(carrot="Garden"), num_held=0,
+                           capacity=2, num_recipe_steps=1, cook_rooms=["Kitchen"])
+        # 3 + 1 to take the carrot, 3 back, 1 recipe step and eating.
+        self.assertEqual(9, state.estimate())
+        forked = state.fork()
+        forked.apply("east")
+        forked.apply("east")
+        self.assertEqual([("take carrot", 1), ("west", 2)], forked.commands())
+        forked.apply("take carrot")
+        self.assertEqual("Kitchen", state.room)
+        self.assertEqual({"carrot"}, state.needed)
+        self.assertEqual(set(), forked.needed)
+        self.assertEqual(1, forked.num_held)
+        with self.assertRaises(ValueError):
+            forked.apply("north")
+
+    def test_lookahead(self):
+        state = WorldState(WorldGraph(_make_map()), "Living Room", ["carrot", "salt"],
+                           dict(carrot="Garden", salt="Pantry"), num_held=0, capacity=3, num_recipe_steps=2,
+                           cook_rooms=["Kitchen"])
+        values = lookahead(state, depth=4, budget=1000)
+        self.assertEqual({"east", "west"}, set(values))
+        # Get the carrot first: 2 + 1 + 2, then 1 + 1 + 1 + 1 for the salt, and the 2 recipe steps and eating.
+        self.assertEqual(12, values["east"])
+        # Going to the Garden last goes through the Living Room twice.
+        self.assertEqual(14, values["west"])
+        self.assertEqual("east", best_command(values))
+
+        # Without a budget, only the first commands are simulated.
+        self.assertEqual({"east", "west"}, set(lookahead(state, depth=4, budget=0)))
+        self.assertIsNone(best_command({}))
+
+    def test_frontier(self):
+        # Kitchen - Hall - Corridor - Den, and only the Den has an exit to rooms that were not found yet.
+        rooms = {name: Room(name, {}) for name in ("Kitchen", "Hall", "Corridor", "Den")}
+        names = list(rooms)
+        for west_name, east_name in zip(names, names[1:]):
+            rooms[west_name].directions['east'] = rooms[east_name]
+            rooms[east_name].directions['west'] = rooms[west_name]
+        rooms["Den"].directions['north'] = None
+        state = WorldState(WorldGraph(rooms), "Corridor", ["carrot"], {}, num_held=0, capacity=2,
+                           num_recipe_steps=1, cook_rooms=["Kitchen"], frontier=["Den"])
+        # Look for the carrot from the Den then go back to the Kitchen.
+        self.assertEqual(dict(east=11, west=13), lookahead(state, depth=1, budget=100))
+        # The model can't go on from the Den, but going back towards the Kitchen doesn't look better.
+        values = lookahead(state, depth=2, budget=100)
+        self.assertLessEqual(values['east'], values['west'])
+        # Without a frontier, going back towards the Kitchen looks better.
+        state.frontier = ()
+        self.assertLess(*(lookahead(state, depth=2, budget=100)[direction] for direction in ('west', 'east')))
@@ -0,0 +1,347 @@
+"""
+An append-only columnar store for the steps played in games.
+
+Each column is a file of fixed width numbers.
+Strings (game names, observations, actions, feature snapshots, branches) are deduplicated into a dictionary
+and the columns hold their ids.
+Readers memory-map the files so that millions of steps can be filtered with NumPy
+without loading them as Python objects.
+
+A store is a directory. Games played in different processes should use different stores, e.g. one per game,
+and `query` reads all of the stores under a directory.
+"""
+import json
+import mmap
+import os
+from array import array
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+_step_columns = (
+    # (name, array type code)
+    ('game', 'i'),
+    ('run', 'i'),
+    ('episode', 'i'),
+    ('step', 'i'),
+    ('observation', 'i'),
+    ('action', 'i'),
+    ('score', 'i'),
+    ('features', 'i'),
+    ('branch', 'i'),
+)
+_episode_columns = (
+    ('game', 'i'),
+    ('run', 'i'),
+    ('episode', 'i'),
+    ('score', 'i'),
+    ('steps', 'i'),
+    ('has_won', 'b'),
+    ('has_lost', 'b'),
+)
+_string_columns = {'game', 'observation', 'action', 'features', 'branch'}
+
+_strings_file = 'strings.bin'
+_string_offsets_file = 'strings.idx'
+_meta_file = 'meta.json'
+
+_no_string = -1
+"""
+The id stored for a missing string.
+"""
+
+Step = namedtuple('Step', [name for name, _ in _step_columns])
+Episode = namedtuple('Episode', [name for name, _ in _episode_columns])
+
+
+def _column_file(table, name):
+    return f'{table}.{name}.col'
+
+
+class TraceWriter(object):
+    """
+    Appends steps and episode results to a store.
+    Rows are buffered and written when `flush` or `close` is called.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 4096):
+        self._path = path
+        self._buffer_size = buffer_size
+        os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, _meta_file)
+        meta = dict(runs=0)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        self.run = meta['runs']
+        meta['runs'] += 1
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+        self._string_ids: Dict[str, int] = {}
+        for string_id, s in enumerate(_read_strings(path)):
+            self._string_ids[s] = string_id
+        self._new_strings: List[str] = []
+        self._steps = {name: array(code) for name, code in _step_columns}
+        self._episodes = {name: array(code) for name, code in _episode_columns}
+
+    def _string_id(self, s: Optional[str]) -> int:
+        if s is None:
+            return _no_string
+        result = self._string_ids.get(s)
+        if result is None:
+            result = len(self._string_ids)
+            self._string_ids[s] = result
+            self._new_strings.append(s)
+        return result
+
+    def add_step(self, game: str, episode: int, step: int, observation: str, action: str, score: int,
+                 features: Optional[str] = None, branch: Optional[str] = None) -> None:
+        row = dict(game=game, run=self.run, episode=episode, step=step, observation=observation, action=action,
+                   score=score, features=features, branch=branch)
+        self._append(self._steps, row)
+        if len(self._steps['game']) >= self._buffer_size:
+            self.flush()
+
+    def add_episode(self, game: str, episode: int, score: int, steps: int, has_won: bool, has_lost: bool) -> None:
+        row = dict(game=game, run=self.run, episode=episode, score=score, steps=steps,
+                   has_won=has_won, has_lost=has_lost)
+        self._append(self._episodes, row)
+
+    def _append(self, columns: Dict[str, array], row: Dict) -> None:
+        for name, values in columns.items():
+            value = row[name]
+            if name in _string_columns:
+                value = self._string_id(value)
+            values.append(int(value))
+
+    def flush(self) -> None:
+        # Write the strings first so that the ids in the columns always exist.
+        if len(self._new_strings) > 0:
+            with open(os.path.join(self._path, _strings_file), 'ab') as f:
+                end = f.tell()
+                offsets = array('q')
+                for s in self._new_strings:
+                    data = s.encode('utf-8')
+                    f.write(data)
+                    end += len(data)
+                    offsets.append(end)
+            with open(os.path.join(self._path, _string_offsets_file), 'ab') as f:
+                offsets.tofile(f)
+            self._new_strings = []
+        for table, columns in (('steps', self._steps), ('episodes', self._episodes)):
+            for name, values in columns.items():
+                if len(values) > 0:
+                    with open(os.path.join(self._path, _column_file(table, name)), 'ab') as f:
+                        values.tofile(f)
+                    del values[:]
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _map_file(path: str):
+    """
+    :return: A read-only memory map of the file or `None` if the file is empty or does not exist.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_strings(path: str) -> Iterator[str]:
+    strings = _map_file(os.path.join(path, _strings_file))
+    offsets = _map_file(os.path.join(path, _string_offsets_file))
+    if strings is None or offsets is None:
+        return
+    view = memoryview(offsets)
+    ends = view.cast('q')
+    try:
+        start = 0
+        for end in ends:
+            yield strings[start:end].decode('utf-8')
+            start = end
+    finally:
+        ends.release()
+        view.release()
+        offsets.close()
+        strings.close()
+
+
+class TraceReader(object):
+    """
+    Reads one store through memory maps.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._maps = []
+        self._views = []
+        self._strings = self._map(_strings_file)
+        self._string_offsets = self._cast(self._map(_string_offsets_file), 'q')
+        self._steps = {name: self._cast(self._map(_column_file('steps', name)), code)
+                       for name, code in _step_columns}
+        self._episodes = {name: self._cast(self._map(_column_file('episodes', name)), code)
+                          for name, code in _episode_columns}
+        self._string_hashes: Optional[Dict[int, List[int]]] = None
+        """
+        The ids of the strings by the hash of their bytes, made at the first lookup of a string.
+        """
+        # Columns can have different lengths if a writer was interrupted while flushing.
+        self.num_steps = min(map(len, self._steps.values()))
+        self.num_episodes = min(map(len, self._episodes.values()))
+
+    def _map(self, file_name):
+        result = _map_file(os.path.join(self.path, file_name))
+        if result is not None:
+            self._maps.append(result)
+        return result
+
+    def _cast(self, m, code):
+        if m is None:
+            return array(code)
+        view = memoryview(m)
+        result = view.cast(code)
+        self._views.extend((view, result))
+        return result
+
+    def close(self) -> None:
+        # Views have to be released before their memory maps can be closed.
+        for view in reversed(self._views):
+            view.release()
+        for m in self._maps:
+            m.close()
+        self._views = []
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id == _no_string:
+            return None
+        start = self._string_offsets[string_id - 1] if string_id > 0 else 0
+        return self._strings[start:self._string_offsets[string_id]].decode('utf-8')
+
+    def string_id(self, s: str) -> Optional[int]:
+        """
+        :return: The id of the string or `None` if it is not in the store.
+        """
+        if self._strings is None:
+            return None
+        if self._string_hashes is None:
+            self._string_hashes = {}
+            start = 0
+            for string_id, end in enumerate(self._string_offsets):
+                self._string_hashes.setdefault(hash(self._strings[start:end]), []).append(string_id)
+                start = end
+        data = s.encode('utf-8')
+        for string_id in self._string_hashes.get(hash(data), ()):
+            if self.string(string_id) == s:
+                return string_id
+        return None
+
+    def step(self, index: int) -> Step:
+        values = []
+        for name, _ in _step_columns:
+            value = self._steps[name][index]
+            if name in _string_columns:
+                value = self.string(value)
+            values.append(value)
+        return Step(*values)
+
+    def episode(self, index: int) -> Episode:
+        values = []
+        for name, _ in _episode_columns:
+            value = self._episodes[name][index]
+            if name in _string_columns:
+                value = self.string(value)
+            elif name in ('has_won', 'has_lost'):
+                value = bool(value)
+            values.append(value)
+        return Episode(*values)
+
+    def episodes(self) -> Iterator[Episode]:
+        for index in range(self.num_episodes):
+            yield self.episode(index)
+
+    def step_indices(self, game: Optional[str] = None, branch: Optional[str] = None,
+                     outcome: Optional[str] = None) -> Iterator[int]:
+        """
+        :param game: Only steps of this game.
+        :param branch: Only steps where the agent made its decision in this branch.
+        :param outcome: Only steps of episodes that were 'won', 'lost' or neither ('unfinished').
+        :return: The indices of the matching steps.
+        """
+        yield from self._matching_step_indices(game, branch, outcome)
+
+    def _column(self, table: str, name: str) -> np.ndarray:
+        """
+        :return: A column as an array on the memory map, to drop before the reader is closed.
+        """
+        if table == 'steps':
+            return np.asarray(self._steps[name])[:self.num_steps]
+        return np.asarray(self._episodes[name])[:self.num_episodes]
+
+    def _matching_step_indices(self, game: Optional[str], branch: Optional[str], outcome: Optional[str]) -> List[int]:
+        mask = np.ones(self.num_steps, dtype=bool)
+        for name, value in (('game', game), ('branch', branch)):
+            if value is not None:
+                value_id = self.string_id(value)
+                if value_id is None:
+                    return []
+                mask &= self._column('steps', name) == value_id
+
+        if outcome is not None:
+            won = self._column('episodes', 'has_won') != 0
+            lost = self._column('episodes', 'has_lost') != 0
+            episode_outcomes = np.where(won, 'won', np.where(lost, 'lost', 'unfinished'))
+            key_names = ('game', 'run', 'episode')
+            step_keys = [self._column('steps', name).astype(np.int64) for name in key_names]
+            episode_keys = [self._column('episodes', name).astype(np.int64) for name in key_names]
+            # One number for each (game, run, episode).
+            dims = tuple(int(max(step_key.max(initial=0), episode_key.max(initial=0))) + 1
+                         for step_key, episode_key in zip(step_keys, episode_keys))
+            matching_episodes = np.ravel_multi_index(episode_keys, dims)[episode_outcomes == outcome]
+            mask &= np.isin(np.ravel_multi_index(step_keys, dims), matching_episodes)
+
+        return np.flatnonzero(mask).tolist()
+
+    def steps(self, game: Optional[str] = None, branch: Optional[str] = None,
+              outcome: Optional[str] = None) -> Iterator[Step]:
+        for index in self.step_indices(game, branch, outcome):
+            yield self.step(index)
+
+
+def _store_paths(root: str) -> List[str]:
+    if os.path.exists(os.path.join(root, _meta_file)):
+        return [root]
+    result = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            result.extend(_store_paths(path))
+    return result
+
+
+def query(root: str, game: Optional[str] = None, branch: Optional[str] = None,
+          outcome: Optional[str] = None) -> Iterator[Step]:
+    """
+    Find steps in all of the stores under `root`.
+    See `TraceReader.step_indices` for the filters.
+    """
+    for path in _store_paths(root):
+        with TraceReader(path) as reader:
+            yield from reader.steps(game, branch, outcome)
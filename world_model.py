@@ -0,0 +1,222 @@
+"""
+A cheap model of a cooking game built from what the agent knows, to look ahead before spending env steps.
+
+The model knows the discovered map, where the missing ingredients and the knife were seen,
+the rooms where the ones that were not seen yet could be found, how many items are held and which recipe steps are left.
+It predicts the effects of moving between known rooms and of taking items,
+and it estimates the number of steps left to finish the recipe from any state.
+`lookahead` searches the command sequences up to a depth and a budget of simulated states
+to find the predicted number of steps to the goal after each command.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from batched_paths import BatchedPaths
+from room import Room
+
+_unknown_location_steps = 4
+"""
+The steps estimated to find an item that was not seen yet or to reach a room that is not on the known map.
+"""
+
+
+class WorldGraph(object):
+    """
+    The discovered map. It does not change during a lookahead so all of the states share it.
+    """
+
+    def __init__(self, rooms: Dict[str, Room], distance: Optional[Callable[[str, str], Optional[int]]] = None):
+        """
+        :param distance: The fewest commands to go from a room to another one, `None` if no path is known,
+            e.g. `BatchedPaths.frozen_distance` of the agent, which already has the distances of the map
+            and keeps them when the map changes before the lookahead.
+            By default, they are computed from `rooms`.
+        """
+        if distance is None:
+            paths = BatchedPaths()
+            paths.invalidate(0, rooms)
+            distance = paths.frozen_distance(0)
+        self._distance = distance
+        self._distances: Dict[Tuple[str, str], int] = {}
+        """
+        The distances looked up so far.
+        """
+        self.moves: Dict[str, List[Tuple[str, str, int]]] = {
+            name: [(direction, neighbour.name, room.step_cost(direction))
+                   for direction, neighbour in room.directions.items()
+                   if neighbour is not None and neighbour.name in rooms]
+            for name, room in rooms.items()
+        }
+        """
+        For each room, the direction, the room it leads to and its cost for each known connection.
+        """
+
+    def distance(self, from_name: str, to_name: str) -> int:
+        if from_name == to_name:
+            return 0
+        result = self._distances.get((from_name, to_name))
+        if result is None:
+            result = self._distance(from_name, to_name)
+            if result is None:
+                result = _unknown_location_steps
+            self._distances[from_name, to_name] = result
+        return result
+
+
+class WorldState(object):
+    def __init__(self, graph: WorldGraph, room: str, needed: Iterable[str], locations: Dict[str, str],
+                 num_held: int, capacity: int, num_recipe_steps: int, cook_rooms: Iterable[str] = (),
+                 needs_knife: bool = False, frontier: Iterable[str] = ()):
+        """
+        :param needed: The ingredients that still need to be taken.
+        :param locations: The room where each item that isn't held was seen, including the knife.
+        :param frontier: The known rooms to go to to look for the items that were not seen yet:
+            rooms that were not searched yet and rooms with exits to rooms that were not found yet.
+        :param cook_rooms: The rooms where some of the recipe steps left have to be done,
+            the Kitchen last since the meal is prepared there.
+        :param needs_knife: If the knife has to be taken for the recipe steps left.
+        """
+        self.graph = graph
+        self.room = room
+        self.needed = set(needed)
+        self.locations = locations
+        self.num_held = num_held
+        self.capacity = capacity
+        self.num_recipe_steps = num_recipe_steps
+        self.cook_rooms = tuple(cook_rooms)
+        self.needs_knife = needs_knife
+        self.frontier = tuple(frontier)
+
+    def fork(self) -> 'WorldState':
+        """
+        :return: A copy of the state that can be changed without changing this one.
+        """
+        return WorldState(self.graph, self.room, self.needed, self.locations, self.num_held, self.capacity,
+                          self.num_recipe_steps, self.cook_rooms, self.needs_knife, self.frontier)
+
+    def key(self) -> tuple:
+        return self.room, frozenset(self.needed), self.num_held, self.needs_knife
+
+    def commands(self) -> List[Tuple[str, int]]:
+        """
+        :return: The commands whose effects the model can predict and their costs in steps.
+        """
+        result = []
+        if self.num_held < self.capacity:
+            for item in sorted(self.needed):
+                if self.locations.get(item) == self.room:
+                    result.append(("take {}".format(item), 1))
+            if self.needs_knife and self.locations.get('knife') == self.room:
+                result.append(("take knife", 1))
+        for direction, _, cost in self.graph.moves.get(self.room, ()):
+            result.append((direction, cost))
+        return result
+
+    def apply(self, command: str) -> None:
+        """
+        Change the state with the predicted effect of a command from `commands`.
+        """
+        if command.startswith("take "):
+            item = command[len("take "):]
+            if item == 'knife':
+                self.needs_knife = False
+            else:
+                self.needed.discard(item)
+            self.num_held += 1
+            return
+        for direction, room_name, _ in self.graph.moves[self.room]:
+            if direction == command:
+                self.room = room_name
+                return
+        raise ValueError("The model can't predict: {}".format(command))
+
+    def estimate(self) -> int:
+        """
+        :return: The estimated number of steps to take the missing items, go to the rooms to cook,
+            do the recipe steps and eat the meal.
+            Items that were not seen yet are looked for from the nearest room of the frontier,
+            so that going towards the unexplored rooms gets closer to the goal, not only going back to cook.
+        """
+        stops = set()
+        num_unknown = 0
+        items = list(self.needed)
+        if self.needs_knife:
+            items.append('knife')
+        for item in items:
+            location = self.locations.get(item)
+            if location is None:
+                num_unknown += 1
+            else:
+                stops.add(location)
+        if num_unknown > 0 and len(self.frontier) > 0:
+            stops.add(min(self.frontier, key=lambda name: (self.graph.distance(self.room, name), name)))
+        # Visit the nearest stop first.
+        travel = 0
+        room = self.room
+        stops.discard(room)
+        while len(stops) > 0:
+            nearest = min(stops, key=lambda name: (self.graph.distance(room, name), name))
+            travel += self.graph.distance(room, nearest)
+            room = nearest
+            stops.discard(room)
+        for cook_room in self.cook_rooms:
+            travel += self.graph.distance(room, cook_room)
+            room = cook_room
+        # Items beyond the capacity have to be dropped at some point.
+        drops = max(0, self.num_held + len(items) - self.capacity)
+        return travel + len(items) + drops + num_unknown * _unknown_location_steps + self.num_recipe_steps + 1
+
+
+def lookahead(state: WorldState, depth: int, budget: int) -> Dict[str, int]:
+    """
+    :param depth: The number of commands to simulate before estimating the steps left.
+    :param budget: The maximum number of states to simulate.
+    :return: For each command whose effect can be predicted now,
+        the fewest predicted steps to the goal when starting with it.
+    """
+    remaining = [budget]
+    best_values: Dict[tuple, int] = {}
+
+    def successors(s: WorldState):
+        children = []
+        for command, cost in s.commands():
+            child = s.fork()
+            child.apply(command)
+            children.append((cost + child.estimate(), command, cost, child))
+        # Look at the most promising commands first to make the most of the budget.
+        children.sort(key=lambda c: (c[0], c[1]))
+        return children
+
+    def value(s: WorldState, d: int) -> int:
+        if d == 0 or remaining[0] <= 0:
+            return s.estimate()
+        key = (s.key(), d)
+        known = best_values.get(key)
+        if known is not None:
+            return known
+        result = None
+        for _, _, cost, child in successors(s):
+            if remaining[0] <= 0:
+                break
+            remaining[0] -= 1
+            child_value = cost + value(child, d - 1)
+            if result is None or child_value < result:
+                result = child_value
+        if result is None:
+            result = s.estimate()
+        best_values[key] = result
+        return result
+
+    result = {}
+    for _, command, cost, child in successors(state):
+        remaining[0] -= 1
+        result[command] = cost + value(child, depth - 1)
+    return result
+
+
+def best_command(values: Dict[str, int]) -> Optional[str]:
+    """
+    :return: The command with the fewest predicted steps, the first in alphabetical order on ties.
+    """
+    if len(values) == 0:
+        return None
+    return min(values, key=lambda command: (values[command], command))